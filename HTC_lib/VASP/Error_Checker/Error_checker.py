@@ -16,19 +16,20 @@ if HTC_package_path not in sys.path:
     sys.path.append(HTC_package_path)
 ##############################################################################################################
 
-from pymatgen.io.vasp.outputs import Oszicar, Vasprun
 from pymatgen.core import Structure
 
 import numpy as np
 
 from HTC_lib.VASP.Miscellaneous.Query_from_OUTCAR import find_incar_tag_from_OUTCAR
+from HTC_lib.VASP.Miscellaneous.Mapped_output_file import Mapped_output_file
+from HTC_lib.VASP.Miscellaneous.Query_from_OSZICAR import parse_oszicar_lines, find_ionic_steps_from_OSZICAR, find_last_ionic_step_from_OSZICAR
 from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str, search_file, decorated_os_rename, get_current_firework_from_cal_loc, are_2_files_the_same
 from HTC_lib.VASP.INCAR.Write_VASP_INCAR import get_bader_charge_tags
-from HTC_lib.VASP.INCAR.modify_vasp_incar import modify_vasp_incar
+from HTC_lib.VASP.INCAR.modify_vasp_incar import modify_vasp_incar, Vasp_incar
 from HTC_lib.VASP.POTCAR.potcar_toolkit import Potcar
 from HTC_lib.VASP.POSCAR.POSCAR_IO_functions import sort_poscar, write_poscar
 
-from HTC_lib.VASP.Error_Checker.Error_checker_auxiliary_function import get_trimed_oszicar
+from HTC_lib.VASP.Error_Checker.Error_checker_auxiliary_function import Tail_cursor
 
 
 # In[11]:
@@ -90,14 +91,11 @@ def Vasp_Error_checker(error_type, cal_loc, workflow):
             error_type_list = after_cal
         else:
             raise Exception("The argument error_type of func Vasp_Error_checker must be a str or a list consisting of a str")
-        if error_type[0] == "on_the_fly":
-            for error_checker in on_the_fly:
-                if not error_checker_dict[error_checker](cal_loc=cal_loc, workflow=workflow).check():
-                    return False
-            return True
-        
-        for error in error_type_list:
-            if not error_checker_dict[error](cal_loc=cal_loc, workflow=workflow).check():
+        #Register the target strings of all error checkers first so that each output file is scanned once for all of them.
+        error_checker_list = [error_checker_dict[error](cal_loc=cal_loc, workflow=workflow) for error in error_type_list]
+        Output_file_scanner.register_error_checkers(error_checker_list)
+        for error_checker in error_checker_list:
+            if not error_checker.check():
                 return False
         return True
 
@@ -186,15 +184,115 @@ def  find_target_str(cal_loc, target_file, target_str):
         - If target_str is found, return True.
         - If target_str is not found, return False
     Note that if the target_file is not existent, return False
+    Note that the result is looked up in the scan of target_file shared by all error checkers. See class Output_file_scanner below.
     """
-    found_target_str = False
-    if os.path.isfile(os.path.join(cal_loc, target_file)):
-        with open(os.path.join(cal_loc, target_file), "r") as f:
-            for line in f:
-                if target_str in line:
-                    found_target_str = True
-                    break
-    return found_target_str
+    return Output_file_scanner.is_found(cal_loc=cal_loc, target_file=target_file, target_str=target_str)
+
+
+class Output_file_scanner():
+    """
+    A single-pass multi-pattern scan of VASP output files (e.g. OUTCAR and vasp.out) shared by all error checkers.
+    The target strings of the error checkers are registered per target file. A target file is memory-mapped (see Mapped_output_file) and all
+        registered target strings are matched on bytes by one compiled alternation regex. The set of the found target strings is cached per file and reused
+        until the file identity (modification time in ns, size) changes or an unregistered target string is looked up.
+    Since the output files only grow while VASP is running, a per-job Tail_cursor records how far a file has been scanned, so that
+        a later scan (e.g. by the next on-the-fly check) only reads the newly appended lines.
+    Note that a target string never spans more than one line, so matching it against the whole file is equivalent to matching it line by line.
+    Methods:
+        - register(target_file, target_str_list): register target strings for the files named target_file.
+        - register_error_checkers(error_checker_list): register the target strings (attributes target_str and target_str_list) of error checkers.
+        - is_found(cal_loc, target_file, target_str): return True if target_str is found in target_file under cal_loc, False otherwise.
+    """
+    max_no_of_cached_files = 1000
+    _target_str_dict = {} #target_file --> a list of the registered target strings
+    _scan_result_dict = {} #file path --> [file identity, a frozenset of the scanned target strings, a set of the found target strings]
+
+    @classmethod
+    def register(cls, target_file, target_str_list):
+        registered_target_str_list = cls._target_str_dict.get(target_file, [])
+        new_target_str_list = [target_str for target_str in target_str_list if target_str not in registered_target_str_list]
+        if new_target_str_list:
+            cls._target_str_dict[target_file] = registered_target_str_list + new_target_str_list
+
+    @classmethod
+    def register_error_checkers(cls, error_checker_list):
+        for error_checker in error_checker_list:
+            target_file = getattr(error_checker, "target_file", None)
+            if not isinstance(target_file, str):
+                continue
+            target_str_list = list(getattr(error_checker, "target_str_list", []))
+            if isinstance(getattr(error_checker, "target_str", None), str):
+                target_str_list.append(error_checker.target_str)
+            cls.register(target_file=target_file, target_str_list=target_str_list)
+
+    @classmethod
+    def scan(cls, mapped_file, target_str_list, start=0):
+        """
+        Search the Mapped_output_file mapped_file from byte offset start and return [found_set, line_end_offset]
+            - found_set: the set of the target strings found.
+            - line_end_offset: the byte offset right after the last complete line (start if no line is complete after start).
+        Once a target string is found, the regex is recompiled for the rest, and the scan stops as soon as all target strings are found.
+        """
+        line_end_offset = start
+        if mapped_file.size > start:
+            line_end_offset = max(mapped_file.find_last(b"\n", start=start) + 1, start)
+        remaining_list = sorted(set(target_str_list), key=len, reverse=True)
+        found_set = set()
+        pos = start
+        while remaining_list:
+            pattern = re.compile(b"|".join([re.escape(target_str.encode()) for target_str in remaining_list]))
+            pos = mapped_file.find_first(pattern, start=pos)
+            if pos == -1:
+                break
+            matched_str = pattern.match(mapped_file.mm, pos).group().decode()
+            #A shorter target string contained in the matched one is found as well.
+            new_found_list = [target_str for target_str in remaining_list if target_str in matched_str]
+            found_set.update(new_found_list)
+            remaining_list = [target_str for target_str in remaining_list if target_str not in new_found_list]
+            pos += 1
+        return [found_set, line_end_offset]
+
+    @classmethod
+    def scan_incrementally(cls, cal_loc, target_file, target_str_list):
+        """
+        Return the set of the target strings found in target_file under cal_loc, only scanning the lines appended since the last scan.
+        The scanned target strings, the found ones and the offset of the last scanned complete line are persisted in a Tail_cursor.
+        The scan starts over from the beginning of the file if the file is overwritten or target_str_list has a target string never scanned before.
+        """
+        cursor = Tail_cursor(cal_loc=cal_loc, filename=target_file, consumer="Output_file_scanner")
+        scanned_target_str_list = cursor.state.get("scanned_target_str_list", [])
+        found_set = set(cursor.state.get("found_target_str_list", []))
+        if not set(target_str_list).issubset(scanned_target_str_list):
+            cursor.reset()
+            scanned_target_str_list = scanned_target_str_list + [target_str for target_str in target_str_list if target_str not in scanned_target_str_list]
+            found_set = set()
+        remaining_list = [target_str for target_str in scanned_target_str_list if target_str not in found_set]
+        with Mapped_output_file(cursor.file_path) as mapped_file:
+            new_found_set, line_end_offset = cls.scan(mapped_file=mapped_file, target_str_list=remaining_list, start=cursor.offset)
+        found_set.update(new_found_set)
+        cursor.advance(offset=line_end_offset, state={"scanned_target_str_list": scanned_target_str_list, 
+                                                      "found_target_str_list": sorted(found_set)})
+        return found_set
+
+    @classmethod
+    def is_found(cls, cal_loc, target_file, target_str):
+        file_path = os.path.join(cal_loc, target_file)
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return False
+        cls.register(target_file=target_file, target_str_list=[target_str])
+        file_identity = (file_stat.st_mtime_ns, file_stat.st_size)
+        scan_result = cls._scan_result_dict.get(file_path)
+        if scan_result != None and scan_result[0] == file_identity and target_str in scan_result[1]:
+            return target_str in scan_result[2]
+
+        target_str_list = list(cls._target_str_dict[target_file])
+        found_set = cls.scan_incrementally(cal_loc=cal_loc, target_file=target_file, target_str_list=target_str_list)
+        if len(cls._scan_result_dict) >= cls.max_no_of_cached_files and file_path not in cls._scan_result_dict:
+            cls._scan_result_dict.pop(next(iter(cls._scan_result_dict)), None)
+        cls._scan_result_dict[file_path] = [file_identity, frozenset(target_str_list), found_set]
+        return target_str in found_set
 
 
 # In[8]:
@@ -1723,39 +1821,42 @@ class Electronic_divergence(Vasp_Error_Checker_Logger, Vasp_Error_Saver):
         if not os.path.isfile(os.path.join(self.cal_loc, "OUTCAR")) or not os.path.isfile(os.path.join(self.cal_loc, "OSZICAR")):
             return True
         
-        incar_dict = modify_vasp_incar(cal_loc=self.cal_loc)
-        NELM = int(incar_dict.get("NELM", 60))
-        EDIFF = float(incar_dict.get("EDIFF", 1.0e-4))
+        incar = Vasp_incar(cal_loc=self.cal_loc)
+        NELM = incar.get_int("NELM", 60)
+        EDIFF = incar.get_float("EDIFF", 1.0e-4)
         
         #print(NELM, EDIFF)
+        #Only the ionic steps appended to OSZICAR since the last check are parsed. The ones before have passed the check.
+        cursor = Tail_cursor(cal_loc=self.cal_loc, filename="OSZICAR", consumer="Electronic_divergence")
         try:
-            if get_trimed_oszicar(cal_loc=self.cal_loc, original_oszicar="OSZICAR", output_oszicar="oszicar"):
-                oszicar = Oszicar(os.path.join(self.cal_loc, "oszicar"))
-            else: # The ongoing calculation may not have a complete OSZICAR
+            with cursor.open() as f:
+                new_line_list = f.readlines()
+            last_eff_line_ind = -1
+            for line_ind, line in enumerate(new_line_list):
+                if b"E0=" in line and b"F=" in line and line.endswith(b"\n"):
+                    last_eff_line_ind = line_ind
+            if last_eff_line_ind == -1: # No new complete ionic step.
                 return True
+            ionic_step_list = list(parse_oszicar_lines(new_line_list[:last_eff_line_ind+1]))
         except Exception as inst:
             decorated_os_rename(loc=self.cal_loc, old_filename="__running__", new_filename="__manual__")
             shutil.copyfile(src=os.path.join(self.cal_loc, "OSZICAR"), dst=os.path.join(self.cal_loc, "OSZICAR_for_debugging"))
             with open(self.log_txt, "a") as log_f:
                 log_f.write("{}: ".format(get_time_str()))
-                log_f.write(" An error occurs when parsing OSZICAR using pymatgen.io.vasp.outputs.Oszicar. See below:\n")
+                log_f.write(" An error occurs when parsing OSZICAR. See below:\n")
                 log_f.write("\t{}".format(inst))
                 log_f.write("\t__running__ --> __manual__\n")
                 log_f.write("\tcopy OSZICAR to OSZICAR_for_debugging.\n")
             return False
-        finally:
-            if os.path.isfile(os.path.join(self.cal_loc, "oszicar")):
-                os.remove(os.path.join(self.cal_loc, "oszicar"))
             
-        for electronic_steps in oszicar.electronic_steps:
-            #print(len(electronic_steps))
-            if len(electronic_steps) == NELM:
-                last_step = electronic_steps[-1]
-                #print(last_step["dE"], last_step["deps"])
-                if abs(last_step["dE"]) > EDIFF or abs(last_step["deps"]) > EDIFF:
+        for ionic_step in ionic_step_list:
+            if ionic_step["no_of_electronic_steps"] == NELM:
+                #print(ionic_step["dE"], ionic_step["deps"])
+                if abs(ionic_step["dE"]) > EDIFF or abs(ionic_step["deps"]) > EDIFF:
                     decorated_os_rename(loc=self.cal_loc, old_filename="__running__", new_filename="__error__")
                     self.write_error_log()
                     return False
+        cursor.advance(offset=cursor.offset + sum([len(line) for line in new_line_list[:last_eff_line_ind+1]]))
         return True
     
             
@@ -2049,12 +2150,13 @@ class Ionic_divergence(Vasp_Error_Checker_Logger, Vasp_Error_Saver):
             if self.firework["max_ionic_step"] == -1:
                 return True
             else:
-                with open(os.path.join(self.cal_loc, "OUTCAR"), "r") as f:
+                #The ionic iteration number only increases along OUTCAR, so the last "-- Iteration" line has the max one.
+                with Mapped_output_file(os.path.join(self.cal_loc, "OUTCAR")) as outcar:
                     max_ionic_iteration_no = 0
-                    for line in f:
-                        if "-- Iteration" in line:
-                            iteration_no = int(line.split("Iteration")[1].strip().split("(")[0])
-                            max_ionic_iteration_no = max([iteration_no, max_ionic_iteration_no])
+                    offset = outcar.find_last(b"-- Iteration")
+                    if offset != -1:
+                        line = outcar.get_line(offset).decode()
+                        max_ionic_iteration_no = int(line.split("Iteration")[1].strip().split("(")[0])
                 if max_ionic_iteration_no == 0:
                     with open(self.log_txt, "a") as log_f:
                         log_f.write("{}: Oops! You are doing a structural optimization, but the number of ionic iterations is found to be ZERO from OUTCAR.\n".format(get_time_str()))
@@ -2118,25 +2220,21 @@ class Ionic_divergence(Vasp_Error_Checker_Logger, Vasp_Error_Saver):
         #IBRION = find_incar_tag_from_OUTCAR(cal_loc=self.cal_loc, tag="IBRION")
         
         try:
-            if get_trimed_oszicar(cal_loc=self.cal_loc, original_oszicar="OSZICAR", output_oszicar="oszicar"):
-                oszicar = Oszicar(os.path.join(self.cal_loc, "oszicar"))
-            else: # The ongoing calculation may not have a complete OSZICAR
+            ionic_step_list = find_ionic_steps_from_OSZICAR(cal_loc=self.cal_loc)
+            if ionic_step_list == []: # The ongoing calculation may not have a complete OSZICAR
                 return True
         except Exception as inst:
             decorated_os_rename(loc=self.cal_loc, old_filename="__running__", new_filename="__manual__")
             shutil.copyfile(src=os.path.join(self.cal_loc, "OSZICAR"), dst=os.path.join(self.cal_loc, "OSZICAR_for_debugging"))
             with open(self.log_txt, "a") as log_f:
                 log_f.write("{}: ".format(get_time_str()))
-                log_f.write(" An error occurs when parsing OSZICAR using pymatgen.io.vasp.outputs.Oszicar. See below:\n")
+                log_f.write(" An error occurs when parsing OSZICAR. See below:\n")
                 log_f.write("\t{}".format(inst))
                 log_f.write("\t__running__ --> __manual__\n")
                 log_f.write("\tcopy OSZICAR to OSZICAR_for_debugging.\n")
             return False
-        finally:
-            if os.path.isfile(os.path.join(self.cal_loc, "oszicar")):
-                os.remove(os.path.join(self.cal_loc, "oszicar"))
         
-        if len(oszicar.electronic_steps) < NSW:
+        if len(ionic_step_list) < NSW:
             #check if CONTCAR is empty.
             with open(os.path.join(self.cal_loc, "CONTCAR"), "r") as f:
                 lines = [line for line in f if line.strip()]
@@ -2215,12 +2313,10 @@ class Positive_energy(Vasp_Error_Checker_Logger, Vasp_Error_Saver):
             return False
         
         try:
-            if get_trimed_oszicar(cal_loc=self.cal_loc, original_oszicar="OSZICAR", output_oszicar="oszicar"):
-                oszicar = Oszicar(os.path.join(self.cal_loc, "oszicar"))
-            else: # The ongoing calculation may not have a complete OSZICAR
+            last_ionic_step = find_last_ionic_step_from_OSZICAR(cal_loc=self.cal_loc)
+            if last_ionic_step == None: # The ongoing calculation may not have a complete OSZICAR
                 return True
-            #oszicar = Oszicar(os.path.join(self.cal_loc, "OSZICAR"))
-            if oszicar.final_energy > 0:
+            if last_ionic_step["E0"] > 0:
                 decorated_os_rename(loc=self.cal_loc, old_filename="__running__", new_filename="__error__")
                 self.write_error_log()
                 return False
@@ -2229,14 +2325,11 @@ class Positive_energy(Vasp_Error_Checker_Logger, Vasp_Error_Saver):
             shutil.copyfile(src=os.path.join(self.cal_loc, "OSZICAR"), dst=os.path.join(self.cal_loc, "OSZICAR_for_debugging"))
             with open(self.log_txt, "a") as log_f:
                 log_f.write("{}: ".format(get_time_str()))
-                log_f.write(" An error occurs when parsing OSZICAR using pymatgen.io.vasp.outputs.Oszicar. See below:\n")
+                log_f.write(" An error occurs when parsing OSZICAR. See below:\n")
                 log_f.write("\t{}".format(inst))
                 log_f.write("\t__running__ --> __manual__\n")
                 log_f.write("\tcopy OSZICAR to OSZICAR_for_debugging.\n")
             return False
-        finally:
-            if os.path.isfile(os.path.join(self.cal_loc, "oszicar")):
-                os.remove(os.path.join(self.cal_loc, "oszicar"))
         
         return True
     
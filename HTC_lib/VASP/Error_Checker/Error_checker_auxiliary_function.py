@@ -4,7 +4,7 @@
 # In[1]:
 
 
-import os
+import os, json
 
 
 # In[2]:
@@ -28,6 +28,112 @@ def get_trimed_oszicar(cal_loc, original_oszicar, output_oszicar):
         return True
 
 
+# In[3]:
+
+
+class Tail_cursor():
+    """
+    A per-job cursor into an output file that only grows while VASP is running (e.g. OSZICAR and vasp.out), so that the on-the-fly error checkers
+        only parse the bytes appended since the last check instead of the whole file.
+    The cursor of every consumer (e.g. an error checker) is persisted in the sidecar file Tail_cursor.sidecar_filename under the hidden folder
+        Tail_cursor.sidecar_folder_name under cal_loc as
+        consumer --> {"file": filename, "offset": byte offset, "head": hex fingerprint, "tail": hex fingerprint, "ino": st_ino, "ctime": st_ctime_ns,
+                      "state": consumer-defined parser state}
+    The cursor is reset to the beginning of the file if the file is shorter than offset, if the first/last fingerprint_size bytes before offset
+        changed, if the inode number of the file changed or if st_ctime_ns of the file is earlier than the recorded one,
+        e.g. the file is deleted and written again by a new VASP run after an error correction.
+    Since a new run of the same job starts with the same header and may reach the same offset, the sidecar is also removed via 
+        Tail_cursor.remove_sidecar wherever the output files are removed for a resubmission (see Job_management.submit).
+    The sidecar is rewritten whenever a cursor advances. It is kept in a hidden sub-folder rather than directly under cal_loc so that the mtime of cal_loc
+        does not change in every check; otherwise Incremental_cal_status_scanner would list cal_loc again in every scan. The scanner does not visit hidden folders.
+    input arguments:
+        - cal_loc (str): the location of the calculation.
+        - filename (str): the name of the tailed file under cal_loc.
+        - consumer (str): the name of the consumer which owns the cursor.
+    Methods:
+        - open: return the file opened in binary mode and positioned at offset.
+        - advance(offset, state): move the cursor to the absolute byte offset and save the parser state.
+        - reset: move the cursor back to the beginning of the file and clear the parser state.
+        - remove_sidecar(cal_loc) (classmethod): remove the cursors of all consumers under cal_loc.
+    """
+    sidecar_folder_name = ".htc_cache"
+    sidecar_filename = "tail_cursor.json"
+    fingerprint_size = 64
+
+    def __init__(self, cal_loc, filename, consumer):
+        self.cal_loc = cal_loc
+        self.filename = filename
+        self.file_path = os.path.join(cal_loc, filename)
+        self.consumer = consumer
+        self.sidecar = os.path.join(cal_loc, self.sidecar_folder_name, self.sidecar_filename)
+        self.offset, self.state = 0, {}
+        cursor = self.read_sidecar().get(consumer, {})
+        if cursor.get("file") == filename and cursor.get("offset", 0) > 0:
+            file_stat = self.get_file_stat()
+            if file_stat != None and file_stat.st_ino == cursor.get("ino") and file_stat.st_ctime_ns >= cursor.get("ctime", 0) and \
+               self.get_fingerprint(cursor["offset"]) == [cursor.get("head"), cursor.get("tail")]:
+                self.offset, self.state = cursor["offset"], cursor.get("state", {})
+
+    @classmethod
+    def remove_sidecar(cls, cal_loc):
+        try:
+            os.remove(os.path.join(cal_loc, cls.sidecar_folder_name, cls.sidecar_filename))
+        except (IOError, OSError):
+            pass
+
+    def get_file_stat(self):
+        try:
+            return os.stat(self.file_path)
+        except (IOError, OSError):
+            return None
+
+    def read_sidecar(self):
+        try:
+            with open(self.sidecar, "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get_fingerprint(self, offset):
+        """Return the hex strings of the first and the last fingerprint_size bytes before offset, or [None, None] if the file is shorter than offset."""
+        try:
+            with open(self.file_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < offset:
+                    return [None, None]
+                f.seek(0)
+                head = f.read(min(self.fingerprint_size, offset))
+                f.seek(max(offset - self.fingerprint_size, 0))
+                tail = f.read(min(self.fingerprint_size, offset))
+        except (IOError, OSError):
+            return [None, None]
+        return [head.hex(), tail.hex()]
+
+    def open(self):
+        f = open(self.file_path, "rb")
+        f.seek(self.offset)
+        return f
+
+    def advance(self, offset, state=None):
+        state = self.state if state == None else state
+        if offset == self.offset and state == self.state:
+            return
+        self.offset, self.state = offset, state
+        head, tail = self.get_fingerprint(offset)
+        file_stat = self.get_file_stat()
+        ino, ctime = (None, None) if file_stat == None else (file_stat.st_ino, file_stat.st_ctime_ns)
+        cursor_dict = self.read_sidecar()
+        cursor_dict[self.consumer] = {"file": self.filename, "offset": offset, "head": head, "tail": tail, "ino": ino, "ctime": ctime, "state": state}
+        #write and then rename so that an interrupted write never leaves a truncated sidecar behind.
+        os.makedirs(os.path.dirname(self.sidecar), exist_ok=True)
+        with open(self.sidecar + ".tmp", "w") as f:
+            json.dump(cursor_dict, f)
+        os.replace(self.sidecar + ".tmp", self.sidecar)
+
+    def reset(self):
+        self.offset, self.state = 0, {}
+
+
 # In[5]:
 
 
@@ -16,7 +16,9 @@ from pymatgen.core import Structure
 
 from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str, find_next_name, decorated_os_rename, get_current_firework_from_cal_loc
 from HTC_lib.VASP.Miscellaneous.Query_from_OUTCAR import find_incar_tag_from_OUTCAR
-from HTC_lib.VASP.INCAR.modify_vasp_incar import modify_vasp_incar
+from HTC_lib.VASP.Miscellaneous.Mapped_output_file import Mapped_output_file
+from HTC_lib.VASP.Miscellaneous.Query_from_vasprun import read_vasprun, find_CBM_VBM
+from HTC_lib.VASP.INCAR.modify_vasp_incar import Incar_transaction
 from HTC_lib.VASP.INCAR.choose_ispin_based_on_prev_cal import choose_ispin_based_on_prev_cal
 from HTC_lib.VASP.Miscellaneous.Execute_bash_shell_cmd import Execute_shell_cmd
 
@@ -30,6 +32,9 @@ def Write_Vasp_INCAR(cal_loc, structure_filename, workflow):
         step I: run commands defined by incar_cmd. Of course, there might be no commands to run if incar_cmd is not set
         step II: If no INCAR in cal_loc, write INCAR using pymatgen.io.vasp.sets.MPRelaxSet
         step III: Modify INCAR according to new_incar_tags and remove_incar_tags.
+    All modifications of step III (new_incar_tags, remove_incar_tags, LMAXMIX, LDAU, NBANDS, EMAX/EMIN, ISPIN and Bader charge tags) are
+        accumulated in an Incar_transaction, validated once against valid_incar_tags_list and written once in the sequence of incar_template_list.
+        The old INCAR is renamed once: INCAR.pymatgen if it was written by pymatgen; INCAR_N (see function find_next_name) otherwise.
     Input arguments:
         cal_loc (str): the absolute path
         structure_filename (str): the file from which the structure is read using pymatgen.Structure.from_file
@@ -78,11 +83,12 @@ def Write_Vasp_INCAR(cal_loc, structure_filename, workflow):
         new_incar_tags["EMAX"] = cal_emax_or_emin(cal_loc=cal_loc, emax_or_emin_setup=new_incar_tags["EMAX"], incar_tag="EMAX")
     if "EMIN" in new_incar_tags:
         new_incar_tags["EMIN"] = cal_emax_or_emin(cal_loc=cal_loc, emax_or_emin_setup=new_incar_tags["EMIN"], incar_tag="EMIN")
+    incar_transaction = Incar_transaction(cal_loc)
+    commit_kwargs = {"rename_old_incar": "INCAR.pymatgen" if write_INCAR else True, "incar_template": incar_template_list, 
+                     "valid_incar_tags": valid_incar_tags_list}
     if new_incar_tags or remove_incar_tags:
-        if write_INCAR:
-            modify_vasp_incar(cal_loc=cal_loc, new_tags=new_incar_tags, rename_old_incar="INCAR.pymatgen", remove_tags=remove_incar_tags, incar_template=incar_template_list, valid_incar_tags=valid_incar_tags_list)
-        else:
-            modify_vasp_incar(cal_loc=cal_loc, new_tags=new_incar_tags, remove_tags=remove_incar_tags, incar_template=incar_template_list, valid_incar_tags=valid_incar_tags_list)
+        incar_transaction.set_tags(new_incar_tags)
+        incar_transaction.remove_tags(remove_incar_tags)
         with open(log_txt, "a") as f:
             f.write("{} INFO: modify INCAR in {}\n".format(get_time_str(), firework_name))
             if new_incar_tags:
@@ -99,12 +105,15 @@ def Write_Vasp_INCAR(cal_loc, structure_filename, workflow):
     set_ispin_based_on_prev_cal = firework["set_ispin_based_on_prev_cal"]
     if set_ispin_based_on_prev_cal:
         result = choose_ispin_based_on_prev_cal(current_cal_loc=cal_loc, prev_cal_step=set_ispin_based_on_prev_cal["prev_cal_step"],
-                                                mag_threshold=set_ispin_based_on_prev_cal, workflow=workflow)
+                                                mag_threshold=set_ispin_based_on_prev_cal, workflow=workflow, 
+                                                current_incar_dict=incar_transaction.incar_dict)
         if result == False:
+            #Write the modifications made so far, as if INCAR had been modified step by step.
+            incar_transaction.commit(**commit_kwargs)
             return False #The relevant information has been written into log.txt by the above function.
         else:
             ispin, tot_mag = result
-        modify_vasp_incar(cal_loc=cal_loc, new_tags={"ISPIN": str(ispin)}, incar_template=incar_template_list, valid_incar_tags=valid_incar_tags_list)
+        incar_transaction.set_tags({"ISPIN": str(ispin)})
         with open(log_txt, "a") as f:
             f.write("{} INFO: set_ispin_based_on_prev_cal is set to {} in {}\n".format(get_time_str(), set_ispin_based_on_prev_cal["set_ispin_based_on_prev_cal_str"], firework_name))
             f.write("\t\t\t The calculated total magnetic moment from {} is {}, ".format(set_ispin_based_on_prev_cal["prev_cal_step"], tot_mag))
@@ -124,13 +133,16 @@ def Write_Vasp_INCAR(cal_loc, structure_filename, workflow):
         else:
             prev_cal = os.path.join(os.path.split(cal_loc)[0], workflow[firework["copy_which_step"]-1]["firework_folder_name"])
             new_incar_tags = get_bader_charge_tags(cal_loc=prev_cal)
-            modify_vasp_incar(cal_loc=cal_loc, new_tags=new_incar_tags, rename_old_incar="INCAR.no_bader_charge", incar_template=incar_template_list, valid_incar_tags=valid_incar_tags_list)
+            incar_transaction.set_tags(new_incar_tags)
             with open(log_txt, "a") as f:
                 f.write("{} INFO: in {}\n".format(get_time_str(), firework_name))
                 f.write("\t\t\t'bader_charge' is on\n")
                 f.write("\t\t\tretrieve NGXF, NGYF, NGZF from {} and double them\n".format(os.path.split(prev_cal)[1]))
                 f.write("\t\tnew incar tags:\n")    
                 [f.write("\t\t\t{}={}\n".format(key_, value_)) for key_, value_ in new_incar_tags.items()]
+    
+    #All modifications above are written into INCAR at once.
+    incar_transaction.commit(**commit_kwargs)
                     
 
 
@@ -242,36 +254,9 @@ def get_partial_charge_tags(cal_loc, firework, workflow):
 
 
 def read_CBM_VBM_Efermi_from_vasprun(cal_loc):
-    energy_list, occ_list = [], []
-    with open(os.path.join(cal_loc, "vasprun.xml"), "r") as f:
-        read_energy_occ = False
-        for line in f:
-            if "efermi" in line and "name" in line:
-                efermi = line.split(">")[1].split("<")[0].strip()
-                efermi = float(efermi)
-            if '<set comment="kpoint' in line:
-                energy_list.append([])
-                occ_list.append([])
-                read_energy_occ = True
-                continue
-            if read_energy_occ:
-                if "<r>" in line:
-                    energy, occ = line.split(">")[1].split("<")[0].strip().split()
-                    #print(line, energy, occ)
-                    energy_list[-1].append(float(energy))
-                    occ_list[-1].append(float(occ))
-                else:
-                    read_energy_occ = False
-                    
-    VBM, CBM = -1e10, 1e10
-    for energy_list_a_kpoint, occ_list_a_kpoint in zip(energy_list, occ_list):
-        for energy, occ in zip(energy_list_a_kpoint, occ_list_a_kpoint):
-            if CBM > energy > efermi:
-                CBM = energy
-                CBM_occ = occ
-            elif efermi > energy > VBM:
-                VBM = energy
-                VBM_occ = occ
+    vasprun_dict = read_vasprun(cal_loc=cal_loc, section_list=["efermi", "eigenvalues"])
+    efermi = vasprun_dict["efermi"]
+    VBM, CBM, VBM_occ, CBM_occ = find_CBM_VBM(eigenvalues=vasprun_dict["eigenvalues"], occupations=vasprun_dict["occupations"], efermi=efermi)
     return VBM, CBM, VBM_occ, CBM_occ, efermi
 
 
@@ -448,11 +433,16 @@ def cal_emax_or_emin(cal_loc, emax_or_emin_setup, incar_tag):
         log_f.write("\t\t\tTrying to parse Efermi from {}.\n".format(os.path.join(mater_folder, prev_step_name, "OUTCAR")))
     
     target_line = ""
-    with open(os.path.join(mater_folder, prev_step_name, "OUTCAR"), "r") as f:
-        for line in f:
-            if "E-fermi" in line and "XC(G=0)" in line and "alpha+bet" in line:
+    #Search OUTCAR backwards for the last E-fermi line.
+    with Mapped_output_file(os.path.join(mater_folder, prev_step_name, "OUTCAR")) as outcar:
+        offset = outcar.find_last(b"E-fermi")
+        while offset != -1:
+            line = outcar.get_line(offset).decode()
+            if "XC(G=0)" in line and "alpha+bet" in line:
                 Efermi = line.split("XC")[0].split(":")[1]
                 target_line = line
+                break
+            offset = outcar.find_last(b"E-fermi", end=offset)
     
     updated_emax_or_emin_setup = emax_or_emin_setup.replace("Efermi@{}".format(prev_step_name), Efermi)
     EMAX_or_EMIN = eval(updated_emax_or_emin_setup)
@@ -12,6 +12,7 @@ if  os.path.isdir(HTC_package_path) and HTC_package_path not in sys.path:
 from HTC_lib.VASP.INCAR.modify_vasp_incar import modify_vasp_incar
 from HTC_lib.VASP.POSCAR.POSCAR_IO_functions import read_poscar
 from HTC_lib.VASP.Miscellaneous.Utilities import get_current_firework_from_cal_loc, get_time_str
+from HTC_lib.VASP.Miscellaneous.Query_from_OSZICAR import find_last_ionic_step_from_OSZICAR
 
 from pymatgen.core import Structure
 
@@ -19,7 +20,7 @@ from pymatgen.core import Structure
 # In[2]:
 
 
-def choose_ispin_based_on_prev_cal(current_cal_loc, prev_cal_step, mag_threshold, workflow):
+def choose_ispin_based_on_prev_cal(current_cal_loc, prev_cal_step, mag_threshold, workflow, current_incar_dict=None):
     """
     Read the total magnetic moment (tot_mag) from OSZICAR of the previous calculation step specified by prev_cal_step, and 
     compare it with mag_threshold.
@@ -35,6 +36,8 @@ def choose_ispin_based_on_prev_cal(current_cal_loc, prev_cal_step, mag_threshold
         b) ispin is only meaningful if the current calculation is collinear;--> raise an error
         c) the previous calculation should be spin-polarized --> create __manual__ and __non_spin_polarized_prev_cal__, and return False
         d) OSZICAR of prev_cal_step does not exist --> create __manual__ and __no_prev_cal_OSZICAR__, and return False
+    current_incar_dict: the INCAR of the current calculation step as a dict, e.g. Incar_transaction.incar_dict of a pending modification.
+            If None, it is read from current_cal_loc. Default: None
     """    
     
     current_cal_step = get_current_firework_from_cal_loc(current_cal_loc, workflow)["firework_folder_name"]
@@ -49,7 +52,8 @@ def choose_ispin_based_on_prev_cal(current_cal_loc, prev_cal_step, mag_threshold
         raise Exception(output_str)
     
     #special case 2
-    current_incar_dict = modify_vasp_incar(current_cal_loc)
+    if current_incar_dict == None:
+        current_incar_dict = modify_vasp_incar(current_cal_loc)
     LSORBIT = current_incar_dict.get("LSORBIT", ".FALSE.").strip().lower()
     if LSORBIT in [".true.", "t"]:
         output_str = "You are looking at OSZICAR of %s to decide ispin of %s. " % (prev_cal_loc, current_cal_loc)
@@ -80,16 +84,14 @@ def choose_ispin_based_on_prev_cal(current_cal_loc, prev_cal_step, mag_threshold
         open(os.path.join(current_cal_loc, "__no_prev_cal_OSZICAR__"), "w").close()
         return False
     else: 
-        with open(prev_OSZICAR_path, "r") as oszicar_f:
-            for last_line in oszicar_f:
-                continue
         try:
             output_str = ""
-            if "mag=" not in last_line:
-                output_str = "No keyword 'mag=' in the last line of OSZICAR of the previous calculation step {}\n".format(prev_cal_step)
+            last_ionic_step = find_last_ionic_step_from_OSZICAR(cal_loc=os.path.split(prev_OSZICAR_path)[0])
+            if last_ionic_step == None or last_ionic_step["mag"] == None:
+                output_str = "No keyword 'mag=' in the last ionic step of OSZICAR of the previous calculation step {}\n".format(prev_cal_step)
                 raise Exception
             else:
-                tot_mag = float(last_line.split("mag=")[1].strip())
+                tot_mag = float(last_ionic_step["mag"])
         except:
             with open(os.path.join(current_cal_loc, "log.txt"), "a") as log_f:
                 log_f.write("{}: You are trying to set ispin of the current step based on the previous calculation of {}\n".format(get_time_str(), prev_cal_step))
@@ -15,7 +15,7 @@ if HTC_package_path not in sys.path:
     sys.path.append(HTC_package_path)
 ##############################################################################################################
 
-import pprint
+import pprint, threading, collections
 
 from HTC_lib.VASP.Miscellaneous.Utilities import find_next_name, decorated_os_rename
 
@@ -33,6 +33,213 @@ def return_duplicate(list_of_strs, excluded_strs = []):
             
 
 
+# In[13]:
+
+
+class Vasp_incar():
+    """
+    The parsed INCAR under cal_loc, shared by the error checkers and the INCAR writers of a process.
+    The parsed INCARs are kept in a process-local LRU cache keyed by (the absolute path, st_mtime_ns, st_size, st_ino, st_ctime_ns) of INCAR, 
+        so an INCAR is only re-read and re-tokenised after it changes. modify_vasp_incar parses INCAR through the cache and invalidates it after writing INCAR.
+    The inode number catches an INCAR rewritten within one modification time tick with the same size by a rename-based rewrite (e.g. sed -i in incar_cmd),
+        which cannot call Vasp_incar.invalidate. st_ctime_ns additionally catches an in-place rewrite as soon as the change time moves on.
+    input arguments:
+        - cal_loc (str): the location of INCAR.
+    Methods:
+        - get(tag, default=None): the value string of tag (case-insensitive), or default if tag is absent.
+        - get_int, get_float, get_bool(tag, default=None): the value converted to int, float or bool, or default if tag is absent.
+                get_bool regards .TRUE., TRUE and T (case-insensitive, with or without the dots) as True and the rest as False.
+        - modify(new_tags={}, remove_tags=[], rename_old_incar=True, incar_template=[], valid_incar_tags=[]): see function modify_vasp_incar.
+    Attribute incar_dict is a copy of the parsed INCAR, i.e. incar tag (upper case) --> value string.
+    """
+    max_no_of_cached_incars = 256
+    _cache = collections.OrderedDict() #(absolute path, mtime_ns, size, inode number, ctime_ns) --> the parsed INCAR dict
+    _cache_lock = threading.Lock()
+
+    def __init__(self, cal_loc):
+        self.cal_loc = cal_loc
+        self.incar_dict = self.read_incar_dict(cal_loc)
+
+    @classmethod
+    def parse_incar(cls, cal_loc):
+        incar_dict = {}
+        with open(os.path.join(cal_loc, "INCAR"), "r") as incar_f:
+            for line in incar_f:
+                pairs = line.strip().split("#")[0].split("!")[0].strip().strip(";")
+                if pairs == "":
+                    continue
+                
+                tag_value_pair_list = []
+                
+                no_of_equal_signs = pairs.count("=")
+                no_of_semicolons = pairs.count(";")
+                if no_of_equal_signs > 1:
+                    assert no_of_equal_signs == no_of_semicolons+1,                 "Fail to parse multiple tags in the following line in INCAR: \n{}\nline: {}\n".format(cal_loc, line) +                 "{} semicolons should be used to separate {} tag=value pairs.".format(no_of_equal_signs-1, no_of_equal_signs) +                 " But there are/is {} semicolons".format(no_of_semicolons)
+                
+                for tag_value_pair in pairs.split(";"):
+                    tag, value = tag_value_pair.strip().split("=")
+                    incar_dict[tag.upper().strip()] = value.strip()
+        return incar_dict
+
+    @classmethod
+    def read_incar_dict(cls, cal_loc):
+        """Return a copy of the parsed INCAR under cal_loc, which is looked up in or added to the LRU cache."""
+        incar_path = os.path.abspath(os.path.join(cal_loc, "INCAR"))
+        incar_stat = os.stat(incar_path)
+        key = (incar_path, incar_stat.st_mtime_ns, incar_stat.st_size, incar_stat.st_ino, incar_stat.st_ctime_ns)
+        with cls._cache_lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return dict(cls._cache[key])
+        
+        incar_dict = cls.parse_incar(cal_loc)
+        with cls._cache_lock:
+            cls._cache[key] = incar_dict
+            while len(cls._cache) > cls.max_no_of_cached_incars:
+                cls._cache.popitem(last=False)
+        return dict(incar_dict)
+
+    @classmethod
+    def invalidate(cls, cal_loc):
+        incar_path = os.path.abspath(os.path.join(cal_loc, "INCAR"))
+        with cls._cache_lock:
+            for key in [key for key in cls._cache.keys() if key[0] == incar_path]:
+                del cls._cache[key]
+
+    def get(self, tag, default=None):
+        return self.incar_dict.get(tag.upper(), default)
+
+    def get_int(self, tag, default=None):
+        value = self.get(tag)
+        return default if value == None else int(value)
+
+    def get_float(self, tag, default=None):
+        value = self.get(tag)
+        return default if value == None else float(value)
+
+    def get_bool(self, tag, default=None):
+        value = self.get(tag)
+        return default if value == None else value.strip(".").upper() in ["TRUE", "T"]
+
+    def modify(self, new_tags={}, remove_tags=[], rename_old_incar=True, incar_template=[], valid_incar_tags=[]):
+        output = modify_vasp_incar(cal_loc=self.cal_loc, new_tags=new_tags, remove_tags=remove_tags, rename_old_incar=rename_old_incar, 
+                                   incar_template=incar_template, valid_incar_tags=valid_incar_tags)
+        self.incar_dict = self.read_incar_dict(self.cal_loc)
+        return output
+
+
+# In[14]:
+
+
+class Incar_transaction():
+    """
+    Accumulate the modifications of INCAR under cal_loc in memory and write INCAR once.
+    INCAR is read once through the cache of class Vasp_incar when the transaction is created. 
+    Nothing is written until method commit is called, and nothing at all if no modification has been made.
+    input arguments:
+        - cal_loc (str): the location of INCAR.
+    Methods:
+        - set_tags(new_tags): add or overwrite incar tags. new_tags is a dict.
+        - remove_tags(remove_tags): remove incar tags if present. remove_tags is a list.
+                The modifications are applied in the order of the calls, so a tag removed after being set is removed, and vice versa.
+        - commit(rename_old_incar=True, incar_template=[], valid_incar_tags=[]): validate the accumulated INCAR against valid_incar_tags,
+                rename the old INCAR once and write INCAR once in the sequence of incar_template. 
+                See function modify_vasp_incar for the three input arguments. Return True if INCAR is written; False otherwise.
+    Attribute incar_dict is the accumulated INCAR, i.e. incar tag (upper case) --> value string. 
+        It can be looked up before commit, e.g. to decide a tag based on the tags set earlier in the same transaction.
+    """
+    def __init__(self, cal_loc):
+        self.cal_loc = cal_loc
+        self.incar_dict = Vasp_incar.read_incar_dict(cal_loc)
+        self.is_modified = False
+
+    def set_tags(self, new_tags):
+        if new_tags:
+            self.incar_dict.update({key.upper(): value for key, value in new_tags.items()})
+            self.is_modified = True
+
+    def remove_tags(self, remove_tags):
+        for remove_tag in remove_tags:
+            if remove_tag.upper() in self.incar_dict.keys():
+                del self.incar_dict[remove_tag.upper()]
+            self.is_modified = True
+
+    def commit(self, rename_old_incar=True, incar_template=[], valid_incar_tags=[]):
+        if not self.is_modified:
+            return False
+        
+        cal_loc, incar_dict = self.cal_loc, self.incar_dict
+
+        if isinstance(valid_incar_tags, str):
+            valid_incar_tags_str = valid_incar_tags
+            with open(valid_incar_tags_str, "r") as valid_incar_tags_f:
+                valid_incar_tags = [incar_tag.split("#")[0].split("=")[0].strip().upper() for incar_tag in valid_incar_tags_f if incar_tag.strip()]
+            duplicate = return_duplicate(valid_incar_tags)
+            assert duplicate == "", "{} appears more than once in {}. Pls remove the duplicate".format(duplicate, valid_incar_tags_str)
+        valid_incar_tags = [incar_tag.upper() for incar_tag in valid_incar_tags]
+        duplicate = return_duplicate(valid_incar_tags)
+        assert duplicate == "", "{} appears more than once in valid_incar_tags. Pls remove the duplicate".format(duplicate)
+    
+    
+    
+        if valid_incar_tags:
+            for incar_tag in incar_dict.keys():
+                assert incar_tag in valid_incar_tags, "under {}\n ".format(cal_loc) +             "When we are modifying INCAR as pre-defined, {} is not found in ".format(incar_tag) +             "the valid incar tags defined by valid_incar_tags in HTC_calculation_setup_file.\n" +             "If this is not a spelling error and you want to validize this incar tag, add it in the file specified by valid_incar_tags in HTC_calculation_setup_file."
+    
+        
+
+        if isinstance(incar_template, str):
+            incar_template_str = incar_template
+            with open(incar_template_str, "r") as incar_template_f:
+                incar_template = [incar_tag.split("#")[0].split("=")[0].strip().upper() for incar_tag in incar_template_f]
+            duplicate = return_duplicate(incar_template, excluded_strs=[""])
+            assert duplicate == "", "You set {} more than once in {}. Pls remove the duplicate".format(duplicate, incar_template_str)
+        incar_template = [incar_tag.upper() for incar_tag in incar_template]
+        duplicate = return_duplicate(incar_template, excluded_strs=[""])
+        assert duplicate == "", "You set {} more than once in incar_template. Pls remove the duplicate".format(duplicate)
+        #if len(incar_template) > 2:
+        #    incar_template = [tag_1 for tag_1, tag_2 in zip(incar_template[:-1], incar_template[1:]) if tag_1 != "" or tag_2 != ""]
+    
+    
+    
+        to_be_written_incar_tags = incar_dict.keys()
+        consumed_incar_tags = []
+        output_incar_str = ""
+        is_an_empty_line_allowed = True #ensure there is only one empty line between incar tag blocks
+        for incar_tag in incar_template:
+            if incar_tag in to_be_written_incar_tags:
+                output_incar_str += "{} = {}\n".format(incar_tag, incar_dict[incar_tag])
+                consumed_incar_tags.append(incar_tag)
+                is_an_empty_line_allowed = True
+            elif incar_tag == "" and is_an_empty_line_allowed:
+                output_incar_str += "\n"
+                is_an_empty_line_allowed = False
+
+        left_incar_tags = set(to_be_written_incar_tags).difference(set(incar_template))
+        if left_incar_tags: output_incar_str += "\n"
+        for incar_tag in sorted(left_incar_tags):
+            output_incar_str += "{} = {}\n".format(incar_tag, incar_dict[incar_tag])
+            consumed_incar_tags.append(incar_tag)
+        assert sorted(to_be_written_incar_tags) == sorted(consumed_incar_tags), "Something wrong with writing INCAR"    
+    
+    
+        if isinstance(rename_old_incar, bool):
+            if rename_old_incar:
+                rename_old_incar = find_next_name(cal_loc=cal_loc, orig_name="INCAR")["next_name"]
+                decorated_os_rename(loc=cal_loc, old_filename="INCAR", new_filename=rename_old_incar)
+        elif isinstance(rename_old_incar, str):
+            decorated_os_rename(loc=cal_loc, old_filename="INCAR", new_filename=rename_old_incar)
+        else:
+            raise Exception("input argument rename_old_incar of modify_vasp_incar must be either bool or str.")
+
+            
+        with open(os.path.join(cal_loc, "INCAR"), "w") as incar_f:
+            incar_f.write(output_incar_str)
+        Vasp_incar.invalidate(cal_loc)
+        self.is_modified = False
+        return True
+
+
 # In[17]:
 
 
@@ -79,6 +286,8 @@ def modify_vasp_incar(cal_loc, new_tags={}, remove_tags=[], rename_old_incar=Tru
     return:
         * the valid INCAR dictionary if no modification (new_tags and remove_tags are not set) is made.
         * write INCAR under the folder specified by cal_loc otherwise.
+    Note that INCAR is parsed through the cache of class Vasp_incar, which is invalidated after INCAR is written.
+    Note that this function is a one-shot class Incar_transaction. Use the latter directly to write INCAR once for several modifications.
     """
     
 
@@ -100,100 +309,13 @@ def modify_vasp_incar(cal_loc, new_tags={}, remove_tags=[], rename_old_incar=Tru
             raise Exception("See the error information above.")
             
 
-    incar_dict = {}
-    with open(os.path.join(cal_loc, "INCAR"), "r") as incar_f:
-        for line in incar_f:
-            pairs = line.strip().split("#")[0].split("!")[0].strip().strip(";")
-            if pairs == "":
-                continue
-            
-            tag_value_pair_list = []
-            
-            no_of_equal_signs = pairs.count("=")
-            no_of_semicolons = pairs.count(";")
-            if no_of_equal_signs > 1:
-                assert no_of_equal_signs == no_of_semicolons+1,                 "Fail to parse multiple tags in the following line in INCAR: \n{}\nline: {}\n".format(cal_loc, line) +                 "{} semicolons should be used to separate {} tag=value pairs.".format(no_of_equal_signs-1, no_of_equal_signs) +                 " But there are/is {} semicolons".format(no_of_semicolons)
-            
-            for tag_value_pair in pairs.split(";"):
-                tag, value = tag_value_pair.strip().split("=")
-                incar_dict[tag.upper().strip()] = value.strip()
-                
+    incar_transaction = Incar_transaction(cal_loc)
     if new_tags == {} and remove_tags == []:
-        return incar_dict
+        return incar_transaction.incar_dict
     
-    
-    incar_dict.update(new_tags)
-    for remove_tag in remove_tags:
-        if remove_tag in incar_dict.keys():
-            del incar_dict[remove_tag]
-  
-
-
-    if isinstance(valid_incar_tags, str):
-        valid_incar_tags_str = valid_incar_tags
-        with open(valid_incar_tags_str, "r") as valid_incar_tags_f:
-            valid_incar_tags = [incar_tag.split("#")[0].split("=")[0].strip().upper() for incar_tag in valid_incar_tags_f if incar_tag.strip()]
-        duplicate = return_duplicate(valid_incar_tags)
-        assert duplicate == "", "{} appears more than once in {}. Pls remove the duplicate".format(duplicate, valid_incar_tags_str)
-    valid_incar_tags = [incar_tag.upper() for incar_tag in valid_incar_tags]
-    duplicate = return_duplicate(valid_incar_tags)
-    assert duplicate == "", "{} appears more than once in valid_incar_tags. Pls remove the duplicate".format(duplicate)
-    
-    
-    
-    if valid_incar_tags:
-        for incar_tag in incar_dict.keys():
-            assert incar_tag in valid_incar_tags, "under {}\n ".format(cal_loc) +             "When we are modifying INCAR as pre-defined, {} is not found in ".format(incar_tag) +             "the valid incar tags defined by valid_incar_tags in HTC_calculation_setup_file.\n" +             "If this is not a spelling error and you want to validize this incar tag, add it in the file specified by valid_incar_tags in HTC_calculation_setup_file."
-    
-        
-
-    if isinstance(incar_template, str):
-        incar_template_str = incar_template
-        with open(incar_template_str, "r") as incar_template_f:
-            incar_template = [incar_tag.split("#")[0].split("=")[0].strip().upper() for incar_tag in incar_template_f]
-        duplicate = return_duplicate(incar_template, excluded_strs=[""])
-        assert duplicate == "", "You set {} more than once in {}. Pls remove the duplicate".format(duplicate, incar_template_str)
-    incar_template = [incar_tag.upper() for incar_tag in incar_template]
-    duplicate = return_duplicate(incar_template, excluded_strs=[""])
-    assert duplicate == "", "You set {} more than once in incar_template. Pls remove the duplicate".format(duplicate)
-    #if len(incar_template) > 2:
-    #    incar_template = [tag_1 for tag_1, tag_2 in zip(incar_template[:-1], incar_template[1:]) if tag_1 != "" or tag_2 != ""]
-    
-    
-    
-    to_be_written_incar_tags = incar_dict.keys()
-    consumed_incar_tags = []
-    output_incar_str = ""
-    is_an_empty_line_allowed = True #ensure there is only one empty line between incar tag blocks
-    for incar_tag in incar_template:
-        if incar_tag in to_be_written_incar_tags:
-            output_incar_str += "{} = {}\n".format(incar_tag, incar_dict[incar_tag])
-            consumed_incar_tags.append(incar_tag)
-            is_an_empty_line_allowed = True
-        elif incar_tag == "" and is_an_empty_line_allowed:
-            output_incar_str += "\n"
-            is_an_empty_line_allowed = False
-
-    left_incar_tags = set(to_be_written_incar_tags).difference(set(incar_template))
-    if left_incar_tags: output_incar_str += "\n"
-    for incar_tag in sorted(left_incar_tags):
-        output_incar_str += "{} = {}\n".format(incar_tag, incar_dict[incar_tag])
-        consumed_incar_tags.append(incar_tag)
-    assert sorted(to_be_written_incar_tags) == sorted(consumed_incar_tags), "Something wrong with writing INCAR"    
-    
-    
-    if isinstance(rename_old_incar, bool):
-        if rename_old_incar:
-            rename_old_incar = find_next_name(cal_loc=cal_loc, orig_name="INCAR")["next_name"]
-            decorated_os_rename(loc=cal_loc, old_filename="INCAR", new_filename=rename_old_incar)
-    elif isinstance(rename_old_incar, str):
-        decorated_os_rename(loc=cal_loc, old_filename="INCAR", new_filename=rename_old_incar)
-    else:
-        raise Exception("input argument rename_old_incar of modify_vasp_incar must be either bool or str.")
-
-            
-    with open(os.path.join(cal_loc, "INCAR"), "w") as incar_f:
-        incar_f.write(output_incar_str)
+    incar_transaction.set_tags(new_tags)
+    incar_transaction.remove_tags(remove_tags)
+    incar_transaction.commit(rename_old_incar=rename_old_incar, incar_template=incar_template, valid_incar_tags=valid_incar_tags)
 
 
 # In[19]:
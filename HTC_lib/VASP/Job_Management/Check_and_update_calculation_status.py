@@ -5,7 +5,6 @@
 
 
 import os, sys, time, random, shutil
-from pathlib import Path
 
 ##############################################################################################################
 ##DO NOT change this part.
@@ -20,9 +19,11 @@ from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str, decorated_os_rena
 from HTC_lib.VASP.Miscellaneous.Utilities import get_current_firework_from_cal_loc, get_mat_folder_name_from_cal_loc, write_cal_status
 from HTC_lib.VASP.Miscellaneous.Execute_bash_shell_cmd import Execute_shell_cmd
 from HTC_lib.VASP.Miscellaneous.change_signal_file import change_signal_file
-from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation, Cal_status_journal
+from HTC_lib.VASP.Miscellaneous.Cal_status_index import Cal_status_index
 
 from HTC_lib.VASP.Job_Management.Submit_and_Kill_job import Job_management, kill_error_jobs
+from HTC_lib.VASP.Job_Management.Queue_snapshot import Queue_snapshot
 
 from HTC_lib.VASP.Error_Checker.Error_checker import Write_and_read_error_tag
 from HTC_lib.VASP.Error_Checker.Error_checker import Vasp_Error_Saver
@@ -68,7 +69,28 @@ def is_early_termination_file_found(main_dir):
 # In[2]:
 
 
-def update_job_status(cal_folder, workflow, which_status='all', job_list=[], rank=None):
+def log_failed_jobs(job_list, future_list, which_status):
+    """
+    Wait for the futures of the jobs updated in a process pool, one future per job, and print the error of every failed job.
+    A failed job does not stop the update of the other jobs. Its status is left as it is and will be updated again in the next round.
+    Return the list of the failed jobs.
+    """
+    failed_job_list = []
+    for job, future in zip(job_list, future_list):
+        try:
+            future.result()
+        except Exception as err:
+            failed_job_list.append(job)
+            print("{}: fail to update the status of {} ({}): {}: {}".format(get_time_str(), job, which_status, type(err).__name__, err), flush=True)
+    if failed_job_list:
+        print("{}: {} out of {} jobs of {} failed to be updated.".format(get_time_str(), len(failed_job_list), len(job_list), which_status), flush=True)
+    return failed_job_list
+
+
+# In[2]:
+
+
+def update_job_status(cal_folder, workflow, which_status='all', job_list=[], rank=None, executor=None):
     """
     arguements:
         - cal_folder: the path to the folder under which high-throughput calculations are performed.
@@ -81,6 +103,9 @@ def update_job_status(cal_folder, workflow, which_status='all', job_list=[], ran
                 In the parallel mode, only process 0 checks the status of all calculations, evenly divides the to-be-updated calculations and send them to 
                 different processes. This ensures each to-be-updated calculation to be updated by only one process.
                 default: []
+        - executor: the long-lived worker pool created by create_worker_pool. If provided, the running jobs are updated in this pool.
+                Otherwise, a new ProcessPoolExecutor is created for them if workflow[0]["max_workers"] is set.
+                default: None
     """
     debugging = True
     
@@ -118,24 +143,28 @@ def update_job_status(cal_folder, workflow, which_status='all', job_list=[], ran
         for cal_loc in job_list:
             if debugging: 
                 assert os.path.isfile(os.path.join(cal_loc, "__running__")), "{}: The status of the following job is not __running__: {}".format(get_time_str(), cal_loc)
-        if workflow[0]["max_workers"] != None: #max_workers is the input argument of class ProcessPoolExecutor. Being true means that ProcessPoolExecutor is deployed for parallization
-            job_status_str = Job_management.check_jobs_in_queue_system(workflow=workflow, return_a_str=True)
-            workflow_list, job_status_str_list = [workflow] * len(job_list), [job_status_str] * len(job_list)
+        if executor != None:
+            queue_snapshot = Queue_snapshot.get(workflow=workflow)
+            future_list = [executor.submit(update_running_jobs_status_with_preloaded_workflow, [job], queue_snapshot) for job in job_list]
+            log_failed_jobs(job_list=job_list, future_list=future_list, which_status=which_status)
+        elif workflow[0]["max_workers"] != None: #max_workers is the input argument of class ProcessPoolExecutor. Being true means that ProcessPoolExecutor is deployed for parallization
+            queue_snapshot = Queue_snapshot.get(workflow=workflow)
             with ProcessPoolExecutor(max_workers=workflow[0]["max_workers"]) as executor:
-                executor.map(update_running_jobs_status, [[job] for job in job_list], workflow_list, job_status_str_list)
+                future_list = [executor.submit(update_running_jobs_status, [job], workflow, queue_snapshot) for job in job_list]
+                log_failed_jobs(job_list=job_list, future_list=future_list, which_status=which_status)
         else:
             update_running_jobs_status(running_jobs_list=job_list, workflow=workflow)
         old_cal_status = {"running_folder_list": job_list}
         new_cal_status = check_calculations_status(cal_folder, workflow, cal_loc_list=job_list)
         return Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=old_cal_status, new_cal_status_dict=new_cal_status)
     elif which_status == "error_folder_list":
-        for cal_loc in job_list:
-            #To respond to termination files in the main directory
-            if is_early_termination_file_found(main_dir=workflow[0]["htc_cwd"]):
-                break
-            if debugging: 
+        if debugging: 
+            for cal_loc in job_list:
                 assert os.path.isfile(os.path.join(cal_loc, "__error__")), "{}: The status of the following job is not __error__: {}".format(get_time_str(), cal_loc)
-            kill_error_jobs(error_jobs=[cal_loc], workflow=workflow)
+        #To respond to termination files in the main directory
+        if not is_early_termination_file_found(main_dir=workflow[0]["htc_cwd"]):
+            #All error jobs are killed in a few calls of the job killing command rather than one call per job.
+            kill_error_jobs(error_jobs=job_list, workflow=workflow)
         old_cal_status = {"error_folder_list": job_list}
         new_cal_status = check_calculations_status(cal_folder, workflow, cal_loc_list=job_list)
         return Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=old_cal_status, new_cal_status_dict=new_cal_status)
@@ -292,36 +321,29 @@ def check_calculations_status(cal_folder, workflow, mat_folder_name_list=None, c
         - vis_folder_list (list): a list of absolute pathes where the input files for calculations need to be prepared
         - ...
     """
-    signal_file_list = ["__done__",  "__done_cleaned_analyzed__", "__done_failed_to_clean_analyze__", "__manual__", "__test__", "__vis__", 
-                        "__skipped__", "__ready__", "__prior_ready__", "__sub_dir_cal__", "__error__", "__running__",  "__killed__", "__nkx_gt_ikptd__"]
-    job_status_folder_list = [signal_file.strip("_") + "_folder_list" for signal_file in signal_file_list] + ["other_folder_list"]
+    job_status_dict = {status: [] for status in Cal_status_dict_operation.status_list}
     #job_status_folder_list = ["done_folder_list", "done_cleaned_analyzed_folder_list", "done_failed_to_clean_analyze_folder_list", 
     #                          "manual_folder_list", "test_folder_list", "vis_folder_list", "skipped_folder_list", "ready_folder_list", 
     #                          "prior_ready_folder_list", "sub_dir_cal_folder_list", "error_folder_list", "running_folder_list", 
-    #                          "killed_folder_list", "other_folder_list", "nkx_gt_ikptd_folder_list"]
-    job_status_dict = {key: [] for key in job_status_folder_list}
-    job_status_dict["complete_folder_list"] = []
+    #                          "killed_folder_list", "other_folder_list", "nkx_gt_ikptd_folder_list", "complete_folder_list"]
     
-    directory_list = []
     if cal_loc_list != None:
-        directory_list = [cal_loc for cal_loc in cal_loc_list if os.path.isdir(cal_loc)]
+        cal_status_dict_list = [job_status_dict]
+        for cal_loc in cal_loc_list:
+            dir_entries = list_dir_entries(cal_loc)
+            if dir_entries != None: #non-existent folders are skipped
+                cal_status_dict_list.append({get_cal_status_from_file_list(dir_entries[1]): [cal_loc]})
     else:
-        cal_name_list = [firework["firework_folder_name"] for firework in workflow[::-1]]
         if mat_folder_name_list == None:
             mat_folder_name_list = os.listdir(cal_folder)
-        for mat_folder in mat_folder_name_list:
-            mat_folder = os.path.join(cal_folder, mat_folder)
-            if os.path.isdir(mat_folder):
-                if os.path.isfile(os.path.join(mat_folder, "__complete__")): #are_all_cal_for_a_material_complete(mat_folder=mat_folder, cal_name_list=cal_name_list):
-                    job_status_dict["complete_folder_list"].append(mat_folder)
-                else:
-                    directory_list.append(mat_folder)
-        
-    job_list = []
-    for directory in directory_list:
-        for incar_loc in [str(incar_loc) for incar_loc in Path(directory).glob("**/INCAR")]:
-            if "step" in incar_loc and "error_folder" not in incar_loc:
-                job_list.append(os.path.split(incar_loc)[0])
+        cal_status_dict_list = [job_status_dict] + [discover_cal_status_under_a_mat_folder(os.path.join(cal_folder, mat_folder)) for mat_folder in mat_folder_name_list]
+    
+    #Old codes to obtain job_list, which descend into every error_folder and list every calculation folder twice
+    #job_list = []
+    #for directory in directory_list:
+    #    for incar_loc in [str(incar_loc) for incar_loc in Path(directory).glob("**/INCAR")]:
+    #        if "step" in incar_loc and "error_folder" not in incar_loc:
+    #            job_list.append(os.path.split(incar_loc)[0])
     
     #Old, slow but safe codes to obtain job_list
     #jobs_in_str = decorated_subprocess_check_output("find %s -type f -name INCAR" % cal_folder)[0]
@@ -331,31 +353,7 @@ def check_calculations_status(cal_folder, workflow, mat_folder_name_list=None, c
     #    if job and "step" in job and "error_folder" not in job:
     #        job_list.append(os.path.split(job)[0])
     
-    for job in job_list:
-        file_list = os.listdir(job)
-        is_it_categorized = False
-        for signal_file, status_type in zip(signal_file_list, job_status_folder_list):
-            if signal_file in file_list:
-                job_status_dict[status_type].append(job)
-                is_it_categorized = True
-                break
-        if not is_it_categorized:
-            file_belong_to_other = True
-            #Also search for other unknown signal files starting and ending with double underscores ("__")
-            for file_ in file_list:
-                if file_.startswith("__") and file_.endswith("__"):
-                    unknown_job_status = file_.strip("_") + "_folder_list"
-                    if unknown_job_status not in job_status_dict.keys():
-                        job_status_dict[unknown_job_status] = [job]
-                    else:
-                        job_status_dict[unknown_job_status].append(job)
-                    file_belong_to_other = False
-                    break
-            if file_belong_to_other:
-                job_status_dict["other_folder_list"].append(job)
-         
-    for status in job_status_dict.keys():
-        job_status_dict[status] = sorted(job_status_dict[status])
+    job_status_dict = Cal_status_dict_operation.merge_dicts(a_list_of_dicts=cal_status_dict_list) #The job list of every status is sorted.
     #Sort the ready jobs such that the series of jobs associated with one material can be run continuously
     #job_status_dict["ready_folder_list"] = sorted(job_status_dict["ready_folder_list"])
     #job_status_dict["prior_ready_folder_list"] = sorted(job_status_dict["prior_ready_folder_list"])
@@ -363,21 +361,335 @@ def check_calculations_status(cal_folder, workflow, mat_folder_name_list=None, c
     return job_status_dict
 
 
+# In[2]:
+
+
+def list_dir_entries(directory):
+    """
+    List the entries under directory via a single os.scandir call.
+    return (sub_dir_list, file_set):
+        - sub_dir_list (list): the names of the sub-folders under directory. Whether an entry is a folder is given by os.scandir (d_type) without an extra stat.
+        - file_set (set): the names of all entries (including sub-folders) under directory.
+    return None if directory cannot be listed, e.g. it does not exist or is not a folder.
+    """
+    sub_dir_list, file_set = [], set()
+    try:
+        with os.scandir(directory) as entry_iterator:
+            for entry in entry_iterator:
+                if entry.is_dir():
+                    sub_dir_list.append(entry.name)
+                file_set.add(entry.name)
+    except OSError:
+        return None
+    return sub_dir_list, file_set
+
+
+# In[2]:
+
+
+def discover_cal_status_under_a_mat_folder(mat_folder, list_dir_entries=list_dir_entries):
+    """
+    Find all calculations under a material folder and categorize them in a single pass.
+    input arguments:
+        - mat_folder (str): the absolute path to a material folder.
+        - list_dir_entries (func): a function listing a directory. It takes a directory and returns (a list of sub-folder names, a set of all entry names)
+                            or None if the directory cannot be listed. Default: function list_dir_entries, i.e. one os.scandir call per directory.
+    The folder tree is traversed from mat_folder:
+        - If __complete__ is under mat_folder, mat_folder is put into complete_folder_list and nothing beneath it is visited.
+        - At the level of mat_folder, only the sub-folders whose names start with "step_" are visited.
+        - Folders whose names contain "error_folder" are never visited.
+        - Hidden folders, i.e. whose names start with ".", are never visited. They hold caches rewritten in every check, e.g. the sidecar of Tail_cursor.
+        - A visited folder containing INCAR is a calculation. Its status is determined from the same directory entries by function get_cal_status_from_file_list,
+            including the unknown signal files __xxx__.
+        - The sub-folders of a calculation are visited as well so as to find the calculations of the sub-directory calculations.
+    return a calculation status dict having keys in Cal_status_dict_operation.status_list and possibly xxx_folder_list for unknown signal files __xxx__.
+    """
+    job_status_dict = {status: [] for status in Cal_status_dict_operation.status_list}
+    dir_entries = list_dir_entries(mat_folder)
+    if dir_entries == None:
+        return job_status_dict
+    sub_dir_list, file_set = dir_entries
+    if "__complete__" in file_set:
+        job_status_dict["complete_folder_list"].append(mat_folder)
+        return job_status_dict
+    
+    to_be_visited_dir_list = [os.path.join(mat_folder, sub_dir) for sub_dir in sub_dir_list if sub_dir.startswith("step_") and "error_folder" not in sub_dir]
+    while to_be_visited_dir_list:
+        directory = to_be_visited_dir_list.pop()
+        dir_entries = list_dir_entries(directory)
+        if dir_entries == None:
+            continue
+        sub_dir_list, file_set = dir_entries
+        if "INCAR" in file_set:
+            job_status = get_cal_status_from_file_list(file_set)
+            if job_status not in job_status_dict.keys():
+                job_status_dict[job_status] = [directory]
+            else:
+                job_status_dict[job_status].append(directory)
+        to_be_visited_dir_list.extend([os.path.join(directory, sub_dir) for sub_dir in sub_dir_list if "error_folder" not in sub_dir and not sub_dir.startswith(".")])
+    return job_status_dict
+
+
+# In[2]:
+
+
+def get_cal_status_from_file_list(file_list):
+    """
+    Categorize a calculation according to the names of the files (and folders) under it.
+    input argument:
+        - file_list (list or set of str): the names of the files under the calculation folder, e.g. the return of os.listdir
+    return the status key:
+        - If any built-in signal file is found, the status is determined by the one with the highest priority. See Cal_status_dict_operation.signal_file_list
+        - Otherwise, if there is any other unknown signal file starting and ending with double underscores ("__"), say __xyz__, return xyz_folder_list
+        - Otherwise, return other_folder_list
+    """
+    for signal_file in Cal_status_dict_operation.signal_file_list:
+        if signal_file in file_list:
+            return signal_file.strip("_") + "_folder_list"
+    #Also search for other unknown signal files starting and ending with double underscores ("__")
+    for file_ in file_list:
+        if file_.startswith("__") and file_.endswith("__"):
+            return file_.strip("_") + "_folder_list"
+    return "other_folder_list"
+
+
+# In[2]:
+
+
+def scan_a_mat_folder_incrementally(mat_folder, dir_stamp_dict, safety_margin=2):
+    """
+    Rescan the calculations under a material folder only if any directory beneath it has changed since the previous scan. See Incremental_cal_status_scanner
+    This function takes and returns plain data only, so that the material folders can be scanned in the worker processes of a ProcessPoolExecutor.
+    input arguments:
+        - mat_folder (str): the absolute path to a material folder.
+        - dir_stamp_dict (dict): directory --> (st_mtime_ns, st_ino) or None, i.e. the third entry of the previous return for this mat_folder.
+                An empty dict means mat_folder has not been scanned before.
+        - safety_margin (float): in seconds. See Incremental_cal_status_scanner. Default: 2
+    return a tuple of length 3:
+        - first entry: the calculation status dict of mat_folder (see discover_cal_status_under_a_mat_folder), or None if no directory has changed,
+            in which case the previous calculation status dict of mat_folder is still valid.
+        - second entry: the number of directories listed.
+        - third entry: the new dir_stamp_dict of mat_folder.
+    """
+    if dir_stamp_dict:
+        for directory, stamp in dir_stamp_dict.items():
+            if stamp == None:
+                break
+            try:
+                stat_result = os.stat(directory)
+            except OSError:
+                break
+            if (stat_result.st_mtime_ns, stat_result.st_ino) != stamp:
+                break
+        else:
+            return None, 0, dir_stamp_dict
+    
+    new_dir_stamp_dict = {}
+    def list_and_stamp_dir_entries(directory):
+        try:
+            stat_result = os.stat(directory)
+        except OSError:
+            return None
+        listing_time_ns = time.time_ns()
+        dir_entries = list_dir_entries(directory)
+        if dir_entries == None:
+            return None
+        if listing_time_ns - stat_result.st_mtime_ns < safety_margin * 1e9:
+            #The directory may change within the same mtime tick after the listing. Do not trust the stamp --> list it again next time.
+            new_dir_stamp_dict[directory] = None
+        else:
+            new_dir_stamp_dict[directory] = (stat_result.st_mtime_ns, stat_result.st_ino)
+        return dir_entries
+    
+    cal_status_dict = discover_cal_status_under_a_mat_folder(mat_folder=mat_folder, list_dir_entries=list_and_stamp_dir_entries)
+    return cal_status_dict, len(new_dir_stamp_dict), new_dir_stamp_dict
+
+
+# In[2]:
+
+
+class Incremental_cal_status_scanner():
+    """
+    Scan the status of all calculations under cal_folder incrementally.
+    For every material folder, the scanner remembers the mtime and inode of every directory visited by the previous scan, together with the calculation status dict found.
+    Creating, removing or renaming a signal file updates the mtime of its parent directory. So if the mtime and inode of every directory under a material folder
+    are unchanged, the remembered calculation status dict is reused and nothing under that material folder is listed again.
+    Otherwise, the material folder is rescanned from scratch by function discover_cal_status_under_a_mat_folder, as check_calculations_status does.
+    Note that the change in a sub-directory does not update the mtime of its parent directory. Hence, every remembered directory is still
+    stat-ed once per scan, while the expensive directory listing (and the recursive INCAR search of check_calculations_status) is only
+    carried out for the changed material folders.
+    On a filesystem with a coarse mtime resolution (e.g. 1 s on NFS), a signal file renamed in the same tick as the listing leaves the mtime unchanged.
+    Hence, a directory whose mtime is within safety_margin seconds of the listing time is not trusted and its material folder is rescanned in the next scan.
+    The material folders are checked by function scan_a_mat_folder_incrementally, either one after another or in the worker processes of an executor (see method scan).
+    
+    input arguments:
+        - cal_folder (str): the absolute path to the folder under which all material folders are.
+        - safety_margin (float): in seconds. It guards against the coarse mtime resolution and the clock difference between the file server and this node.
+                Default: 2
+    
+    Usage: create it once and call method scan in every loop. The first scan is a full scan.
+    """
+    def __init__(self, cal_folder, safety_margin=2):
+        self.cal_folder = cal_folder
+        self.safety_margin = safety_margin
+        self.cal_folder_stamp, self.mat_folder_name_list = None, []
+        self.mat_folder_state_dict = {} #mat folder --> (dir_stamp_dict, calculation status dict). See scan_a_mat_folder_incrementally
+        self.no_of_listed_dirs = 0
+        
+    def _list_mat_folders(self):
+        try:
+            stat_result = os.stat(self.cal_folder)
+        except OSError:
+            return []
+        stamp = (stat_result.st_mtime_ns, stat_result.st_ino)
+        if self.cal_folder_stamp != None and self.cal_folder_stamp == stamp:
+            return self.mat_folder_name_list
+        listing_time_ns = time.time_ns()
+        dir_entries = list_dir_entries(self.cal_folder)
+        if dir_entries == None:
+            return []
+        self.no_of_listed_dirs += 1
+        self.mat_folder_name_list = dir_entries[0]
+        self.cal_folder_stamp = None if listing_time_ns - stat_result.st_mtime_ns < self.safety_margin * 1e9 else stamp
+        return self.mat_folder_name_list
+    
+    def scan(self, executor=None, chunksize=64):
+        """
+        Scan all material folders under cal_folder and return the merged calculation status dict (see check_calculations_status).
+        The per-material-folder calculation status dicts are merged via Cal_status_dict_operation.merge_dicts
+        input arguments:
+            - executor (concurrent.futures.Executor or None): if provided, the material folders are checked in parallel via executor.map. Default: None
+            - chunksize (int): the chunksize passed to executor.map. Default: 64
+        """
+        self.no_of_listed_dirs = 0
+        mat_folder_list = [os.path.join(self.cal_folder, mat_folder_name) for mat_folder_name in self._list_mat_folders()]
+        dir_stamp_dict_list = [self.mat_folder_state_dict[mat_folder][0] if mat_folder in self.mat_folder_state_dict else {} for mat_folder in mat_folder_list]
+        safety_margin_list = [self.safety_margin] * len(mat_folder_list)
+        if executor == None:
+            result_list = map(scan_a_mat_folder_incrementally, mat_folder_list, dir_stamp_dict_list, safety_margin_list)
+        else:
+            result_list = executor.map(scan_a_mat_folder_incrementally, mat_folder_list, dir_stamp_dict_list, safety_margin_list, chunksize=chunksize)
+        
+        new_mat_folder_state_dict = {}
+        cal_status_dict_list = [{status: [] for status in Cal_status_dict_operation.status_list}]
+        for mat_folder, (cal_status_dict, no_of_listed_dirs, dir_stamp_dict) in zip(mat_folder_list, result_list):
+            if cal_status_dict == None:
+                cal_status_dict = self.mat_folder_state_dict[mat_folder][1]
+            new_mat_folder_state_dict[mat_folder] = (dir_stamp_dict, cal_status_dict)
+            cal_status_dict_list.append(cal_status_dict)
+            self.no_of_listed_dirs += no_of_listed_dirs
+        #Material folders which are not visited in this scan (e.g. removed ones) are forgotten.
+        self.mat_folder_state_dict = new_mat_folder_state_dict
+        return Cal_status_dict_operation.merge_dicts(a_list_of_dicts=cal_status_dict_list)
+
+
+# In[2]:
+
+
+def load_cal_status_checkpoint(workflow):
+    """
+    Load the last persisted calculation status (checkpoint) for the warm start.
+    If the calculation status index is on (HTC tag cal_status_index) and not empty, the checkpoint is read from the index.
+    Otherwise, the checkpoint is recovered from ${HTC_CWD}/htc_job_status.json and the status journal, if any (see Cal_status_journal.recover)
+    return (cal_status_dict, checkpoint_time):
+        - cal_status_dict: the calculation status dict, or None if there is no checkpoint
+        - checkpoint_time (float): the last modification time of the checkpoint file(s), in seconds since the epoch. None if there is no checkpoint
+    """
+    cal_status_index = Cal_status_index.from_workflow(workflow)
+    if cal_status_index != None and not cal_status_index.is_empty():
+        return cal_status_index.load_cal_status_dict(), os.stat(cal_status_index.db_filename).st_mtime
+    
+    htc_job_status_file_path = os.path.join(workflow[0]["htc_cwd"], "htc_job_status.json")
+    cal_status_dict = Cal_status_journal.recover(htc_job_status_file_path)
+    if cal_status_dict == None:
+        return None, None
+    checkpoint_time_list = [os.stat(htc_job_status_file_path).st_mtime]
+    journal_filename = Cal_status_journal.get_journal_filename(htc_job_status_file_path)
+    if os.path.isfile(journal_filename):
+        checkpoint_time_list.append(os.stat(journal_filename).st_mtime)
+    return cal_status_dict, max(checkpoint_time_list)
+
+
+# In[2]:
+
+
+def warm_start_cal_status(cal_folder, workflow, cal_status_dict, checkpoint_time, safety_margin=300):
+    """
+    Validate a checkpoint of the calculation status (see load_cal_status_checkpoint) against directory mtimes and
+    only rescan those material folders which have changed since the checkpoint.
+    A material folder under cal_folder is rescanned if
+        - it is not found in the checkpoint, or
+        - its mtime is later than checkpoint_time - safety_margin (e.g. a new step folder or __complete__ was created), or
+        - the mtime of any calculation of it recorded in the checkpoint is later than checkpoint_time - safety_margin (e.g. a signal file changed),
+            or such a calculation no longer exists.
+    Any signal file change updates the mtime of the calculation folder holding it. Therefore only one stat per material folder and per known
+    calculation is needed, instead of listing every folder in a full scan.
+    The calculations of the material folders which no longer exist are dropped.
+    input arguments:
+        - cal_folder (str): the absolute path to the folder under which all material folders are.
+        - workflow: the workflow parsed by function read_HTC_calculation_setup_folder in HTC_lib/VASP/Preprocess_and_Postprocess/Parse_calculation_workflow.py
+        - cal_status_dict (dict or Cal_status_store): the checkpoint.
+        - checkpoint_time (float): the time when the checkpoint was written, in seconds since the epoch.
+        - safety_margin (float): in seconds. It guards against the coarse mtime resolution and the clock difference between the file server and this node.
+            Default: 300
+    return (cal_status_dict, rescanned_mat_folder_name_list), where cal_status_dict is the validated calculation status dict.
+    """
+    threshold_time = checkpoint_time - safety_margin
+    
+    mat_folder_job_dict = {} #material folder name --> a list of its calculations in the checkpoint
+    for job, status in Cal_status_dict_operation.reverse_cal_status_dict(cal_status_dict).items():
+        rel_path = os.path.relpath(job, cal_folder)
+        if rel_path.startswith(".."):
+            continue
+        mat_folder_name = rel_path.split(os.sep)[0]
+        if mat_folder_name in mat_folder_job_dict.keys():
+            mat_folder_job_dict[mat_folder_name].append(job)
+        else:
+            mat_folder_job_dict[mat_folder_name] = [job]
+    
+    existent_mat_folder_name_set, rescanned_mat_folder_name_list = set(), []
+    with os.scandir(cal_folder) as entry_iterator:
+        for entry in entry_iterator:
+            if not entry.is_dir():
+                continue
+            existent_mat_folder_name_set.add(entry.name)
+            if entry.name not in mat_folder_job_dict.keys() or entry.stat().st_mtime > threshold_time:
+                rescanned_mat_folder_name_list.append(entry.name)
+                continue
+            for job in mat_folder_job_dict[entry.name]:
+                try:
+                    is_changed = os.stat(job).st_mtime > threshold_time
+                except OSError:
+                    is_changed = True
+                if is_changed:
+                    rescanned_mat_folder_name_list.append(entry.name)
+                    break
+    
+    removed_job_list = []
+    for mat_folder_name in set(mat_folder_job_dict.keys()).difference(existent_mat_folder_name_set).union(rescanned_mat_folder_name_list):
+        removed_job_list.extend(mat_folder_job_dict.get(mat_folder_name, []))
+    rescanned_cal_status_dict = check_calculations_status(cal_folder=cal_folder, workflow=workflow, mat_folder_name_list=rescanned_mat_folder_name_list)
+    cal_status_diff = {"updated": Cal_status_dict_operation.reverse_cal_status_dict(rescanned_cal_status_dict), "removed": removed_job_list, 
+                       "status_list": list(rescanned_cal_status_dict.keys())}
+    cal_status_dict = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=cal_status_dict, cal_status_dict_diff=cal_status_diff)
+    return cal_status_dict, rescanned_mat_folder_name_list
+
+
 # In[3]:
 
 
-def update_running_jobs_status(running_jobs_list, workflow, job_status_str=None):
+def update_running_jobs_status(running_jobs_list, workflow, queue_snapshot=None):
     """
     Update jobs's status. for the running jobs, if any errors are detected, change __running__ to __error__ and 
         the error type will be written into __error__.
     input arguments:
         - running_jobs_list (list): a list of absolute pathes of running jobs.
         - workflow:  the output of func Parse_calculation_workflow.parse_calculation_workflow
-        - job_status_str: a string returned by Job_management.check_jobs_in_queue_system(workflow=workflow, return_a_str=True)
-                default: 'job_status_str=None' --> This function request the string by calling the above function.
+        - queue_snapshot: a Queue_snapshot returned by Queue_snapshot.get(workflow=workflow)
+                default: 'queue_snapshot=None' --> This function gets the shared one by calling the above function.
     """
-    if job_status_str == None:
-        job_status_str = Job_management.check_jobs_in_queue_system(workflow=workflow, return_a_str=True)
+    if queue_snapshot == None:
+        queue_snapshot = Queue_snapshot.get(workflow=workflow)
     
     for job_path in running_jobs_list:
         if is_early_termination_file_found(main_dir=workflow[0]["htc_cwd"]):
@@ -408,8 +720,7 @@ def update_running_jobs_status(running_jobs_list, workflow, job_status_str=None)
                 continue    
                 
             queue_id = Job_management(cal_loc=job_path, workflow=workflow).find_queue_id()
-            #print(queue_id, queue_id in job_status_str)
-            if queue_id not in job_status_str:
+            if not queue_snapshot.is_in_queue(queue_id):
                 if not os.path.isfile(os.path.join(job_path, "__no_of_times_not_in_queue__")):
                     with open(os.path.join(job_path, "__no_of_times_not_in_queue__"), "w") as f:
                         f.write("1")
@@ -660,3 +971,39 @@ def clean_analyze_or_update_successfully_finished_jobs(done_jobs_list, workflow)
                 log_f.write("\tFailed to clean or analyze the calculation. See above for the details\n")
                 log_f.write("\tdelete __manual__ && __done__ --> __done_failed_to_clean_analyze__")
 
+
+
+# In[6]:
+
+
+_preloaded_workflow = None #The workflow loaded once by each worker process of the pool created by create_worker_pool
+
+
+def preload_workflow(workflow):
+    """
+    The initializer of every worker process of the pool created by create_worker_pool. 
+    It saves the parsed workflow in the worker process so that the tasks submitted to the pool only carry job paths.
+    """
+    global _preloaded_workflow
+    _preloaded_workflow = workflow
+    
+def get_preloaded_workflow():
+    assert _preloaded_workflow != None, "No workflow is preloaded in this process. Please submit this task to the pool created by create_worker_pool."
+    return _preloaded_workflow
+
+def create_worker_pool(workflow):
+    """
+    Create a long-lived ProcessPoolExecutor of workflow[0]["max_workers"] worker processes. Every worker process loads workflow once at start-up.
+    The pool is supposed to be created once per htc daemon lifetime and re-created only when the workflow is updated (__update_input__).
+    Submit the functions named "*_with_preloaded_workflow" to the pool, which read the preloaded workflow instead of receiving it with every task.
+    """
+    return ProcessPoolExecutor(max_workers=workflow[0]["max_workers"], initializer=preload_workflow, initargs=(workflow,))
+
+def check_calculations_status_with_preloaded_workflow(cal_folder, mat_folder_name_list=None, cal_loc_list=None):
+    return check_calculations_status(cal_folder=cal_folder, workflow=get_preloaded_workflow(), mat_folder_name_list=mat_folder_name_list, cal_loc_list=cal_loc_list)
+
+def update_job_status_with_preloaded_workflow(cal_folder, which_status, job_list):
+    return update_job_status(cal_folder=cal_folder, workflow=get_preloaded_workflow(), which_status=which_status, job_list=job_list)
+
+def update_running_jobs_status_with_preloaded_workflow(running_jobs_list, queue_snapshot=None):
+    return update_running_jobs_status(running_jobs_list=running_jobs_list, workflow=get_preloaded_workflow(), queue_snapshot=queue_snapshot)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[1]:
+
+
+import os, re, time, subprocess
+
+from HTC_lib.VASP.Miscellaneous.Retry_policy import Retry_policy, Circuit_open_error
+
+
+# In[2]:
+
+
+class Queue_snapshot():
+    """
+    A parsed snapshot of the job queue returned by the job query command (HTC tag job_query_command).
+    Snapshots are cached per job query command in each process and shared by all callers (counting running jobs, job submission, running job update, ...).
+    A cached snapshot is reused until it is older than its time-to-live (HTC tag queue_snapshot_ttl), so that the job scheduler is queried about once per cycle.
+    The output is parsed by a scheduler-specific parser chosen from the job query command:
+        - PBS (qstat): the job ID is the first column and the state is the second-to-last column, e.g. 'qstat', 'qstat -a' or 'qstat -u user'
+        - SLURM (squeue): the job ID is the first column and the state is the fifth column of the default output, e.g. 'squeue -u user'
+                        If a custom output format gives fewer than 8 columns, the state is the second column.
+        - LSF (bjobs): the job ID is the first column and the state is the third column, e.g. 'bjobs -w'
+        - any other command: every whitespace-separated word of every line is regarded as a job ID whose state is unknown (None).
+    For PBS, SLURM and LSF, the job ID of a job array element (e.g. 123[1] or 123_1) or one including the server name (e.g. 123.pbs01) is also registered
+    under its base job ID (e.g. 123). A job ID is looked up in the dict job_state_dict in O(1), and there is no false positive in which one job ID is a prefix of another.
+
+    input arguments:
+        - job_query_cmd (str): the job query command.
+        - output_str (str): the output of the job query command.
+        - query_time (float): when the job query command was executed (in seconds since the epoch). Default: None, i.e. now.
+    """
+    default_ttl = 60 #seconds
+    _snapshot_dict = {} #job query command --> the cached Queue_snapshot
+
+    def __init__(self, job_query_cmd, output_str, query_time=None):
+        self.job_query_cmd = job_query_cmd
+        self.output_str = output_str
+        self.query_time = time.time() if query_time == None else query_time
+        self.line_list = [line.strip() for line in output_str.split("\n") if line.strip()]
+        self.scheduler = self.detect_scheduler(job_query_cmd)
+        self.job_state_dict = getattr(self, "parse_{}_output".format(self.scheduler))(self.line_list)
+
+    @classmethod
+    def detect_scheduler(cls, job_query_cmd):
+        cmd_name = os.path.split(job_query_cmd.split()[0])[1] if job_query_cmd.split() else ""
+        return {"qstat": "pbs", "squeue": "slurm", "bjobs": "lsf"}.get(cmd_name, "generic")
+
+    @classmethod
+    def _register_job(cls, job_state_dict, job_id, state, base_job_id_re):
+        job_state_dict[job_id] = state
+        base_job_id = re.split(base_job_id_re, job_id)[0]
+        if base_job_id and base_job_id not in job_state_dict.keys():
+            job_state_dict[base_job_id] = state
+
+    @classmethod
+    def parse_pbs_output(cls, line_list):
+        job_state_dict = {}
+        for line in line_list:
+            word_list = line.split()
+            #skip the header lines, e.g. 'Job id  Name  User  Time Use S Queue' and '------- ----'
+            if len(word_list) < 3 or not word_list[0][0].isdigit():
+                continue
+            cls._register_job(job_state_dict, job_id=word_list[0], state=word_list[-2], base_job_id_re=r"[.\[]")
+        return job_state_dict
+
+    @classmethod
+    def parse_slurm_output(cls, line_list):
+        job_state_dict = {}
+        for line in line_list:
+            word_list = line.split()
+            #skip the header line 'JOBID PARTITION NAME USER ST TIME NODES NODELIST(REASON)'
+            if not word_list[0][0].isdigit():
+                continue
+            if len(word_list) >= 8:
+                state = word_list[4]
+            else:
+                state = word_list[1] if len(word_list) > 1 else None
+            cls._register_job(job_state_dict, job_id=word_list[0], state=state, base_job_id_re=r"[_\[]")
+        return job_state_dict
+
+    @classmethod
+    def parse_lsf_output(cls, line_list):
+        job_state_dict = {}
+        for line in line_list:
+            word_list = line.split()
+            #skip the header line 'JOBID USER STAT QUEUE FROM_HOST EXEC_HOST JOB_NAME SUBMIT_TIME'
+            if len(word_list) < 3 or not word_list[0][0].isdigit():
+                continue
+            cls._register_job(job_state_dict, job_id=word_list[0], state=word_list[2], base_job_id_re=r"\[")
+        return job_state_dict
+
+    @classmethod
+    def parse_generic_output(cls, line_list):
+        return {word: None for line in line_list for word in line.split()}
+
+    def is_in_queue(self, job_id):
+        return job_id in self.job_state_dict.keys()
+
+    def get_state(self, job_id):
+        """
+        Return the state of job_id in the queue, or None if job_id is not in the queue or its state is unknown.
+        """
+        return self.job_state_dict.get(job_id, None)
+
+    def count_lines_containing(self, a_str):
+        """
+        Return the number of lines in the output of the job query command which contain a_str.
+        """
+        return len([line for line in self.line_list if a_str in line])
+
+    def get_age(self):
+        return time.time() - self.query_time
+
+    @classmethod
+    def query(cls, job_query_cmd, max_times=None, workflow=None):
+        """
+        Execute job_query_cmd and return its output. Failed tries are retried with backoff under the job_query Retry_policy.
+        Raise Circuit_open_error if the circuit breaker of the job_query commands is open, either before the call or after this call gives up.
+        Otherwise, raise an exception if all tries fail.
+        input arguments:
+            - job_query_cmd (str): the job query command.
+            - max_times (int): the maximum number of tries. Default: None, i.e. set by the Retry_policy.
+            - workflow: the return of function parse_calculation_workflow, by which the Retry_policy is configured. Default: None
+        """
+        retry_policy = Retry_policy.get(command_class="job_query", workflow=workflow)
+        output_list, error_list = retry_policy.execute(func=lambda: subprocess.check_output(job_query_cmd.split()).decode("utf-8"), max_tries=max_times)
+        if error_list[-1] == None:
+            return output_list[-1]
+        if retry_policy.is_circuit_open():
+            raise Circuit_open_error("Fail to check job statuses via '{}': the circuit breaker of the job query commands is open.\nThe last error: {}".format(job_query_cmd.split(), error_list[-1]))
+        raise Exception("Fail to check job statuses via '{}' for {} tries.             Make sure this command is correct!\nThe last error: {}".format(job_query_cmd.split(), len(error_list), error_list[-1]))
+
+    @classmethod
+    def get(cls, workflow, max_times=None, ttl=None):
+        """
+        Return the cached Queue_snapshot of workflow[0]["job_query_command"] if it is younger than ttl seconds.
+        Otherwise, execute the job query command, cache the new Queue_snapshot and return it.
+        input arguments:
+            - workflow: the return of function parse_calculation_workflow
+            - max_times (int): the maximum number of tries to execute the job query command. Default: None, i.e. set by the Retry_policy (HTC tag retry_max_tries)
+            - ttl (float): the time-to-live in seconds. Default: None, i.e. workflow[0]["queue_snapshot_ttl"], or Queue_snapshot.default_ttl if not set.
+        """
+        job_query_cmd = workflow[0]["job_query_command"]
+        if ttl == None:
+            ttl = workflow[0]["queue_snapshot_ttl"]
+        if ttl == None:
+            ttl = cls.default_ttl
+        snapshot = cls._snapshot_dict.get(job_query_cmd, None)
+        if snapshot == None or snapshot.get_age() >= ttl:
+            snapshot = Queue_snapshot(job_query_cmd=job_query_cmd, output_str=cls.query(job_query_cmd, max_times=max_times, workflow=workflow))
+            cls._snapshot_dict[job_query_cmd] = snapshot
+        return snapshot
+
+    @classmethod
+    def invalidate(cls, workflow=None):
+        """
+        Drop the cached Queue_snapshot of workflow[0]["job_query_command"], or all cached ones if workflow is None.
+        Call it once jobs are submitted or killed so that the next call of Queue_snapshot.get queries the job scheduler again.
+        """
+        if workflow == None:
+            cls._snapshot_dict.clear()
+        else:
+            cls._snapshot_dict.pop(workflow[0]["job_query_command"], None)
@@ -5,12 +5,16 @@
 
 
 import os, sys, re, subprocess, shutil
+from concurrent.futures import ThreadPoolExecutor
 HTC_package_path = "C:/Users/tyang/Documents/Jupyter_workspace/HTC/python_3"
 if  os.path.isdir(HTC_package_path) and HTC_package_path not in sys.path:
     sys.path.append(HTC_package_path)
 
 from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str, decorated_os_rename, get_current_firework_from_cal_loc
 from HTC_lib.VASP.Error_Checker.Error_checker import Queue_std_files
+from HTC_lib.VASP.Error_Checker.Error_checker_auxiliary_function import Tail_cursor
+from HTC_lib.VASP.Job_Management.Queue_snapshot import Queue_snapshot
+from HTC_lib.VASP.Miscellaneous.Retry_policy import Retry_policy
 
 
 # In[1]:
@@ -25,6 +29,8 @@ def submit_jobs(cal_jobs_status, workflow, max_jobs_in_queue=30):
         - workflow: the return of function parse_calculation_workflow, which define a set of DFT calculations and 
             related pre- and post- processes
         - max_jobs_in_queue (int): default 30
+    return the list of the jobs for which a submission is attempted, whether it succeeds or not, so that the caller updates their status.
+        The failed submissions (see submit_jobs_in_bulk) are counted and printed.
     """
     no_of_running_jobs = Job_management.count_running_jobs(workflow=workflow)
     if no_of_running_jobs != len(cal_jobs_status["running_folder_list"]):
@@ -38,27 +44,119 @@ def submit_jobs(cal_jobs_status, workflow, max_jobs_in_queue=30):
 
     ready_jobs = cal_jobs_status["prior_ready_folder_list"] + cal_jobs_status["ready_folder_list"]
     available_submissions = min([available_submissions, len(ready_jobs)])
-    parsed_jobs_in_queue_system_list = Job_management.check_jobs_in_queue_system(workflow=workflow)
-    for i in range(available_submissions):
-        cal_loc = ready_jobs[i]
-        print("{}: Submit the job under {}".format(get_time_str(), cal_loc), flush=True)
-        Job_management(cal_loc, workflow, parsed_jobs_in_queue_system_list=parsed_jobs_in_queue_system_list).submit()
+    outcome_dict = submit_jobs_in_bulk(cal_loc_list=ready_jobs[:available_submissions], workflow=workflow)
+    failed_job_list = [cal_loc for cal_loc, is_submitted in outcome_dict.items() if not is_submitted]
+    if failed_job_list:
+        print("{}: {} out of {} job submissions failed. See log.txt under:".format(get_time_str(), len(failed_job_list), len(outcome_dict)), flush=True)
+        [print("\t\t\t{}".format(cal_loc), flush=True) for cal_loc in failed_job_list]
     return ready_jobs[:available_submissions]
 
 
+# In[2]:
+
+
+def submit_jobs_in_bulk(cal_loc_list, workflow, max_concurrent_submissions=None):
+    """
+    Submit the jobs under cal_loc_list concurrently in a thread pool. At most max_concurrent_submissions submissions are carried out at the same time,
+    so that a slow job submission command (e.g. a few seconds per qsub on a loaded server) does not hold up the program for too long.
+    The queue is queried once for all the jobs (see Queue_snapshot) and the cached queue snapshot is dropped after the submissions.
+    input arguments:
+        - cal_loc_list (list): a list of absolute paths to the to-be-submitted jobs.
+        - workflow: the return of function parse_calculation_workflow
+        - max_concurrent_submissions (int): Default: None, i.e. workflow[0]["max_concurrent_submissions"]
+    return a dict, where the key is a calculation path in cal_loc_list and the value is the outcome of Job_management.submit:
+        True if the job is submitted (or found in the queue already), False if an error happens, e.g. the job submission command fails.
+    """
+    if cal_loc_list == []:
+        return {}
+    if max_concurrent_submissions == None:
+        max_concurrent_submissions = workflow[0]["max_concurrent_submissions"]
+    max_concurrent_submissions = max([1, min([max_concurrent_submissions, len(cal_loc_list)])])
+    
+    queue_snapshot = Queue_snapshot.get(workflow=workflow)
+    def submit_a_job(cal_loc):
+        print("{}: Submit the job under {}".format(get_time_str(), cal_loc), flush=True)
+        return Job_management(cal_loc, workflow, queue_snapshot=queue_snapshot).submit()
+    try:
+        if max_concurrent_submissions == 1:
+            outcome_list = [submit_a_job(cal_loc) for cal_loc in cal_loc_list]
+        else:
+            with ThreadPoolExecutor(max_workers=max_concurrent_submissions) as executor:
+                outcome_list = list(executor.map(submit_a_job, cal_loc_list))
+    finally:
+        Queue_snapshot.invalidate(workflow=workflow) #The newly submitted jobs are not in the cached snapshot.
+    return dict(zip(cal_loc_list, outcome_list))
+
+
 # In[3]:
 
 
-def kill_error_jobs(error_jobs, workflow):
+def kill_error_jobs(error_jobs, workflow, max_no_of_queue_ids_per_cmd=100, max_threads=8):
     """
     kill error jobs.
+    Rather than one job killing command per job, the queue IDs of all jobs to be killed are passed to the job killing command in a few calls,
+    e.g. 'qdel id1 id2 ... id100', each of which kills at most max_no_of_queue_ids_per_cmd jobs.
+    Every bulk call is executed once via the job_killing Retry_policy, without retries and without counting towards its circuit breaker:
+        a bulk call usually fails because one of the jobs has just finished and is unknown to the job scheduler, which a retry does not fix.
+    If a bulk call fails, the queue is queried again: the jobs that have left the queue are regarded as killed and the remaining ones are
+        killed one by one via Job_management.kill, whose calls are retried with backoff and counted by the circuit breaker.
+    If the circuit breaker of the job killing commands is open, the remaining jobs are left as __error__ and killed in a later round.
+    Afterwards, the signal files are changed (__error__ --> __killed__ or __manual__) and log.txt is written for every job in a thread pool of max_threads threads.
     input arguments:
         - error_jobs (list): a list of absolute pathes where errors have been detected.
         - workflow: the return of function parse_calculation_workflow, which define a set of DFT calculations and 
             related pre- and post- processes
+        - max_no_of_queue_ids_per_cmd (int): the maximum number of queue IDs passed to the job killing command at a time. Default: 100
+        - max_threads (int): the maximum number of threads to respond to the killing. Default: 8
     """
-    for cal_loc in error_jobs:
-        Job_management(cal_loc, workflow).kill()
+    if error_jobs == []:
+        return
+    
+    job_list = [Job_management(cal_loc, workflow) for cal_loc in error_jobs]
+    to_be_killed_job_list, terminated_job_list = [], []
+    for job in job_list:
+        if job.is_killing_needed():
+            to_be_killed_job_list.append(job)
+        else:
+            terminated_job_list.append(job)
+    retry_policy = Retry_policy.get(command_class="job_killing", workflow=workflow)
+    if retry_policy.is_circuit_open():
+        #The job killing command keeps failing. Leave __error__ as it is and try again after the circuit breaker cooldown.
+        to_be_killed_job_list = []
+    queue_id_list = [job.find_queue_id() for job in to_be_killed_job_list]
+    
+    response_list = [(job.respond_to_killing, {}) for job in terminated_job_list]
+    for start_ind in range(0, len(to_be_killed_job_list), max_no_of_queue_ids_per_cmd):
+        end_ind = start_ind + max_no_of_queue_ids_per_cmd
+        job_chunk, queue_id_chunk = to_be_killed_job_list[start_ind:end_ind], queue_id_list[start_ind:end_ind]
+        cmd = workflow[0]["job_killing_command"] + " " + " ".join(queue_id_chunk)
+        exist_status_list, error_list = retry_policy.execute(func=lambda: subprocess.run(cmd, shell=True, cwd=workflow[0]["htc_cwd"]).returncode, 
+                                                             is_successful=lambda status: status == 0, max_tries=1, count_failure=False)
+        if exist_status_list[-1] == 0:
+            for job in job_chunk:
+                response_list.append((job.respond_to_killing, {"cmd": cmd, "exist_status_list": exist_status_list, "error_list": error_list, "is_killed": True}))
+        elif retry_policy.is_circuit_open():
+            #The job killing command keeps failing. Leave __error__ of the remaining jobs as it is and try again after the circuit breaker cooldown.
+            print("{}: the circuit breaker of the job killing command is open. {} error jobs are left to the next round.".format(get_time_str(), 
+                                                                                                                    len(to_be_killed_job_list) - start_ind), flush=True)
+            break
+        else:
+            Queue_snapshot.invalidate(workflow=workflow)
+            queue_snapshot = Queue_snapshot.get(workflow=workflow)
+            for job, queue_id in zip(job_chunk, queue_id_chunk):
+                if queue_snapshot.is_in_queue(queue_id):
+                    response_list.append((job.kill, {}))
+                else:
+                    response_list.append((job.respond_to_killing, {"cmd": cmd, "exist_status_list": exist_status_list, "error_list": error_list, "is_killed": True}))
+    
+    try:
+        if max_threads == 1 or len(response_list) == 1:
+            [respond(**kwargs) for respond, kwargs in response_list]
+        else:
+            with ThreadPoolExecutor(max_workers=min([max_threads, len(response_list)])) as executor:
+                list(executor.map(lambda response: response[0](**response[1]), response_list))
+    finally:
+        Queue_snapshot.invalidate(workflow=workflow) #The killed jobs are still in the cached snapshot.
 
 
 # def check_jobs_in_queue_system(cmd=["bjobs", "-w"]):
@@ -82,8 +180,8 @@ class Job_management():
         - cal_loc (str): the location of the calculation.
         - workflow: the return of function parse_calculation_workflow, which define a set of DFT calculations and 
             related pre- and post- processes
-        - parsed_jobs_in_queue_system_list (default: None): the return of Job_management.check_jobs_in_queue_system(workflow)
-                    By setting this argument, function Job_management.is_cal_in_queue will directly use this list rather than request via the above command.
+        - queue_snapshot (default: None): the return of Queue_snapshot.get(workflow)
+                    By setting this argument, function Job_management.is_cal_in_queue will directly use this snapshot rather than get the cached one or request a new one.
                     This helps reduce the # of requests to the supercomputor's Job scheduler during job submission, 
                     i.e., one request for ONE to-be-submitted job --> one request for A LIST OF to-be-submitted jobs. (see the last for loop of function submit_jobs above.)
     Operation:
@@ -94,7 +192,7 @@ class Job_management():
                 return queue id if found; otherwise return False
     """
     
-    def __init__(self, cal_loc, workflow, parsed_jobs_in_queue_system_list=None):
+    def __init__(self, cal_loc, workflow, queue_snapshot=None):
         self.cal_loc = cal_loc
         self.firework_name = os.path.split(cal_loc)[-1]
         self.log_txt = os.path.join(self.cal_loc, "log.txt")
@@ -107,45 +205,26 @@ class Job_management():
         self.queue_id_file = os.path.join(self.cal_loc, self.queue_id_file)
         self.re_to_queue_id = workflow[0]["re_to_parse_queue_id"]
         
-        self.parsed_jobs_in_queue_system_list = parsed_jobs_in_queue_system_list
+        self.queue_snapshot = queue_snapshot
     
     
     @classmethod
-    def check_jobs_in_queue_system(cls, workflow, max_times=10, return_a_str=False):
-        job_query_cmd = workflow[0]["job_query_command"].split()
-        
-        result_list, error_list = [], []
-        for i in range(max_times):
-            try:
-                result = subprocess.check_output(job_query_cmd).decode("utf-8")
-            except subprocess.CalledProcessError as err:
-                result_list.append(None)
-                error_list.append(err)
-            else:
-                result_list.append(result)
-                error_list.append(None)
-                break
-                
-        if result_list[-1] == None:
-            raise Exception("Fail to check job statuses via '{}' for {} tries.             Make sure this command is correct!".format(job_query_cmd, max_times))
-        else:
-            result = result_list[-1]
-        
+    def check_jobs_in_queue_system(cls, workflow, max_times=None, return_a_str=False):
+        """
+        Return the output of the job query command as a string if return_a_str is True, or as a list of non-empty lines otherwise.
+        The output is taken from the shared Queue_snapshot, which is only requested again once it is older than its time-to-live.
+        """
+        queue_snapshot = Queue_snapshot.get(workflow=workflow, max_times=max_times)
         if return_a_str:
-            return result
+            return queue_snapshot.output_str
         else:
-            return [line.strip() for line in result.split("\n") if line.strip()]
+            return list(queue_snapshot.line_list)
         
     
     @classmethod
     def count_running_jobs(cls, workflow):
-        all_jobs_in_queue = cls.check_jobs_in_queue_system(workflow)
         job_name = workflow[0]["job_name"] + " "
-        no_of_running_jobs = 0
-        for job_ in all_jobs_in_queue:
-            if job_name in job_:
-                no_of_running_jobs += 1
-        return no_of_running_jobs
+        return Queue_snapshot.get(workflow=workflow).count_lines_containing(job_name)
         
     
     @classmethod
@@ -179,14 +258,8 @@ class Job_management():
         
     def is_cal_in_queue(self):
         queue_id = self.find_queue_id()
-        if self.parsed_jobs_in_queue_system_list != None:
-            parsed_jobs_in_queue_system_list = self.parsed_jobs_in_queue_system_list
-        else:
-            parsed_jobs_in_queue_system_list = Job_management.check_jobs_in_queue_system(self.workflow)
-        for job_summary in parsed_jobs_in_queue_system_list:
-            if queue_id in job_summary:
-                return True
-        return False
+        queue_snapshot = self.queue_snapshot if self.queue_snapshot != None else Queue_snapshot.get(workflow=self.workflow)
+        return queue_snapshot.is_in_queue(queue_id)
     
     def find_queue_id(self):
         assert os.path.isfile(self.queue_id_file), "Error: cannot find {} to parse queue id under {}".format(self.queue_id_file, self.cal_loc)
@@ -204,77 +277,112 @@ class Job_management():
     
     def kill(self):
         queue_id = self.find_queue_id()
-        if Queue_std_files(cal_loc=self.cal_loc, workflow=self.workflow).find_std_files() == [None, None]:
-            if not os.path.isfile(os.path.join(self.cal_loc, "__error__")):
-                print("\n{} Kill: {}".format(get_time_str(), self.cal_loc))
-                print("\t\t\tTo kill this running job, file named __error__ must be present.\n")
-                raise Exception("See error information above.")
-                
-            exist_status_list, error_list = self._decorated_os_system(cmd=self.job_killing_cmd +" "+ queue_id)
-            stdout_file, stderr_file = Queue_std_files(cal_loc=self.cal_loc, workflow=self.workflow).find_std_files()
-            ind_dict = {0: "1st", 1: "2nd", 2: "3rd"}
-            ind_dict.update({i: '{}th'.format(i+1) for i in range(3, 10)})
-            with open(self.log_txt, "a") as f:
-                f.write("{} Kill: move to {}\n".format(get_time_str(), self.firework_name))
-                f.write("\t\ttry to kill job via cmd {}\n".format(self.job_killing_cmd + " " + queue_id))
-                for ind, exist_status in enumerate(exist_status_list):
-                    f.write("\t\t\t{} try:\n".format(ind_dict[ind]))
-                    f.write("\t\t\t\t\texist-status: {}\n".format(exist_status))
-                    f.write("\t\t\t\t\terror: {}\n".format(error_list[ind]))
-                if exist_status_list[-1] == 0:
-                    f.write("\t\t\tSuccessfully kill the job.\n")
-                    f.write("\t\t\t__error__ --> __killed__\n")
-                else:
-                    f.write("\t\t\tThe cmd execution hits the maximum times (10)\n")
-                    if [stdout_file, stderr_file] != [None, None]:
-                        f.write("\t\t\tBut ")
-                        [f.write("{} ".format(f_name)) for f_name in [stdout_file, stderr_file] if f_name != None]
-                        f.write("is|are detected. So the job has been killed somehow...\n")
-                        f.write("\t\t\t__error__ --> __killed__\n")
-                        #f.write("***Let's create __manual__ for test purpose***\n")
-                        #open(os.path.join(self.cal_loc, "__manual__"), "w").close()
-                    else:
-                        f.write("\t\t\t__error__ --> __manual__\n")
-                f.write("\t\t\tmove back\n")
-            if exist_status_list[-1] == 0 or [stdout_file, stderr_file] != [None, None]:
-                decorated_os_rename(loc=self.cal_loc, old_filename="__error__", new_filename="__killed__")
-            else:
-                decorated_os_rename(loc=self.cal_loc, old_filename="__error__", new_filename="__manual__")
+        if self.is_killing_needed():
+            if Retry_policy.get(command_class="job_killing", workflow=self.workflow).is_circuit_open():
+                #The job killing command keeps failing. Leave __error__ as it is and try again after the circuit breaker cooldown.
+                return
+            cmd = self.job_killing_cmd +" "+ queue_id
+            exist_status_list, error_list = self._decorated_os_system(cmd=cmd, command_class="job_killing")
+            self.respond_to_killing(cmd=cmd, exist_status_list=exist_status_list, error_list=error_list)
         else:
+            self.respond_to_killing()
+            
+    def is_killing_needed(self):
+        """
+        Return False if the queue stdout or stderr file is found, i.e. the job has been terminated. Otherwise, return True.
+        In the latter case, file __error__ must be present under cal_loc.
+        """
+        if Queue_std_files(cal_loc=self.cal_loc, workflow=self.workflow).find_std_files() != [None, None]:
+            return False
+        if not os.path.isfile(os.path.join(self.cal_loc, "__error__")):
+            print("\n{} Kill: {}".format(get_time_str(), self.cal_loc))
+            print("\t\t\tTo kill this running job, file named __error__ must be present.\n")
+            raise Exception("See error information above.")
+        return True
+    
+    def respond_to_killing(self, cmd=None, exist_status_list=None, error_list=None, is_killed=None):
+        """
+        Write the result of killing the job into log.txt and change the signal file accordingly: __error__ --> __killed__ or __manual__
+        input arguments:
+            - cmd (str): the executed job killing command. None means that the job has been terminated and no need to kill. Default: None
+            - exist_status_list, error_list: the returns of method _decorated_os_system executing cmd.
+            - is_killed (bool): whether the job is killed. Default: None, i.e. whether the last exist status is 0.
+        """
+        if cmd == None:
             decorated_os_rename(loc=self.cal_loc, old_filename="__error__", new_filename="__killed__")
             #os.rename(os.path.join(self.cal_loc, "__error__"), os.path.join(self.cal_loc, "__killed__"))
             with open(self.log_txt, "a") as f:
                 f.write("{} Kill: the job has been terminated under {}\n".format(get_time_str(), self.firework_name))
                 f.write("\t\t\tSo no need to kill\n")
                 f.write("\t\t\t__error__ --> __killed__\n")
+            return
+        
+        if is_killed == None:
+            is_killed = exist_status_list[-1] == 0
+        stdout_file, stderr_file = Queue_std_files(cal_loc=self.cal_loc, workflow=self.workflow).find_std_files()
+        ind_dict = {0: "1st", 1: "2nd", 2: "3rd"}
+        ind_dict.update({i: '{}th'.format(i+1) for i in range(3, len(exist_status_list))})
+        with open(self.log_txt, "a") as f:
+            f.write("{} Kill: move to {}\n".format(get_time_str(), self.firework_name))
+            f.write("\t\ttry to kill job via cmd {}\n".format(cmd))
+            for ind, exist_status in enumerate(exist_status_list):
+                f.write("\t\t\t{} try:\n".format(ind_dict[ind]))
+                f.write("\t\t\t\t\texist-status: {}\n".format(exist_status))
+                f.write("\t\t\t\t\terror: {}\n".format(error_list[ind]))
+            if is_killed and exist_status_list[-1] != 0:
+                f.write("\t\t\tThe job is not in the queue any more. So it has been killed.\n")
+                f.write("\t\t\t__error__ --> __killed__\n")
+            elif is_killed:
+                f.write("\t\t\tSuccessfully kill the job.\n")
+                f.write("\t\t\t__error__ --> __killed__\n")
+            else:
+                f.write("\t\t\tThe cmd execution fails after {} tries\n".format(len(exist_status_list)))
+                if [stdout_file, stderr_file] != [None, None]:
+                    f.write("\t\t\tBut ")
+                    [f.write("{} ".format(f_name)) for f_name in [stdout_file, stderr_file] if f_name != None]
+                    f.write("is|are detected. So the job has been killed somehow...\n")
+                    f.write("\t\t\t__error__ --> __killed__\n")
+                    #f.write("***Let's create __manual__ for test purpose***\n")
+                    #open(os.path.join(self.cal_loc, "__manual__"), "w").close()
+                else:
+                    f.write("\t\t\t__error__ --> __manual__\n")
+            f.write("\t\t\tmove back\n")
+        if is_killed or [stdout_file, stderr_file] != [None, None]:
+            decorated_os_rename(loc=self.cal_loc, old_filename="__error__", new_filename="__killed__")
+        else:
+            decorated_os_rename(loc=self.cal_loc, old_filename="__error__", new_filename="__manual__")
                 
-    def _decorated_os_system(self, cmd, max_times=10):
+    def _decorated_os_system(self, cmd, command_class, max_times=None):
         """
         decorated os.system to tackle the cases where the cmd is not successfully executed.
         input argument:
             - cmd (str): required.
-            - max_times (int): the maximum times to try to execute cmd. 
-        cmd will be executed continuously until the exist status is 0 (successful).
+            - command_class (str): job_submission or job_killing, i.e. the Retry_policy by which cmd is executed.
+            - max_times (int): the maximum times to try to execute cmd. Default: None, i.e. set by the Retry_policy (HTC tag retry_max_tries)
+        cmd will be executed repeatedly with backoff until the exist status is 0 (successful). See HTC_lib/VASP/Miscellaneous/Retry_policy.py
+        If the stderr of a failed try does not look like a transient job scheduler failure (see Retry_policy.is_transient_error_message),
+            e.g. the job submission script is rejected, cmd is not tried again and the failure is not counted by the circuit breaker.
         output:
             a tuple of length 2:
                 - first entry: a list of exist statuses. If error happens, it is None
-                - second entry: a list of error information. If no error, it is None
+                - second entry: a list of error information, i.e. the raised exception or the stderr of a failed try. If no error, it is None
         """
-        dir0 = os.getcwd()
-        os.chdir(self.cal_loc)
-        exist_status_list, error_list = [], []
-        for i in range(max_times):
-            try:
-                status = os.system(cmd)
-            except Exception as err:
-                error_list.append(err)
-                exist_status_list.append(None)
-            else:
-                error_list.append(None)
-                exist_status_list.append(status)
-                if status == 0:
-                    break
-        os.chdir(dir0)
+        #cmd is executed under self.cal_loc via the cwd argument rather than os.chdir, which changes the working directory of the whole process
+        #and hence is not safe when jobs are submitted concurrently in threads (see submit_jobs_in_bulk).
+        def run_cmd():
+            completed_process = subprocess.run(cmd, shell=True, cwd=self.cal_loc, stderr=subprocess.PIPE, universal_newlines=True)
+            sys.stderr.write(completed_process.stderr)
+            return completed_process
+        
+        retry_policy = Retry_policy.get(command_class=command_class, workflow=self.workflow)
+        completed_process_list, error_list = retry_policy.execute(func=run_cmd, is_successful=lambda completed_process: completed_process.returncode == 0, 
+                                                                  max_tries=max_times, 
+                                                                  is_transient=lambda completed_process, err: completed_process == None or \
+                                                                  Retry_policy.is_transient_error_message(completed_process.stderr))
+        exist_status_list = [None if completed_process == None else completed_process.returncode for completed_process in completed_process_list]
+        for ind, completed_process in enumerate(completed_process_list):
+            if completed_process != None and completed_process.returncode != 0 and completed_process.stderr.strip() != "":
+                error_list[ind] = completed_process.stderr.strip()
         return exist_status_list, error_list
                 
                 
@@ -307,14 +415,11 @@ class Job_management():
                     f.write("\t\t\t\tremove {}\n".format(file_))
             f.write("\t\t\t\tremove the queue stdout and stderr files if found\n")
             Queue_std_files(cal_loc=self.cal_loc, workflow=self.workflow).remove_std_files()
+            #The cursors into the removed files must not be applied to the output files of the new run.
+            Tail_cursor.remove_sidecar(cal_loc=self.cal_loc)
         
-        dir0 = os.getcwd()
-        os.chdir(self.cal_loc)
-        assert os.path.isfile("INCAR"), "Error: no INCAR under {}".format(job_folder)
-        assert os.path.isfile("POTCAR"), "Error: no POTCAR under {}".format(job_folder)
-        assert os.path.isfile("KPOINTS"), "Error: no KPOINTS under {}".format(job_folder)
-        assert os.path.isfile("POSCAR"), "Error: no POSCAR under {}".format(job_folder)
-        os.chdir(dir0)
+        for vasp_input in ["INCAR", "POTCAR", "KPOINTS", "POSCAR"]:
+            assert os.path.isfile(os.path.join(self.cal_loc, vasp_input)), "Error: no {} under {}".format(vasp_input, self.cal_loc)
         
         
         job_submission_script = os.path.split(self.firework["job_submission_script"])[1]
@@ -327,9 +432,12 @@ class Job_management():
                 assert 1 == 2, "Error: Cannot find job submission script"
         
         signal_file = "__ready__" if os.path.isfile(os.path.join(self.cal_loc, "__ready__")) else "__prior_ready__"
-        exist_status_list, error_list = self._decorated_os_system(cmd=self.firework["job_submission_command"])
+        if Retry_policy.get(command_class="job_submission", workflow=self.workflow).is_circuit_open():
+            #The job submission command keeps failing. Leave the job as it is and try again after the circuit breaker cooldown.
+            return False
+        exist_status_list, error_list = self._decorated_os_system(cmd=self.firework["job_submission_command"], command_class="job_submission")
         ind_dict = {0: "1st", 1: "2nd", 2: "3rd"}
-        ind_dict.update({i: '{}th'.format(i+1) for i in range(3, 10)})
+        ind_dict.update({i: '{}th'.format(i+1) for i in range(3, len(exist_status_list))})
         with open(self.log_txt, "a") as f:
             f.write("{} Submit: move to {}\n".format(get_time_str(), self.firework_name))
             f.write("\t\ttry to submit job via cmd {}\n".format(self.firework["job_submission_command"]))
@@ -341,7 +449,7 @@ class Job_management():
                 f.write("\t\t\tSuccessfully submit the job.\n")
                 f.write("\t\t\t{} --> __running__\n".format(signal_file))
             else:
-                f.write("\t\t\tThe cmd execution hits the maximum times (10)\n")
+                f.write("\t\t\tThe cmd execution fails after {} tries\n".format(len(exist_status_list)))
                 f.write("\t\t\t{} --> __manual__\n".format(signal_file))
             f.write("\t\t\tmove back\n")
         if exist_status_list[-1] == 0:
@@ -365,6 +473,7 @@ class Job_management():
                     #os.rename(os.path.join(self.cal_loc, signal_file), os.path.join(self.cal_loc, "__error__"))
                     f.write("\t\t\t__running__ --> __error__\n".format(signal_file))
             return False
+        return True
                 
         
                     
@@ -71,22 +71,26 @@ def divide_a_list_evenly(a_list, no_of_sublists):
 
 
 class Cal_status_dict_operation():
+    
+    #The built-in signal files in the descending order of priority. A calculation tagged by more than one built-in signal files is
+    #categorized by the first one in this list. The calculation tagged by signal file __xyz__ is categorized into xyz_folder_list
+    signal_file_list = ["__done__",  "__done_cleaned_analyzed__", "__done_failed_to_clean_analyze__", "__manual__", "__test__", "__vis__", 
+                        "__skipped__", "__ready__", "__prior_ready__", "__sub_dir_cal__", "__error__", "__running__",  "__killed__", "__nkx_gt_ikptd__"]
+    #The status keys that are always present in the calculation status dict returned by check_calculations_status
+    status_list = [signal_file.strip("_") + "_folder_list" for signal_file in signal_file_list] + ["other_folder_list", "complete_folder_list"]
        
     @classmethod
     def merge_dicts(cls, a_list_of_dicts):
         """
         Merge a set of the dicts whose value is of type list.
         """
-        if len(a_list_of_dicts) == 0:
-            return {}
-        a_list_of_dicts = copy.deepcopy(a_list_of_dicts)
-        merged_dict = a_list_of_dicts[0]
-        for a_dict in a_list_of_dicts[1:]:
+        merged_dict = {}
+        for a_dict in a_list_of_dicts:
             for key, value in a_dict.items():
                 if key in merged_dict.keys():
                     merged_dict[key].extend(value)
                 else:
-                    merged_dict[key] = value
+                    merged_dict[key] = list(value) #a new list so that the input dicts are not modified. No deep copy is needed.
         for key, value in merged_dict.items():
             merged_dict[key] = sorted(set(value))
         return merged_dict
@@ -108,6 +112,8 @@ class Cal_status_dict_operation():
     
     @classmethod
     def reverse_cal_status_dict(cls, cal_status_dict):
+        if isinstance(cal_status_dict, Cal_status_store):
+            return dict(cal_status_dict.job_status_dict)
         reversed_cal_status_dict = {}
         for status, job_list in cal_status_dict.items():
             for job in job_list:
@@ -126,18 +132,15 @@ class Cal_status_dict_operation():
     
     @classmethod
     def diff_status_dict(cls, old_cal_status_dict, new_cal_status_dict): 
-        old_job_status_set = set([(job, status) for job, status in cls.reverse_cal_status_dict(old_cal_status_dict).items()])
-        new_job_status_set = set([(job, status) for job, status in cls.reverse_cal_status_dict(new_cal_status_dict).items()])
+        #The job-->status map of a Cal_status_store is used as it is, without being rebuilt.
+        old_job_status_dict = old_cal_status_dict.job_status_dict if isinstance(old_cal_status_dict, Cal_status_store) else cls.reverse_cal_status_dict(old_cal_status_dict)
+        new_job_status_dict = new_cal_status_dict.job_status_dict if isinstance(new_cal_status_dict, Cal_status_store) else cls.reverse_cal_status_dict(new_cal_status_dict)
         status_set = set(list(old_cal_status_dict.keys()) + list(new_cal_status_dict.keys()))
         
-        updated_dict = {}
-        for job_status_pair in new_job_status_set.difference(old_job_status_set):
-            updated_dict[job_status_pair[0]] = job_status_pair[1]
-            
-        removed_job_list = []
-        for job_status_pair in old_job_status_set.difference(new_job_status_set):
-            #if not os.path.isdir(job_status_pair[0]):
-            removed_job_list.append(job_status_pair[0])
+        updated_dict = {job: status for job, status in new_job_status_dict.items() if old_job_status_dict.get(job, None) != status}
+        
+        #if not os.path.isdir(job):
+        removed_job_list = [job for job, status in old_job_status_dict.items() if new_job_status_dict.get(job, None) != status]
         
         return {"updated": updated_dict, "removed": removed_job_list, "status_list": list(status_set)}
     void_cal_status_diff = {"updated": {}, "removed": [], "status_list": []}
@@ -155,6 +158,12 @@ class Cal_status_dict_operation():
     
     @classmethod
     def update_old_cal_status_dict(cls, old_cal_status_dict, cal_status_dict_diff):
+        """
+        Return the calculation status dict updated by cal_status_dict_diff.
+        If old_cal_status_dict is a Cal_status_store, it is updated IN PLACE in O(# of changed jobs) and returned. Otherwise, a new dict is returned.
+        """
+        if isinstance(old_cal_status_dict, Cal_status_store):
+            return old_cal_status_dict.apply_diff(cal_status_dict_diff)
         #cal_status_dict_diff = cls.diff_status_dict(old_cal_status_dict, new_cal_status_dict)
         reversed_old_cal_status_dict = cls.reverse_cal_status_dict(old_cal_status_dict)
         status_list = list(old_cal_status_dict.keys()) + cal_status_dict_diff["status_list"]
@@ -173,7 +182,12 @@ class Cal_status_dict_operation():
         
         with open(filename, "w") as f:
             f.write("#{}\n".format(get_time_str()))
-            json.dump(cal_status, f, indent=4)
+            json.dump({status: job_list for status, job_list in cal_status.items()}, f, indent=4) #The job lists of a Cal_status_store are materialised here.
+        
+        #The full snapshot supersedes the status journal, if any. See Cal_status_journal
+        journal_filename = Cal_status_journal.get_journal_filename(filename)
+        if os.path.isfile(journal_filename):
+            os.remove(journal_filename)
             
         folder_name = filename.replace(".json", "") + "_folder"
         if os.path.isdir(folder_name):
@@ -199,12 +213,167 @@ class Cal_status_dict_operation():
         status_list = []
         
         
-        for status, job_list in cal_status.items():
-            if len(job_list) > 0 and status not in status_tail and status not in screened_status_list:
+        for status in cal_status.keys():
+            if cls.get_no_of_jobs(cal_status, status) > 0 and status not in status_tail and status not in screened_status_list:
                 status_list.append(status)
         status_list.extend(status_tail)
         
         return status_list
+    
+    @classmethod
+    def get_no_of_jobs(cls, cal_status, status):
+        """
+        Return the number of jobs of a given status. It is O(1) for both a Cal_status_store and a dict. 0 is returned if status is absent.
+        """
+        if isinstance(cal_status, Cal_status_store):
+            return cal_status.count(status)
+        return len(cal_status.get(status, []))
+
+
+# In[8]:
+
+
+class Cal_status_store():
+    """
+    A calculation status container which can be used wherever a calculation status dict (status --> a sorted list of jobs) is used.
+    The job --> status map is kept as the primary structure, together with a per-status ordered set of jobs (dicts with None values).
+        - method apply_diff applies a calculation status diff in O(# of changed jobs), rather than rebuilding the whole dict
+            as Cal_status_dict_operation.update_old_cal_status_dict does for a dict.
+        - method count returns the number of jobs of a status in O(1)
+        - the sorted job list of a status is only materialised when it is read (e.g. cal_status["ready_folder_list"] or by write_cal_status),
+            and is cached until the jobs of that status change.
+    Note that the job list returned by cal_status[status] is the cached one and should NOT be modified in place. Use cal_status[status] = new_job_list instead.
+    
+    input argument:
+        - cal_status_dict (dict or Cal_status_store): the initial calculation status. Default: None
+    """
+    def __init__(self, cal_status_dict=None):
+        self.job_status_dict = {} #job --> status
+        self.status_job_dict = {} #status --> {job: None}
+        self._sorted_job_list_dict = {} #status --> the cached sorted job list
+        if cal_status_dict != None:
+            for status in cal_status_dict.keys():
+                self._add_status(status)
+            for job, status in Cal_status_dict_operation.reverse_cal_status_dict(cal_status_dict).items():
+                self._set_job_status(job, status)
+    
+    def __getstate__(self):
+        #The cached sorted job lists are not pickled, e.g. when the store is broadcasted via mpi4py.
+        return {"job_status_dict": self.job_status_dict, "status_job_dict": self.status_job_dict}
+    
+    def __setstate__(self, state):
+        self.job_status_dict = state["job_status_dict"]
+        self.status_job_dict = state["status_job_dict"]
+        self._sorted_job_list_dict = {}
+    
+    def _add_status(self, status):
+        if status not in self.status_job_dict.keys():
+            self.status_job_dict[status] = {}
+    
+    def _remove_job(self, job):
+        status = self.job_status_dict.pop(job, None)
+        if status != None:
+            del self.status_job_dict[status][job]
+            self._sorted_job_list_dict.pop(status, None)
+    
+    def _set_job_status(self, job, status):
+        old_status = self.job_status_dict.get(job, None)
+        if old_status == status:
+            return
+        if old_status != None:
+            del self.status_job_dict[old_status][job]
+            self._sorted_job_list_dict.pop(old_status, None)
+        self._add_status(status)
+        self.status_job_dict[status][job] = None
+        self._sorted_job_list_dict.pop(status, None)
+        self.job_status_dict[job] = status
+    
+    def apply_diff(self, cal_status_diff):
+        """
+        Apply a calculation status diff returned by Cal_status_dict_operation.diff_status_dict (or merge_cal_status_diff) in place and return self.
+        Consistent with Cal_status_dict_operation.update_old_cal_status_dict, the removed jobs are removed first and then the updated jobs are set.
+        """
+        for status in cal_status_diff["status_list"]:
+            self._add_status(status)
+        for job in cal_status_diff["removed"]:
+            self._remove_job(job)
+        for job, status in cal_status_diff["updated"].items():
+            self._set_job_status(job, status)
+        return self
+    
+    def count(self, status):
+        return len(self.status_job_dict.get(status, {}))
+    
+    def get_status(self, job):
+        """
+        Return the status of job. None if job is absent.
+        """
+        return self.job_status_dict.get(job, None)
+    
+    def __getitem__(self, status):
+        if status not in self.status_job_dict.keys():
+            raise KeyError(status)
+        job_list = self._sorted_job_list_dict.get(status, None)
+        if job_list == None:
+            job_list = sorted(self.status_job_dict[status])
+            self._sorted_job_list_dict[status] = job_list
+        return job_list
+    
+    def __setitem__(self, status, job_list):
+        """
+        Set the jobs of status to job_list. The jobs originally of status but absent from job_list are removed.
+        The jobs in job_list but originally of another status are moved to status.
+        """
+        self._add_status(status)
+        job_set = set(job_list)
+        for job in [job for job in self.status_job_dict[status] if job not in job_set]:
+            self._remove_job(job)
+        for job in job_list:
+            self._set_job_status(job, status)
+    
+    def get(self, status, default=None):
+        return self[status] if status in self.keys() else default
+    
+    def keys(self):
+        return self.status_job_dict.keys()
+    
+    def values(self):
+        return [self[status] for status in self.status_job_dict.keys()]
+    
+    def items(self):
+        return [(status, self[status]) for status in self.status_job_dict.keys()]
+    
+    def __contains__(self, status):
+        return status in self.status_job_dict.keys()
+    
+    def __iter__(self):
+        return iter(self.status_job_dict.keys())
+    
+    def __len__(self):
+        return len(self.status_job_dict)
+    
+    def __eq__(self, other):
+        """
+        Two calculation status are equal if every job has the same status. other can be either a Cal_status_store or a dict.
+        """
+        if isinstance(other, Cal_status_store):
+            return self.job_status_dict == other.job_status_dict
+        if isinstance(other, dict):
+            return self.job_status_dict == Cal_status_dict_operation.reverse_cal_status_dict(other)
+        return NotImplemented
+    
+    def copy(self):
+        """
+        Return an independent copy, e.g. as the snapshot to be compared with the updated calculation status later.
+        """
+        cal_status_store = Cal_status_store()
+        cal_status_store.job_status_dict = dict(self.job_status_dict)
+        cal_status_store.status_job_dict = {status: dict(job_dict) for status, job_dict in self.status_job_dict.items()}
+        cal_status_store._sorted_job_list_dict = dict(self._sorted_job_list_dict)
+        return cal_status_store
+    
+    def to_dict(self):
+        return {status: list(self[status]) for status in self.keys()}
 
 
 # def merge_dicts(a_list_of_dicts):
@@ -289,3 +458,99 @@ if __name__ == "__main__":
     
     print(Cal_status_dict_operation.update_old_cal_status_dict(A_dict, dict_diff))
 
+
+# In[9]:
+
+
+class Cal_status_journal():
+    """
+    Write the calculation status to filename (htc_job_status.json) in the journal mode.
+    Instead of rewriting the whole snapshot (filename) and the per-status files under the snapshot folder (see Cal_status_dict_operation.write_cal_status)
+    on every call of method write, the difference from the last written calculation status (see Cal_status_dict_operation.diff_status_dict) is appended
+    to the journal file as one JSON line (JSONL). Nothing is written if the calculation status is unchanged.
+    The snapshot and the per-status files are regenerated (compacted) only after every compaction_interval journal records, by method compact, or
+    by method close when the htc main script stops. The journal file is then removed.
+    Every intermediate calculation status can be recovered from the snapshot and the journal records by method recover.
+    
+    input arguments:
+        - filename (str): the absolute path to the snapshot, e.g. ${HTC_CWD}/htc_job_status.json
+        - compaction_interval (int): the snapshot is regenerated after every compaction_interval journal records.
+            If compaction_interval <= 1, the journal mode is off and every write is a full rewrite by Cal_status_dict_operation.write_cal_status
+            Default: 0
+    """
+    def __init__(self, filename, compaction_interval=0):
+        self.filename = filename
+        self.journal_filename = self.get_journal_filename(filename)
+        self.compaction_interval = compaction_interval
+        self.no_of_records = 0
+        self.last_cal_status = None #The calculation status last written, i.e. the snapshot + all journal records.
+    
+    @classmethod
+    def get_journal_filename(cls, filename):
+        return filename.replace(".json", "") + "_journal.jsonl"
+    
+    def write(self, cal_status):
+        """
+        Append the difference between cal_status and the last written calculation status to the journal, and compact every compaction_interval records.
+        The first write of a Cal_status_journal instance is always a compaction.
+        """
+        if self.compaction_interval <= 1 or self.last_cal_status == None:
+            self.compact(cal_status)
+            return
+        cal_status_diff = Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=self.last_cal_status, new_cal_status_dict=cal_status)
+        cal_status_diff["status_list"] = [status for status in cal_status_diff["status_list"] if status not in self.last_cal_status.keys()]
+        if not cal_status_diff["updated"] and not cal_status_diff["removed"] and not cal_status_diff["status_list"]:
+            return
+        with open(self.journal_filename, "a") as f:
+            f.write(json.dumps({"time": get_time_str(), "updated": cal_status_diff["updated"], "removed": cal_status_diff["removed"], 
+                                "status_list": cal_status_diff["status_list"]}) + "\n")
+        self.last_cal_status.apply_diff(cal_status_diff)
+        self.no_of_records += 1
+        if self.no_of_records >= self.compaction_interval:
+            self.compact(cal_status)
+    
+    def compact(self, cal_status):
+        """
+        Regenerate the snapshot and the per-status files from cal_status and remove the journal file.
+        """
+        Cal_status_dict_operation.write_cal_status(cal_status=cal_status, filename=self.filename) #The journal file is removed therein.
+        if self.compaction_interval > 1:
+            self.last_cal_status = Cal_status_store(cal_status)
+        self.no_of_records = 0
+    
+    def close(self, cal_status):
+        """
+        Compact if there is any journal record. Call it when the htc main script stops.
+        """
+        if self.no_of_records > 0:
+            self.compact(cal_status)
+    
+    @classmethod
+    def recover(cls, filename):
+        """
+        Recover the last written calculation status from the snapshot filename and the journal records appended after it.
+        An incomplete last journal line (e.g. the htc main script was killed while writing it) is ignored.
+        Return the recovered calculation status dict, or None if the snapshot does not exist or cannot be parsed.
+        """
+        try:
+            with open(filename, "r") as f:
+                #Skip the time line at the beginning and the final remarks (***...***) appended by the htc main scripts at the end.
+                lines = [line for line in f if not line.startswith("#") and not line.startswith("***")]
+            cal_status = json.loads("".join(lines))
+        except (IOError, ValueError):
+            return None
+        if not isinstance(cal_status, dict):
+            return None
+        cal_status = Cal_status_store(cal_status)
+        
+        journal_filename = cls.get_journal_filename(filename)
+        if os.path.isfile(journal_filename):
+            with open(journal_filename, "r") as f:
+                for line in f:
+                    try:
+                        cal_status_diff = json.loads(line)
+                    except ValueError:
+                        print("{}: Ignore an incomplete record in {}: {}".format(get_time_str(), journal_filename, line), flush=True)
+                        break
+                    cal_status.apply_diff(cal_status_diff)
+        return cal_status.to_dict()
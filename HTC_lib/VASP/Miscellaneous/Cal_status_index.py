@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[1]:
+
+
+import os, re, time, sqlite3, threading
+from contextlib import closing
+
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation
+
+
+# In[2]:
+
+
+class Cal_status_index():
+    """
+    A persistent calculation status index stored in an embedded SQLite database (python standard library sqlite3).
+    Each row records a calculation (or a material folder for complete_folder_list), its step, its status and the last-seen mtime:
+        - cal_loc (str): the absolute path to the calculation. It is the primary key.
+        - mat_folder (str): the material folder name parsed from cal_loc. None if it cannot be parsed.
+        - step (str): the firework folder name (step_x_xxx) parsed from cal_loc. None if it cannot be parsed.
+        - status (str): the status key used in the calculation status dict, e.g. running_folder_list
+        - mtime (float): the mtime of cal_loc when the row was written.
+
+    The index is kept up to date in two ways:
+        1. Every signal file transition made through Utilities.decorated_os_rename is recorded by Cal_status_index.record_signal_file_transition.
+            Because decorated_os_rename only knows the calculation folder, the index is located through the environment variable
+            Cal_status_index.env_var_name, which is set by method activate. The environment variable is inherited by the child processes
+            (ProcessPoolExecutor workers, sub_dir_cal_cmd, ...), so that their transitions are recorded as well.
+        2. The htc main scripts apply every calculation status diff via apply_cal_status_diff and the result of every full scan via reconcile.
+    With the index, the htc main scripts could read the calculation status from the index at start-up instead of scanning all calculations.
+    A full scan (__scan_all__) is then only needed for reconciliation.
+
+    input arguments:
+        - db_filename (str): the absolute path to the SQLite database file. It is created if not existent.
+        - timeout (float): how many seconds a connection waits for a lock held by another process. Default: 60
+    """
+    env_var_name = "HTC_CAL_STATUS_INDEX"
+    _connection_dict = {} #(pid, db_filename) --> the connection shared by record_signal_file_transition in this process
+    _connection_lock = threading.Lock()
+
+    def __init__(self, db_filename, timeout=60):
+        self.db_filename = db_filename
+        self.timeout = timeout
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS cal_status (cal_loc TEXT PRIMARY KEY, mat_folder TEXT, step TEXT, status TEXT NOT NULL, mtime REAL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS cal_status_status_index ON cal_status (status)")
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_filename, timeout=self.timeout)
+
+    @classmethod
+    def parse_mat_folder_and_step(cls, cal_loc):
+        """
+        Return (mat_folder, step) parsed from cal_loc, where step is the LAST folder name starting with 'step_x_' (x is a number) and
+        mat_folder is the name of its parent folder. This is consistent with Utilities.get_mat_folder_name_from_cal_loc.
+        Return (None, None) if there is no such folder name in cal_loc (e.g. material folders in complete_folder_list)
+        """
+        head, tail = os.path.split(os.path.normpath(cal_loc))
+        while tail:
+            if re.match(r"step_\d+_", tail):
+                return os.path.split(head)[1], tail
+            head, tail = os.path.split(head)
+        return None, None
+
+    @classmethod
+    def _get_mtime(cls, cal_loc):
+        try:
+            return os.stat(cal_loc).st_mtime
+        except OSError:
+            return None
+
+    @classmethod
+    def _build_row(cls, cal_loc, status):
+        mat_folder, step = cls.parse_mat_folder_and_step(cal_loc)
+        return (cal_loc, mat_folder, step, status, cls._get_mtime(cal_loc))
+
+    def update_status(self, cal_loc, status):
+        """
+        Insert or update the status of the calculation under cal_loc.
+        """
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO cal_status VALUES (?, ?, ?, ?, ?)", self._build_row(cal_loc, status))
+
+    def apply_cal_status_diff(self, cal_status_diff):
+        """
+        Apply a calculation status diff returned by Cal_status_dict_operation.diff_status_dict (or merge_cal_status_diff) to the index.
+        Consistent with Cal_status_dict_operation.update_old_cal_status_dict, the removed jobs are deleted first and then the updated jobs are upserted.
+        """
+        if not cal_status_diff["removed"] and not cal_status_diff["updated"]:
+            return
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.executemany("DELETE FROM cal_status WHERE cal_loc = ?", [(job,) for job in cal_status_diff["removed"]])
+                conn.executemany("INSERT OR REPLACE INTO cal_status VALUES (?, ?, ?, ?, ?)",
+                                 [self._build_row(job, status) for job, status in cal_status_diff["updated"].items()])
+
+    def reconcile(self, cal_status_dict):
+        """
+        Replace the whole index with cal_status_dict, which should be the result of a full scan (check_calculations_status).
+        The reconciliation time is saved and can be retrieved by get_last_reconciliation_time.
+        """
+        row_list = []
+        for status, job_list in cal_status_dict.items():
+            row_list.extend([self._build_row(job, status) for job in job_list])
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("DELETE FROM cal_status")
+                conn.executemany("INSERT OR REPLACE INTO cal_status VALUES (?, ?, ?, ?, ?)", row_list)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_reconciliation_time', ?)", (str(time.time()),))
+
+    def get_last_reconciliation_time(self):
+        """
+        Return the time (in seconds since the epoch) of the last reconciliation. Return None if the index has never been reconciled.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'last_reconciliation_time'").fetchone()
+        return None if row is None else float(row[0])
+
+    def is_empty(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT 1 FROM cal_status LIMIT 1").fetchone()
+        return row is None
+
+    def load_cal_status_dict(self):
+        """
+        Read the calculation status dict from the index. As the return of check_calculations_status, the job list of every status is sorted
+        and the status keys in Cal_status_dict_operation.status_list are always present.
+        """
+        cal_status_dict = {status: [] for status in Cal_status_dict_operation.status_list}
+        with closing(self._connect()) as conn:
+            for cal_loc, status in conn.execute("SELECT cal_loc, status FROM cal_status ORDER BY cal_loc"):
+                if status in cal_status_dict.keys():
+                    cal_status_dict[status].append(cal_loc)
+                else:
+                    cal_status_dict[status] = [cal_loc]
+        return cal_status_dict
+
+    def activate(self):
+        """
+        Set the environment variable Cal_status_index.env_var_name to the database path so that every signal file transition
+        made through Utilities.decorated_os_rename in this process and its child processes is recorded in this index.
+        """
+        os.environ[self.env_var_name] = self.db_filename
+
+    @classmethod
+    def _get_process_connection(cls, db_filename):
+        """
+        Return the connection to db_filename cached for this process, whose schema has been initialised when it was opened.
+        The key contains the process ID, so that a forked child process (e.g. a ProcessPoolExecutor worker) opens its own connection
+            rather than using the one inherited from its parent. The caller must hold cls._connection_lock, which serialises the threads of this process.
+        """
+        key = (os.getpid(), db_filename)
+        conn = cls._connection_dict.get(key, None)
+        if conn == None:
+            cal_status_index = Cal_status_index(db_filename)
+            conn = sqlite3.connect(db_filename, timeout=cal_status_index.timeout, check_same_thread=False)
+            cls._connection_dict[key] = conn
+        return conn
+
+    @classmethod
+    def record_signal_file_transition(cls, loc, new_filename):
+        """
+        Record the signal file transition to new_filename under loc into the activated index (see method activate).
+        Nothing is done if no index is activated, if new_filename is not a signal file (starting and ending with a double underscore)
+        or if loc is not a calculation folder (no folder name starting with 'step_x_').
+        A failure of the index never stops the transition itself. It is just reported and fixed by the next reconciliation.
+        Only the upsert is executed per transition: the connection is opened and the schema is initialised once per process (see _get_process_connection).
+        """
+        db_filename = os.environ.get(cls.env_var_name, "")
+        if not db_filename or not os.path.isfile(db_filename):
+            return
+        if len(new_filename) <= 4 or not (new_filename.startswith("__") and new_filename.endswith("__")):
+            return
+        if cls.parse_mat_folder_and_step(loc)[1] is None:
+            return
+        try:
+            row = cls._build_row(cal_loc=loc, status=new_filename.strip("_") + "_folder_list")
+            with cls._connection_lock:
+                conn = cls._get_process_connection(db_filename)
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO cal_status VALUES (?, ?, ?, ?, ?)", row)
+        except sqlite3.Error as err:
+            print("Fail to record {} under {} into the calculation status index {}: {}".format(new_filename, loc, db_filename, err), flush=True)
+
+    @classmethod
+    def from_workflow(cls, workflow):
+        """
+        Return the activated calculation status index ${HTC_CWD}/htc_job_status.sqlite3 if HTC tag cal_status_index is on in the first step.
+        Otherwise, deactivate any previously activated index and return None.
+        """
+        if not workflow[0]["cal_status_index"]:
+            os.environ.pop(cls.env_var_name, None)
+            return None
+        cal_status_index = Cal_status_index(os.path.join(workflow[0]["htc_cwd"], "htc_job_status.sqlite3"))
+        cal_status_index.activate()
+        return cal_status_index
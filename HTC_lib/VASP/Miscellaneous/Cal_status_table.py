@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[1]:
+
+
+import numpy as np
+
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation, Cal_status_store
+
+
+# In[2]:
+
+
+class Cal_status_table(Cal_status_store):
+    """
+    A compact calculation status container for a large number of calculations, which can be used wherever a Cal_status_store is used.
+        - path table: every calculation (absolute path) is interned once and identified by an integer ID (numpy.int32), i.e. its index in job_list.
+            An ID never changes, even if the calculation is removed.
+        - status table: every status (e.g. ready_folder_list) is identified by an integer code (numpy.uint8), i.e. its index in status_list.
+            Code 0 is reserved for the absent (removed) calculations. Hence, at most 255 statuses are supported.
+        - state array: a numpy.uint8 array indexed by ID. state_array[ID] is the status code of that calculation.
+    Counting the calculations of all statuses is a single vectorised numpy.bincount, which is cached until the state array changes.
+    As Cal_status_store, the sorted job list of a status is only materialised when it is read and is cached until the jobs of that status change.
+
+    A calculation status diff (see Cal_status_dict_operation.diff_status_dict) can be encoded into (ID, new status code) pairs by method encode_diff
+    and applied by method apply_encoded_diff. Since the encoded diff carries the newly interned calculations and statuses, a replica of a
+    Cal_status_table (e.g. in another MPI process) stays consistent by applying the same encoded diffs in the same order, without exchanging any path
+    of the already-interned calculations.
+
+    input argument:
+        - cal_status_dict (dict or Cal_status_store): the initial calculation status. Default: None
+    """
+    max_no_of_statuses = 255
+
+    def __init__(self, cal_status_dict=None):
+        self.job_list = [] #ID --> job
+        self.job_id_dict = {} #job --> ID
+        self.status_list = [None] #status code --> status. Code 0 means absent.
+        self.status_code_dict = {} #status --> status code
+        self.state_array = np.zeros(1024, dtype=np.uint8)
+        self._sorted_job_list_dict = {}
+        self._count_array = None
+        if cal_status_dict != None:
+            for status in cal_status_dict.keys():
+                self._add_status(status)
+            for job, status in Cal_status_dict_operation.reverse_cal_status_dict(cal_status_dict).items():
+                self._set_job_status(job, status)
+
+    def __getstate__(self):
+        no_of_jobs = len(self.job_list)
+        return {"job_list": self.job_list, "status_list": self.status_list, "state_array": self.state_array[:no_of_jobs]}
+
+    def __setstate__(self, state):
+        self.job_list = state["job_list"]
+        self.job_id_dict = {job: job_id for job_id, job in enumerate(self.job_list)}
+        self.status_list = state["status_list"]
+        self.status_code_dict = {status: code for code, status in enumerate(self.status_list) if code > 0}
+        self.state_array = np.zeros(max([1024, 2 * len(self.job_list)]), dtype=np.uint8)
+        self.state_array[:len(self.job_list)] = state["state_array"]
+        self._sorted_job_list_dict = {}
+        self._count_array = None
+
+    def _get_state_array(self):
+        return self.state_array[:len(self.job_list)]
+
+    def _invalidate_cache(self, status_code):
+        self._sorted_job_list_dict.pop(self.status_list[status_code], None)
+        self._count_array = None
+
+    def _add_status(self, status):
+        if status not in self.status_code_dict.keys():
+            assert len(self.status_list) <= self.max_no_of_statuses, "Cal_status_table supports at most {} statuses.".format(self.max_no_of_statuses)
+            self.status_code_dict[status] = len(self.status_list)
+            self.status_list.append(status)
+            self._count_array = None
+        return self.status_code_dict[status]
+
+    def _intern_job(self, job):
+        job_id = self.job_id_dict.get(job, None)
+        if job_id == None:
+            job_id = len(self.job_list)
+            if job_id == len(self.state_array):
+                self.state_array = np.concatenate([self.state_array, np.zeros(len(self.state_array), dtype=np.uint8)])
+            self.job_list.append(job)
+            self.job_id_dict[job] = job_id
+        return job_id
+
+    def _set_state(self, job_id, status_code):
+        old_status_code = self.state_array[job_id]
+        if old_status_code != status_code:
+            if old_status_code > 0:
+                self._invalidate_cache(old_status_code)
+            if status_code > 0:
+                self._invalidate_cache(status_code)
+            self.state_array[job_id] = status_code
+
+    def _remove_job(self, job):
+        job_id = self.job_id_dict.get(job, None)
+        if job_id != None:
+            self._set_state(job_id, 0)
+
+    def _set_job_status(self, job, status):
+        self._set_state(self._intern_job(job), self._add_status(status))
+
+    @property
+    def job_status_dict(self):
+        """
+        The job --> status map. Note that it is built on request.
+        """
+        state_array = self._get_state_array()
+        job_id_array = np.flatnonzero(state_array)
+        return {self.job_list[job_id]: self.status_list[status_code] for job_id, status_code in zip(job_id_array, state_array[job_id_array])}
+
+    def count(self, status):
+        status_code = self.status_code_dict.get(status, None)
+        if status_code == None:
+            return 0
+        if self._count_array is None:
+            self._count_array = np.bincount(self._get_state_array(), minlength=len(self.status_list))
+        return int(self._count_array[status_code])
+
+    def get_status(self, job):
+        job_id = self.job_id_dict.get(job, None)
+        return None if job_id == None else self.status_list[self.state_array[job_id]]
+
+    def __getitem__(self, status):
+        if status not in self.status_code_dict.keys():
+            raise KeyError(status)
+        job_list = self._sorted_job_list_dict.get(status, None)
+        if job_list == None:
+            job_id_array = np.flatnonzero(self._get_state_array() == self.status_code_dict[status])
+            job_list = sorted([self.job_list[job_id] for job_id in job_id_array])
+            self._sorted_job_list_dict[status] = job_list
+        return job_list
+
+    def __setitem__(self, status, job_list):
+        status_code = self._add_status(status)
+        job_set = set(job_list)
+        for job in [job for job in self[status] if job not in job_set]:
+            self._remove_job(job)
+        for job in job_list:
+            self._set_state(self._intern_job(job), status_code)
+
+    def keys(self):
+        return self.status_code_dict.keys()
+
+    def values(self):
+        return [self[status] for status in self.status_code_dict.keys()]
+
+    def items(self):
+        return [(status, self[status]) for status in self.status_code_dict.keys()]
+
+    def __contains__(self, status):
+        return status in self.status_code_dict.keys()
+
+    def __iter__(self):
+        return iter(self.status_code_dict.keys())
+
+    def __len__(self):
+        return len(self.status_code_dict)
+
+    def copy(self):
+        state = self.__getstate__()
+        cal_status_table = Cal_status_table()
+        cal_status_table.__setstate__({"job_list": list(state["job_list"]), "status_list": list(state["status_list"]), "state_array": state["state_array"]})
+        return cal_status_table
+
+    def encode_diff(self, cal_status_diff):
+        """
+        Encode a calculation status diff into (ID, new status code) pairs. New calculations and statuses are interned here, but the state array is untouched.
+        return a dict having keys below:
+            - first_new_job_id (int): the ID of the first newly interned calculation, i.e. the number of interned calculations before encoding
+            - new_job_list (list): the newly interned calculations in the order of their IDs.
+            - first_new_status_code (int) and new_status_list (list): similar to the above, but for the newly interned statuses.
+            - id_array (numpy.int32 array) and code_array (numpy.uint8 array): the calculation IDs and their new status codes. Code 0 means removed.
+        Consistent with Cal_status_dict_operation.update_old_cal_status_dict, the removed calculations are handled first and then the updated ones.
+        """
+        first_new_job_id, first_new_status_code = len(self.job_list), len(self.status_list)
+        for status in cal_status_diff["status_list"]:
+            self._add_status(status)
+        job_id_status_code_dict = {}
+        for job in cal_status_diff["removed"]:
+            job_id = self.job_id_dict.get(job, None)
+            if job_id != None:
+                job_id_status_code_dict[job_id] = 0
+        for job, status in cal_status_diff["updated"].items():
+            job_id_status_code_dict[self._intern_job(job)] = self._add_status(status)
+        return {"first_new_job_id": first_new_job_id, "new_job_list": self.job_list[first_new_job_id:],
+                "first_new_status_code": first_new_status_code, "new_status_list": self.status_list[first_new_status_code:],
+                "id_array": np.array(list(job_id_status_code_dict.keys()), dtype=np.int32),
+                "code_array": np.array(list(job_id_status_code_dict.values()), dtype=np.uint8)}
+
+    def apply_encoded_diff(self, encoded_cal_status_diff):
+        """
+        Apply a diff encoded by method encode_diff of this Cal_status_table or of an identical replica, and return self.
+        """
+        for status_code, status in enumerate(encoded_cal_status_diff["new_status_list"], start=encoded_cal_status_diff["first_new_status_code"]):
+            if status_code == len(self.status_list):
+                self._add_status(status)
+            assert self.status_list[status_code] == status, "The encoded calculation status diff is inconsistent with this Cal_status_table."
+        for job_id, job in enumerate(encoded_cal_status_diff["new_job_list"], start=encoded_cal_status_diff["first_new_job_id"]):
+            if job_id == len(self.job_list):
+                self._intern_job(job)
+            assert self.job_list[job_id] == job, "The encoded calculation status diff is inconsistent with this Cal_status_table."
+
+        id_array, code_array = encoded_cal_status_diff["id_array"], encoded_cal_status_diff["code_array"]
+        if len(id_array):
+            changed_code_array = np.concatenate([self.state_array[id_array], code_array])
+            for status_code in np.unique(changed_code_array[changed_code_array > 0]):
+                self._invalidate_cache(status_code)
+            self._count_array = None
+            self.state_array[id_array] = code_array
+        return self
+
+    def apply_diff(self, cal_status_diff):
+        return self.apply_encoded_diff(self.encode_diff(cal_status_diff))
+
+    def get_partition(self, part_ind, no_of_parts):
+        """
+        Return the part_ind-th of no_of_parts disjoint sub dicts of the calculation status, where a calculation goes to the part indexed by its ID modulo no_of_parts.
+        Every status key is present in every part. Since IDs never change, a calculation always stays in the same part, and identical replicas of a
+        Cal_status_table (e.g. in different MPI processes) can compute their own parts locally without any communication.
+        """
+        state_array = self._get_state_array()
+        job_id_array = np.arange(part_ind, len(state_array), no_of_parts)
+        job_id_array = job_id_array[state_array[job_id_array] > 0]
+        code_array = state_array[job_id_array]
+        partition = {}
+        for status, status_code in self.status_code_dict.items():
+            partition[status] = sorted([self.job_list[job_id] for job_id in job_id_array[code_array == status_code]])
+        return partition
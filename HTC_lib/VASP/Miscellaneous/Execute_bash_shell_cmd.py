@@ -17,6 +17,7 @@ if HTC_package_path not in sys.path:
 
 
 from HTC_lib.VASP.Miscellaneous.Utilities import decorated_os_system, get_time_str, get_mat_folder_name_from_cal_loc
+from HTC_lib.VASP.Miscellaneous.Retry_policy import Retry_policy
 
 
 # In[6]:
@@ -61,10 +62,12 @@ def Execute_shell_cmd(cal_loc, user_defined_cmd_list, where_to_execute, defined_
                 f.write("\t\t\t>>>Command {}: {}\n".format(cmd_ind, cmd_))
                 
             os.chdir(where_to_execute)
-            for i in range(10): #To avoid the case where the server is too busy to respond to the command. Hope the server is able to respond to either of the 10 trails.
-                result = subprocess.run(cmd_, text=True, capture_output=True, shell=True)
-                if result.returncode == 0:
-                    break
+            #To avoid the case where the server is too busy to respond to the command, a failed command is retried with short backoff. See Retry_policy
+            result_list, error_list = Retry_policy.get(command_class="shell_cmd").execute(func=lambda: subprocess.run(cmd_, text=True, capture_output=True, shell=True), 
+                                                                                         is_successful=lambda result: result.returncode == 0)
+            result = result_list[-1]
+            if result == None:
+                result = subprocess.CompletedProcess(args=cmd_, returncode=-1, stdout="", stderr=str(error_list[-1]))
             os.chdir(current_dir)
             
             if result.returncode != 0:
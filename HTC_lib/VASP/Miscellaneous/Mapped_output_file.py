@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Memory-mapped read-only access to the VASP output files (e.g. OUTCAR and vasp.out) on bytes
+
+# In[1]:
+
+
+import os, mmap
+
+
+# In[2]:
+
+
+class Mapped_output_file():
+    """
+    Memory-map a VASP output file (e.g. OUTCAR and vasp.out) and search it on bytes, so that a search never decodes the whole file into text.
+    The file is mapped as it is at the time of opening. Bytes appended later are not visible.
+    input arguments:
+        - file_path (str): the path to the file.
+    Methods:
+        - find_first(pattern, start=0, end=None): return the offset of the first match of pattern in [start, end), or -1 if not found.
+        - find_last(pattern, start=0, end=None): return the offset of the last match of pattern in [start, end), or -1 if not found.
+        - get_line(offset): return the line (bytes, without the trailing newline) containing offset. b"" for an empty file.
+        - iter_blocks_after(offset, block_size=None): yield [block_offset, block] from offset to the end of the file. Every block
+                    but the last one ends with a newline, so no line is split between two blocks.
+    pattern is either a bytes string or a compiled bytes regex. A regex pattern must not span more than one line.
+    Note that an empty file cannot be mapped: every search on it returns -1 and it has no block.
+    Use it as a context manager, or call method close when done:
+        >>>with Mapped_output_file(os.path.join(cal_loc, "OUTCAR")) as outcar:
+        >>>    offset = outcar.find_last(b"E-fermi")
+    """
+    block_size = 1 << 24 #16 MB
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.f = open(file_path, "rb")
+        self.size = os.fstat(self.f.fileno()).st_size
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.mm != None:
+            self.mm.close()
+            self.mm = None
+        self.f.close()
+
+    def find_first(self, pattern, start=0, end=None):
+        end = self.size if end == None else min(end, self.size)
+        if self.mm == None or start >= end:
+            return -1
+        if isinstance(pattern, bytes):
+            return self.mm.find(pattern, start, end)
+        match = pattern.search(self.mm, start, end)
+        return -1 if match == None else match.start()
+
+    def find_last(self, pattern, start=0, end=None):
+        end = self.size if end == None else min(end, self.size)
+        if self.mm == None or start >= end:
+            return -1
+        if isinstance(pattern, bytes):
+            return self.mm.rfind(pattern, start, end)
+        #Search the line-aligned windows backwards from the end, so that only the tail of the file is read if the pattern is near the end.
+        window_end = end
+        while window_end > start:
+            window_start = max(self.mm.rfind(b"\n", start, max(window_end - self.block_size, start)) + 1, start)
+            last_match = None
+            for last_match in pattern.finditer(self.mm, window_start, window_end):
+                pass
+            if last_match != None:
+                return last_match.start()
+            window_end = window_start
+        return -1
+
+    def get_line(self, offset):
+        if self.mm == None:
+            return b""
+        line_start = self.mm.rfind(b"\n", 0, offset) + 1
+        line_end = self.mm.find(b"\n", offset)
+        return self.mm[line_start:self.size if line_end == -1 else line_end]
+
+    def iter_blocks_after(self, offset, block_size=None):
+        block_size = self.block_size if block_size == None else block_size
+        while self.mm != None and offset < self.size:
+            block_end = min(offset + block_size, self.size)
+            if block_end < self.size:
+                last_newline = self.mm.rfind(b"\n", offset, block_end)
+                #A line longer than block_size is yielded whole.
+                block_end = last_newline + 1 if last_newline != -1 else self.mm.find(b"\n", block_end) + 1 or self.size
+            yield [offset, self.mm[offset:block_end]]
+            offset = block_end
+
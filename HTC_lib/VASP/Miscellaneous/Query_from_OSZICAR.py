@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # a series of functions to extract various data from VASP OSZICAR without writing any temporary file
+
+# In[1]:
+
+
+import re, os
+
+
+# In[2]:
+
+
+electronic_step_pattern = re.compile(r"^\s*[A-Za-z]+\s*:\s*(\d+)\s+(\S+)\s+(\S+)\s+(\S+)")
+ionic_step_value_pattern_dict = {"F": re.compile(r"\bF=\s*(\S+)"), "E0": re.compile(r"\bE0=\s*(\S+)"), "mag": re.compile(r"\bmag=(.*)$")}
+
+
+def parse_oszicar_lines(line_iterable):
+    """
+    Stream the lines of OSZICAR and yield one dict per complete ionic step, i.e. per line containing both "F=" and "E0=".
+    input arguments:
+        -line_iterable: an iterable of the OSZICAR lines, e.g. an opened OSZICAR. Lines of type bytes are decoded.
+    output: a generator of dicts with keys below:
+        - no_of_electronic_steps (int): the number of the electronic steps of this ionic step.
+        - dE, deps (float or None): dE and d eps of the last electronic step. None if there is no electronic step.
+        - F, E0 (float)
+        - mag (float, list of 3 floats or None): the total magnetic moment. None if it is absent (ISPIN = 1).
+    Note that an incomplete ionic step at the end of OSZICAR (e.g. that of an ongoing calculation) is not yielded.
+    Note that an Exception is raised if an electronic or ionic step line cannot be parsed.
+    """
+    no_of_electronic_steps, dE, deps = 0, None, None
+    for line in line_iterable:
+        if isinstance(line, bytes):
+            line = line.decode(errors="replace")
+        if "F=" in line and "E0=" in line:
+            ionic_step = {"no_of_electronic_steps": no_of_electronic_steps, "dE": dE, "deps": deps}
+            for key, pattern in ionic_step_value_pattern_dict.items():
+                m = pattern.search(line)
+                if key == "mag":
+                    mag_list = [float(value) for value in m.group(1).split()] if m else []
+                    ionic_step["mag"] = None if mag_list == [] else (mag_list[0] if len(mag_list) == 1 else mag_list)
+                elif m:
+                    ionic_step[key] = float(m.group(1))
+                else:
+                    raise Exception("Fail to parse {} from the OSZICAR line below:\n{}".format(key, line))
+            yield ionic_step
+            no_of_electronic_steps, dE, deps = 0, None, None
+        else:
+            m = electronic_step_pattern.match(line)
+            if m:
+                no_of_electronic_steps += 1
+                dE, deps = float(m.group(3)), float(m.group(4))
+
+
+# In[3]:
+
+
+def find_ionic_steps_from_OSZICAR(cal_loc=".", oszicar="OSZICAR"):
+    """
+    Return a list of the complete ionic steps of OSZICAR. See function parse_oszicar_lines for the dict of an ionic step.
+    input arguments:
+        -cal_loc (str): the location of the calculation. Default: "."
+        -oszicar (str): the filename of OSZICAR under cal_loc. Default: "OSZICAR"
+    """
+    with open(os.path.join(cal_loc, oszicar), "r") as f:
+        return list(parse_oszicar_lines(f))
+
+
+# In[4]:
+
+
+def find_last_ionic_step_from_OSZICAR(cal_loc=".", oszicar="OSZICAR"):
+    """
+    Return the last complete ionic step of OSZICAR, or None if there is no complete ionic step.
+    See function parse_oszicar_lines for the dict of an ionic step.
+    input arguments:
+        -cal_loc (str): the location of the calculation. Default: "."
+        -oszicar (str): the filename of OSZICAR under cal_loc. Default: "OSZICAR"
+    """
+    last_ionic_step = None
+    with open(os.path.join(cal_loc, oszicar), "r") as f:
+        for ionic_step in parse_oszicar_lines(f):
+            last_ionic_step = ionic_step
+    return last_ionic_step
+
@@ -6,7 +6,165 @@
 # In[1]:
 
 
-import re, os
+import re, os, json, hashlib, threading, collections
+
+
+# In[ ]:
+
+
+class Outcar_index():
+    """
+    An index of the OUTCAR header built in one streaming pass, so that the functions below are lookups into it rather than one scan of OUTCAR each.
+    For each item below, the index records the first OUTCAR line(s) that the corresponding function used to search for:
+        - line_dict: INCAR tag (see Outcar_index.line_condition_dict) --> the first line satisfying the condition. "E-fermi" --> the first E-fermi line.
+        - block_dict: "lattice_vectors", "recp_lattice_vectors" (the 3 lines below the header line), "kpoints", "cart_coords" and
+                    "frac_coords" (the lines below the header line up to the first blank line) --> a list of the lines.
+        - ion_type_line_list: the lines containing "TITEL" or "ions per type"
+    Except E-fermi, all of them are searched in the OUTCAR header, i.e. before the first ionic iteration (--- Iteration 1(1) ---).
+    The pass stops as soon as the header is finished and E-fermi is found. Then the index is complete and only depends on the first indexed_size bytes.
+    The index is cached in a process-local LRU cache of at most max_no_of_cached_indexes OUTCARs and in the JSON sidecar file Outcar_index.sidecar_filename
+        under the hidden folder Outcar_index.sidecar_folder_name under cal_loc, so that rewriting the sidecar does not change the mtime of cal_loc (see Incremental_cal_status_scanner).
+        - A complete index is keyed by the inode number of OUTCAR and a fingerprint of the first fingerprint_size bytes and the last fingerprint_size bytes
+            before indexed_size. So it is reused while a running job keeps appending to OUTCAR, and rebuilt once OUTCAR is replaced.
+        - An incomplete index (e.g. no E-fermi yet) is keyed by the size and the modification time (in ns) of OUTCAR, so it is rebuilt once OUTCAR changes.
+    Method get_index(cal_loc) returns the index dict with keys size, mtime_ns, ino, indexed_size, is_complete, fingerprint, line_dict, block_dict and ion_type_line_list.
+    """
+    sidecar_folder_name = ".htc_cache"
+    sidecar_filename = "outcar_index.json"
+    line_condition_dict = {"EDIFFG": lambda line: "EDIFFG" in line and "=" in line, 
+                           "EDIFF": lambda line: "EDIFF " in line and "=" in line, 
+                           "IBRION": lambda line: "IBRION" in line and "=" in line, 
+                           "NSW": lambda line: "NSW" in line and "=" in line, 
+                           "NELM": lambda line: "NELM" in line and "=" in line, 
+                           "ISPIN": lambda line: "ISPIN" in line, 
+                           "LORBIT": lambda line: "LORBIT" in line, 
+                           "LSORBIT": lambda line: "LSORBIT" in line and "=" in line and line.split("=")[1].strip().startswith("T"), 
+                           "IALGO": lambda line: "IALGO" in line and "=" in line, 
+                           "AMIX": lambda line: "AMIX" in line and "=" in line, 
+                           "NBANDS": lambda line: "NBANDS" in line and "=" in line and "k-points in BZ" in line, 
+                           "ICHARG": lambda line: "ICHARG" in line and "=" in line, 
+                           "LREAL": lambda line: line.strip().startswith("LREAL  ="), 
+                           "NG_X_Y_Z_F": lambda line: "dimension x,y,z NGXF=" in line, 
+                           "LPEAD": lambda line: "LPEAD" in line}
+    #block name --> [the header line, the number of lines below the header line. None means up to the first blank line]
+    block_header_dict = {"lattice_vectors": ["direct lattice vectors", 3], 
+                         "recp_lattice_vectors": [" reciprocal lattice vectors", 3], 
+                         "kpoints": ["k-points in reciprocal lattice and weights:", None], 
+                         "cart_coords": [" position of ions in cartesian coordinates  (Angst):", None], 
+                         "frac_coords": [" position of ions in fractional coordinates (direct lattice)", None]}
+    fingerprint_size = 1024
+    max_no_of_cached_indexes = 256
+    _index_dict = collections.OrderedDict() #OUTCAR path --> index
+    _index_dict_lock = threading.Lock()
+
+    @classmethod
+    def build_index(cls, outcar):
+        line_dict, block_dict, ion_type_line_list = {}, {}, []
+        open_block_dict = {} #block name --> the number of lines left to read (None: up to the first blank line)
+        is_in_header, is_complete, indexed_size = True, False, 0
+        with open(outcar, "rb") as f:
+            for line in f:
+                indexed_size += len(line)
+                line = line.decode(errors="replace")
+                for block_name in list(open_block_dict.keys()):
+                    if open_block_dict[block_name] == None and not line.strip():
+                        open_block_dict.pop(block_name)
+                        continue
+                    block_dict[block_name].append(line)
+                    if open_block_dict[block_name] != None:
+                        open_block_dict[block_name] -= 1
+                        if open_block_dict[block_name] == 0:
+                            open_block_dict.pop(block_name)
+                
+                if is_in_header and line.strip().startswith("-") and " Iteration " in line:
+                    is_in_header = False
+                if is_in_header:
+                    for tag, condition in cls.line_condition_dict.items():
+                        if tag not in line_dict and condition(line):
+                            line_dict[tag] = line
+                    for block_name, (header, no_of_lines) in cls.block_header_dict.items():
+                        if block_name not in block_dict and header in line:
+                            block_dict[block_name] = []
+                            open_block_dict[block_name] = no_of_lines
+                    if "TITEL" in line or "ions per type" in line:
+                        ion_type_line_list.append(line)
+                if "E-fermi" not in line_dict and "E-fermi" in line:
+                    line_dict["E-fermi"] = line
+                if not is_in_header and "E-fermi" in line_dict and not open_block_dict:
+                    is_complete = True
+                    break
+        return {"line_dict": line_dict, "block_dict": block_dict, "ion_type_line_list": ion_type_line_list, 
+                "indexed_size": indexed_size, "is_complete": is_complete, "fingerprint": cls.get_fingerprint(outcar, indexed_size)}
+
+    @classmethod
+    def get_fingerprint(cls, outcar, indexed_size):
+        """Return the md5 hex digest of the first and the last fingerprint_size bytes before indexed_size, or None if OUTCAR is shorter than indexed_size."""
+        try:
+            with open(outcar, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < indexed_size:
+                    return None
+                f.seek(0)
+                head = f.read(min(cls.fingerprint_size, indexed_size))
+                f.seek(max(indexed_size - cls.fingerprint_size, 0))
+                tail = f.read(min(cls.fingerprint_size, indexed_size))
+        except (IOError, OSError):
+            return None
+        return hashlib.md5(head + tail).hexdigest()
+
+    @classmethod
+    def is_index_valid(cls, index, outcar, outcar_stat):
+        if index == None:
+            return False
+        if index.get("is_complete"):
+            return index.get("ino") == outcar_stat.st_ino and outcar_stat.st_size >= index["indexed_size"] and \
+                   index.get("fingerprint") == cls.get_fingerprint(outcar, index["indexed_size"])
+        return index.get("size") == outcar_stat.st_size and index.get("mtime_ns") == outcar_stat.st_mtime_ns
+
+    @classmethod
+    def get_index(cls, cal_loc="."):
+        outcar = os.path.join(cal_loc, "OUTCAR")
+        outcar_stat = os.stat(outcar)
+        with cls._index_dict_lock:
+            index = cls._index_dict.get(outcar)
+        if cls.is_index_valid(index, outcar, outcar_stat):
+            with cls._index_dict_lock:
+                if outcar in cls._index_dict:
+                    cls._index_dict.move_to_end(outcar)
+            return index
+        
+        sidecar = os.path.join(cal_loc, cls.sidecar_folder_name, cls.sidecar_filename)
+        try:
+            with open(sidecar, "r") as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            index = None
+        if not cls.is_index_valid(index, outcar, outcar_stat):
+            index = cls.build_index(outcar)
+            index["size"], index["mtime_ns"], index["ino"] = outcar_stat.st_size, outcar_stat.st_mtime_ns, outcar_stat.st_ino
+            try:
+                os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+                with open(sidecar + ".tmp", "w") as f:
+                    json.dump(index, f)
+                os.replace(sidecar + ".tmp", sidecar)
+            except (IOError, OSError):
+                pass #The index still works in memory if cal_loc is read-only.
+        with cls._index_dict_lock:
+            cls._index_dict[outcar] = index
+            cls._index_dict.move_to_end(outcar)
+            while len(cls._index_dict) > cls.max_no_of_cached_indexes:
+                cls._index_dict.popitem(last=False)
+        return index
+
+    @classmethod
+    def get_line(cls, cal_loc, tag):
+        """Return the first OUTCAR line of tag (see line_condition_dict or "E-fermi"), or None if it is not found."""
+        return cls.get_index(cal_loc)["line_dict"].get(tag)
+
+    @classmethod
+    def get_block(cls, cal_loc, block_name):
+        """Return the list of the OUTCAR lines of block_name (see block_header_dict), or None if it is not found."""
+        return cls.get_index(cal_loc)["block_dict"].get(block_name)
 
 
 # In[2]:
@@ -19,18 +177,14 @@ def find_lattice_vectors_from_OUTCAR(cal_loc="."):
         -cal_loc (str): the location of the calculation. Default: "."
     output: a list of 3 entries. Each entry is also a list of 3 float numbers representing a lattice vector.
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        while True:
-            line = next(f)
-            if "direct lattice vectors" in line:
-                break
-                
-        lattice_vectors = []
-        for i in range(3):
-            line = next(f)
-            m = re.findall("[0-9\-\.]+", line)
-            assert len(m) == 6, "Error: fail to parse lattice vectors from line below:\n%s" % line
-            lattice_vectors.append([float(item) for item in m[:3]])
+    line_list = Outcar_index.get_block(cal_loc, "lattice_vectors")
+    assert line_list != None and len(line_list) == 3, "Error: fail to find lattice vectors in OUTCAR under {}".format(cal_loc)
+    
+    lattice_vectors = []
+    for line in line_list:
+        m = re.findall("[0-9\-\.]+", line)
+        assert len(m) == 6, "Error: fail to parse lattice vectors from line below:\n%s" % line
+        lattice_vectors.append([float(item) for item in m[:3]])
     return lattice_vectors
 
 
@@ -42,18 +196,14 @@ def find_recp_lattice_vectors_from_OUTCAR(cal_loc="."):
     Find the 3x3 reciprocal lattice vector from VASP OUTCAR
     output: a list of 3 entries. Each entry is also a list of 3 float numbers representing a reciprocal lattice vector.
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        while True:
-            line = next(f)
-            if " reciprocal lattice vectors" in line:
-                break
-                
-        recp_lattice_vectors = []
-        for i in range(3):
-            line = next(f)
-            m = re.findall("[0-9\-\.]+", line)
-            assert len(m) == 6, "Error: fail to parse reciprocal lattice vectors from line below:\n%s" % line
-            recp_lattice_vectors.append([float(item) for item in m[-3:]])
+    line_list = Outcar_index.get_block(cal_loc, "recp_lattice_vectors")
+    assert line_list != None and len(line_list) == 3, "Error: fail to find reciprocal lattice vectors in OUTCAR under {}".format(cal_loc)
+    
+    recp_lattice_vectors = []
+    for line in line_list:
+        m = re.findall("[0-9\-\.]+", line)
+        assert len(m) == 6, "Error: fail to parse reciprocal lattice vectors from line below:\n%s" % line
+        recp_lattice_vectors.append([float(item) for item in m[-3:]])
     return recp_lattice_vectors
 
 
@@ -69,18 +219,14 @@ def find_vector_kpoints_from_OUTCAR(cal_loc="."):
     output: a list of length Nk. Each entry is a list of length 4, the first 3 float numbers of which denote the vector kpoint,
             while the last float number of which denotes the weigth of this kpoint.
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        while True:
-            if "k-points in reciprocal lattice and weights:" in next(f):
-                break
-        
-        kpoints = []
-        for line in f:
-            if not line.strip():
-                break
-            m = line.strip().split()
-            assert len(m) == 4, "Error: fail to extract kpoint from line below:\n%s" % line
-            kpoints.append([float(item) for item in m])
+    line_list = Outcar_index.get_block(cal_loc, "kpoints")
+    assert line_list != None, "Error: fail to find k-points in reciprocal lattice in OUTCAR under {}".format(cal_loc)
+    
+    kpoints = []
+    for line in line_list:
+        m = line.strip().split()
+        assert len(m) == 4, "Error: fail to extract kpoint from line below:\n%s" % line
+        kpoints.append([float(item) for item in m])
     return kpoints
         
 
@@ -95,10 +241,7 @@ def find_Efermi_from_OUTCAR(cal_loc="."):
         -cal_loc (str): the location of the calculation. Default: "."
     output: a float number
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "E-fermi" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "E-fermi")
     line = line.strip().split()
     return float(line[2])
 
@@ -113,14 +256,7 @@ def find_LSORBIT_from_OUTCAR(cal_loc="."):
         -cal_loc (str): the location of the calculation. Default: "."
     output: return True if LSORBIT is switched on; return False otherwise
     """
-    status = False
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "LSORBIT" in line:
-                if "T" == line.split("=")[1].strip()[0]:
-                    status = True
-                    break
-    return status
+    return Outcar_index.get_line(cal_loc, "LSORBIT") != None
 
 
 # In[7]:
@@ -132,11 +268,7 @@ def find_LORBIT_from_OUTCAR(cal_loc="."):
     input arguments:
         -cal_loc (str): the location of the calculation. Default: "."
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "LORBIT" in line:
-                break
-                
+    line = Outcar_index.get_line(cal_loc, "LORBIT")
     m = line.split("=")[1].strip()
     return int(m.split()[0].strip())
 
@@ -150,11 +282,7 @@ def find_ISPIN_from_OUTCAR(cal_loc="."):
     input arguments:
         -cal_loc (str): the location of the calculation. Default: "."
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "ISPIN" in line:
-                break
-                
+    line = Outcar_index.get_line(cal_loc, "ISPIN")
     m = line.split("=")[1].strip()
     return int(m.split()[0].strip())
 
@@ -170,27 +298,26 @@ def find_ion_types_from_OUTCAR(cal_loc="."):
             is a list of length, the first element of which is atomic species and the second of which is the
             integer number of that species.
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        ions_per_type = []
-        ions_types = []
+    ions_per_type = []
+    ions_types = []
+    
+    for line in Outcar_index.get_index(cal_loc)["ion_type_line_list"]:
+        if "ions per type" in line:
+            m = line.split("=")[1].strip().split()
+            assert len(m) > 0, "Error: fail to extract ions per type from the line below:\n%s" % line
+            ions_per_type = [int(item) for item in m]
+            if len(ions_types) == len(ions_per_type):
+                break
+            else:
+                continue
         
-        for line in f:
-            if "ions per type" in line:
-                m = line.split("=")[1].strip().split()
-                assert len(m) > 0, "Error: fail to extract ions per type from the line below:\n%s" % line
-                ions_per_type = [int(item) for item in m]
-                if len(ions_types) == len(ions_per_type):
-                    break
-                else:
-                    continue
-            
-            if "TITEL" in line:
-                m = line.strip().split()[-2]
-                if "_" in m:
-                    m = m.split("_")[0]
-                ions_types.append(m)
-                if len(ions_types) == len(ions_per_type):
-                    break
+        if "TITEL" in line:
+            m = line.strip().split()[-2]
+            if "_" in m:
+                m = m.split("_")[0]
+            ions_types.append(m)
+            if len(ions_types) == len(ions_per_type):
+                break
     return [[ion_type, ions] for ion_type, ions in zip(ions_types, ions_per_type)]
 
 
@@ -236,17 +363,13 @@ def find_cart_coords_from_OUTCAR(cal_loc="."):
         -cal_loc (str): the location of the calculation. Default: "."
     output: a list whose each entry is a cartesian coordinate of the atom.
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        cart_coords = []
-        while True:
-            if " position of ions in cartesian coordinates  (Angst):" in next(f):
-                break
-        
-        for line in f:
-            if not line.strip():
-                break
-            coord = [float(item) for item in line.strip().split()]
-            cart_coords.append(coord)
+    line_list = Outcar_index.get_block(cal_loc, "cart_coords")
+    assert line_list != None, "Error: fail to find the cartesian coordinates in OUTCAR under {}".format(cal_loc)
+    
+    cart_coords = []
+    for line in line_list:
+        coord = [float(item) for item in line.strip().split()]
+        cart_coords.append(coord)
             
     return cart_coords
 
@@ -261,17 +384,13 @@ def find_frac_coords_from_OUTCAR(cal_loc="."):
         -cal_loc (str): the location of the calculation. Default: "."
     output: a list whose each entry is a fractional coordinate of the atom.
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        frac_coords = []
-        while True:
-            if " position of ions in fractional coordinates (direct lattice)" in next(f):
-                break
-        
-        for line in f:
-            if not line.strip():
-                break
-            coord = [float(item) for item in line.strip().split()]
-            frac_coords.append(coord)
+    line_list = Outcar_index.get_block(cal_loc, "frac_coords")
+    assert line_list != None, "Error: fail to find the fractional coordinates in OUTCAR under {}".format(cal_loc)
+    
+    frac_coords = []
+    for line in line_list:
+        coord = [float(item) for item in line.strip().split()]
+        frac_coords.append(coord)
             
     return frac_coords
 
@@ -287,10 +406,7 @@ def find_NELM_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "NELM" in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "NELM")
                 
     
     return int(line.split(";")[0].split("=")[-1].strip())
@@ -310,10 +426,7 @@ def find_NBANDS_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "NBANDS" in line and "=" in line and "k-points in BZ" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "NBANDS")
                 
     return int(line.strip().split("=")[-1].strip())
             
@@ -331,10 +444,7 @@ def find_NSW_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:    
-        for line in f:
-            if "NSW" in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "NSW")
                 
     items = [item.strip() for item in line.split(" ") if item.strip()]
     return int(items[2])  
@@ -351,10 +461,7 @@ def find_IBRION_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:    
-        for line in f:
-            if "IBRION" in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "IBRION")
                 
     items = [item.strip() for item in line.split(" ") if item.strip()]
     return int(items[2]) 
@@ -371,10 +478,7 @@ def find_EDIFF_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "EDIFF " in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "EDIFF")
                 
     return float(line.split("=")[1].strip().split()[0])
 
@@ -390,10 +494,7 @@ def find_EDIFFG_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "EDIFFG" in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "EDIFFG")
     return float(line.split("=")[1].strip().split()[0])
 
 
@@ -408,10 +509,7 @@ def find_IALGO_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "IALGO" in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "IALGO")
     return int([item for item in line.strip().split()][2])
 
 
@@ -426,10 +524,7 @@ def find_AMIX_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "AMIX" in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "AMIX")
                 
     return int([item for item in line.strip().split()][2])
 
@@ -445,10 +540,7 @@ def find_ICHARG_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "ICHARG" in line and "=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "ICHARG")
     return int(line.split()[2])
 
 
@@ -463,10 +555,7 @@ def find_FERMI_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "E-fermi" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "E-fermi")
                 
     return float(line.split()[2])
 
@@ -482,10 +571,7 @@ def find_LREAL_from_OUTCAR(cal_loc="."):
     return the corresponding value if found; otherwise, return None
     """
     
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if line.strip().startswith("LREAL  ="):
-                break
+    line = Outcar_index.get_line(cal_loc, "LREAL")
                 
     return float(line.split()[2])
 
@@ -500,10 +586,7 @@ def find_NGXF_NGYF_NGZF_from_OUTCAR(cal_loc="."):
         -cal_loc (str): the location of the calculation. Default: "."
     return the corresponding value if found; otherwise, return None
     """
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "dimension x,y,z NGXF=" in line:
-                break
+    line = Outcar_index.get_line(cal_loc, "NG_X_Y_Z_F")
                 
     return [int(value) for value in re.findall("[0-9]+", line)]
 
@@ -519,11 +602,9 @@ def find_LPEAD_from_OUTCAR(cal_loc="."):
     return True if LPEAD = T; return False otherwise.
     """
     LPEAD = False
-    with open(os.path.join(cal_loc, "OUTCAR"), "r") as f:
-        for line in f:
-            if "LPEAD" in line:
-                LPEAD = line.split("=")[1].strip().startswith("T")
-                break
+    line = Outcar_index.get_line(cal_loc, "LPEAD")
+    if line != None:
+        LPEAD = line.split("=")[1].strip().startswith("T")
     
     return LPEAD
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # a streaming reader of VASP vasprun.xml which only keeps the requested sections in memory
+
+# In[1]:
+
+
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+# In[2]:
+
+
+def read_vasprun(cal_loc=".", vasprun="vasprun.xml", section_list=["efermi", "energies", "eigenvalues"]):
+    """
+    Stream vasprun.xml with xml.etree.ElementTree.iterparse and return the requested sections.
+    Every element is removed from its parent as soon as it has been parsed, so the memory does not grow with the size of vasprun.xml
+        except for the requested eigenvalues.
+    input arguments:
+        -cal_loc (str): the location of the calculation. Default: "."
+        -vasprun (str): the filename of vasprun.xml under cal_loc. Default: "vasprun.xml"
+        -section_list (list of str): any of the sections below. Default: ["efermi", "energies", "eigenvalues"]
+            - efermi: the last Fermi level, i.e. <i name="efermi">
+            - energies: the energies of the last ionic step, i.e. <i name="e_fr_energy">, <i name="e_wo_entrp"> and <i name="e_0_energy">
+                        right under the last <calculation><energy>
+            - eigenvalues: the eigenvalues and occupations of the last <calculation><eigenvalues>. The projected ones are skipped.
+    output: a dict with keys below. A key is None if its section is not requested or not found.
+        - efermi (float)
+        - energies (dict): e.g. {"e_fr_energy": float, "e_wo_entrp": float, "e_0_energy": float}
+        - eigenvalues (numpy array of shape (no_of_spins, no_of_kpoints, no_of_bands))
+        - occupations (numpy array of shape (no_of_spins, no_of_kpoints, no_of_bands))
+    """
+    result_dict = {"efermi": None, "energies": None, "eigenvalues": None, "occupations": None}
+    tag_list, element_list = [], []
+    energy_dict, spin_list, kpoint_list, row_list = {}, [], [], []
+
+    for event, element in ET.iterparse(os.path.join(cal_loc, vasprun), events=("start", "end")):
+        if event == "start":
+            tag_list.append(element.tag)
+            element_list.append(element)
+            if tag_list[-3:] == ["calculation", "eigenvalues", "array"]:
+                spin_list = []
+            continue
+
+        #event == "end"
+        if element.tag == "i":
+            name = element.get("name")
+            if name == "efermi" and "efermi" in section_list:
+                result_dict["efermi"] = float(element.text)
+            elif tag_list[-3:-1] == ["calculation", "energy"] and "energies" in section_list:
+                energy_dict[name] = float(element.text)
+        #<calculation><eigenvalues><array><set><set comment="spin 1"><set comment="kpoint 1"><r>eigenvalue occupation</r>
+        elif element.tag == "r" and "eigenvalues" in section_list and tag_list[-7:-4] == ["calculation", "eigenvalues", "array"]:
+            row_list.append([float(value) for value in element.text.split()])
+        elif element.tag == "set" and "eigenvalues" in section_list and tag_list[-6:-3] == ["calculation", "eigenvalues", "array"]:
+            #the end of the set of a kpoint
+            kpoint_list.append(np.array(row_list))
+            row_list = []
+        elif element.tag == "set" and "eigenvalues" in section_list and tag_list[-5:-2] == ["calculation", "eigenvalues", "array"]:
+            #the end of the set of a spin
+            spin_list.append(kpoint_list)
+            kpoint_list = []
+        elif element.tag == "eigenvalues" and tag_list[-2:-1] == ["calculation"] and spin_list:
+            eigenvalue_array = np.array(spin_list)
+            result_dict["eigenvalues"], result_dict["occupations"] = eigenvalue_array[..., 0], eigenvalue_array[..., 1]
+            spin_list = []
+        elif element.tag == "energy" and tag_list[-2:-1] == ["calculation"] and energy_dict:
+            result_dict["energies"] = energy_dict
+            energy_dict = {}
+
+        tag_list.pop()
+        element_list.pop()
+        if element_list:
+            #The element is always the last child of its parent when it ends.
+            del element_list[-1][-1]
+        element.clear()
+
+    return result_dict
+
+
+# In[3]:
+
+
+def find_CBM_VBM(eigenvalues, occupations, efermi):
+    """
+    Find the conduction band minimum (CBM) and the valence band maximum (VBM) w.r.t. the Fermi level.
+    input arguments:
+        -eigenvalues, occupations (numpy arrays of the same shape): see the return of function read_vasprun.
+        -efermi (float): the Fermi level.
+    output: [VBM, CBM, VBM_occ, CBM_occ]
+        - VBM: the highest eigenvalue below efermi; CBM: the lowest eigenvalue above efermi.
+        - VBM_occ and CBM_occ: the corresponding occupations. If more than one eigenvalue is the VBM (CBM),
+            the occupation of the first one in the order of spin, kpoint and band is taken.
+    """
+    eigenvalues, occupations = np.ravel(eigenvalues), np.ravel(occupations)
+    below_efermi, above_efermi = eigenvalues < efermi, eigenvalues > efermi
+    assert below_efermi.any() and above_efermi.any(), "Error: there are no eigenvalues on both sides of the Fermi level {}".format(efermi)
+
+    VBM_ind = np.flatnonzero(below_efermi)[np.argmax(eigenvalues[below_efermi])]
+    CBM_ind = np.flatnonzero(above_efermi)[np.argmin(eigenvalues[above_efermi])]
+    return [float(eigenvalues[VBM_ind]), float(eigenvalues[CBM_ind]), float(occupations[VBM_ind]), float(occupations[CBM_ind])]
+
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[1]:
+
+
+import time, random, threading, json, re
+
+
+# In[2]:
+
+
+class Circuit_open_error(Exception):
+    """
+    Raised when a command is not executed or given up because the circuit breaker of its command class is open (see Retry_policy).
+    The htc main scripts catch it, skip the rest of the current cycle and try again in the next one, i.e. they back off rather than stop.
+    """
+    pass
+
+
+# In[3]:
+
+
+class Retry_policy():
+    """
+    Retry a failing external command with exponential backoff, jitter, a time budget and a circuit breaker.
+    There is one Retry_policy per command class, and its state and counters are shared by all callers of that class in a process:
+        - job_query: the job query command (HTC tag job_query_command). See Queue_snapshot.query
+        - job_submission: the job submission command. See Job_management.submit
+        - job_killing: the job killing command. See Job_management.kill and kill_error_jobs
+        - shell_cmd: the user-defined commands. See Execute_shell_cmd and decorated_subprocess_check_output
+    Before the i-th retry (i = 1, 2, ...), the policy sleeps for a random time between 0 and min(max_delay, base_delay * 2^(i-1)) seconds (full jitter),
+    so that the failing commands issued by many threads/processes do not hit an overloaded job scheduler at the same time.
+    A call gives up once max_tries tries fail or once the next sleep would take the call beyond time_budget seconds.
+    If failure_threshold calls in a row give up, the circuit opens: in the next cooldown seconds, any call of that class fails immediately
+    without executing the command. failure_threshold = 0 disables the circuit breaker.
+    Submission and killing have separate policies, so that a job killing command which keeps failing does not stop the job submission, and vice versa.
+    A try which fails for a non-transient reason (see is_transient_error_message and the is_transient argument of Retry_policy.execute),
+    e.g. a job submission script rejected by the job scheduler, is neither retried nor counted by the circuit breaker:
+    retrying it only holds the calling thread for up to time_budget seconds, and counting it lets a few bad calculations stop the whole campaign.
+
+    The job_query, job_submission and job_killing policies are configured by the HTC tags retry_max_tries, retry_base_delay, retry_max_delay, retry_time_budget,
+    circuit_breaker_threshold and circuit_breaker_cooldown in the first firework. See Retry_policy.get
+    The shell_cmd policy is not configurable: a failing user-defined command is usually wrong rather than the server being busy,
+    so it is retried with short delays (default_setting_dict["shell_cmd"]) and never blocks the commands of other calculations.
+
+    input arguments:
+        - command_class (str): the name of the command class.
+        - max_tries (int): the maximum number of tries per call. Default: 10
+        - base_delay (float): the base of the backoff delay in seconds. Default: 1
+        - max_delay (float): the upper limit of the backoff delay in seconds. Default: 60
+        - time_budget (float): the maximum time in seconds that a call can spend on retrying. Default: 300
+        - failure_threshold (int): the number of calls in a row which give up before the circuit opens. Default: 3
+        - cooldown (float): how long in seconds the circuit stays open. Default: 300
+    """
+    command_class_list = ["job_query", "job_submission", "job_killing", "shell_cmd"]
+    default_setting_dict = {"job_query": {"max_tries": 10, "base_delay": 1., "max_delay": 60., "time_budget": 300., "failure_threshold": 3, "cooldown": 300.},
+                            "job_submission": {"max_tries": 10, "base_delay": 1., "max_delay": 60., "time_budget": 300., "failure_threshold": 3, "cooldown": 300.},
+                            "job_killing": {"max_tries": 10, "base_delay": 1., "max_delay": 60., "time_budget": 300., "failure_threshold": 3, "cooldown": 300.},
+                            "shell_cmd": {"max_tries": 10, "base_delay": 0.1, "max_delay": 1., "time_budget": 10., "failure_threshold": 0, "cooldown": 0.}}
+    #HTC tag --> setting of the job_query, job_submission and job_killing policies
+    htc_tag_dict = {"retry_max_tries": "max_tries", "retry_base_delay": "base_delay", "retry_max_delay": "max_delay", "retry_time_budget": "time_budget",
+                    "circuit_breaker_threshold": "failure_threshold", "circuit_breaker_cooldown": "cooldown"}
+    #The error messages of a job scheduler which is overloaded, restarting or unreachable. A failed command is worth a retry only if its message matches.
+    transient_error_re = re.compile(r"time[d]?[ -]?out|connection (refused|reset|closed)|(cannot|can't|could not|unable to|failed to) (connect|contact|communicate)|"
+                                    r"not responding|no response|try again|temporar|unavailable|busy|is down|socket|broken pipe", re.IGNORECASE)
+    _policy_dict = {} #command class --> Retry_policy
+    _policy_dict_lock = threading.Lock()
+
+    def __init__(self, command_class, max_tries=10, base_delay=1., max_delay=60., time_budget=300., failure_threshold=3, cooldown=300.):
+        self.command_class = command_class
+        self.lock = threading.Lock()
+        self.no_of_failures_in_a_row = 0
+        self.circuit_open_until = 0.
+        self.counter_dict = {"no_of_calls": 0, "no_of_tries": 0, "no_of_retries": 0, "no_of_successful_calls": 0, "no_of_failed_calls": 0,
+                             "no_of_non_transient_failures": 0,
+                             "no_of_rejected_calls": 0, "no_of_circuit_openings": 0, "total_backoff_time": 0.}
+        self.set(max_tries=max_tries, base_delay=base_delay, max_delay=max_delay, time_budget=time_budget, failure_threshold=failure_threshold, cooldown=cooldown)
+
+    def set(self, max_tries, base_delay, max_delay, time_budget, failure_threshold, cooldown):
+        assert max_tries >= 1, "The maximum number of tries of the {} commands must be at least 1".format(self.command_class)
+        self.max_tries, self.base_delay, self.max_delay = int(max_tries), float(base_delay), float(max_delay)
+        self.time_budget, self.failure_threshold, self.cooldown = float(time_budget), int(failure_threshold), float(cooldown)
+
+    def get_setting(self):
+        return {"max_tries": self.max_tries, "base_delay": self.base_delay, "max_delay": self.max_delay, "time_budget": self.time_budget,
+                "failure_threshold": self.failure_threshold, "cooldown": self.cooldown}
+
+    @classmethod
+    def get(cls, command_class, workflow=None):
+        """
+        Return the Retry_policy of command_class shared in this process. If workflow is provided, the job_query, job_submission and job_killing policies are
+        (re)configured by the HTC tags in workflow[0]. A tag which is not set falls back to default_setting_dict.
+        input arguments:
+            - command_class (str): job_query, job_submission, job_killing or shell_cmd
+            - workflow: the return of function parse_calculation_workflow. Default: None
+        """
+        assert command_class in cls.command_class_list, "Unknown command class {}. It should be one of {}".format(command_class, cls.command_class_list)
+        with cls._policy_dict_lock:
+            policy = cls._policy_dict.get(command_class, None)
+            if policy == None:
+                policy = Retry_policy(command_class=command_class, **cls.default_setting_dict[command_class])
+                cls._policy_dict[command_class] = policy
+        if workflow != None and command_class != "shell_cmd":
+            setting_dict = dict(cls.default_setting_dict[command_class])
+            for htc_tag, setting in cls.htc_tag_dict.items():
+                if workflow[0][htc_tag] != None:
+                    setting_dict[setting] = workflow[0][htc_tag]
+            if setting_dict != policy.get_setting():
+                with policy.lock:
+                    policy.set(**setting_dict)
+        return policy
+
+    @classmethod
+    def is_transient_error_message(cls, message):
+        """
+        Return True if message, e.g. the stderr of a failed job submission or killing command, says the failure is transient, i.e. worth a retry.
+        An empty message gives no clue and is regarded as transient.
+        """
+        if message == None or message.strip() == "":
+            return True
+        return cls.transient_error_re.search(message) != None
+
+    @classmethod
+    def get_counters(cls):
+        """
+        Return the counters of all Retry_policy instances in this process as a dict: command class --> a copy of its counter_dict.
+        """
+        with cls._policy_dict_lock:
+            policy_list = list(cls._policy_dict.values())
+        return {policy.command_class: policy.get_counter_dict() for policy in policy_list}
+
+    @classmethod
+    def write_counters(cls, filename):
+        """
+        Write the counters of all Retry_policy instances in this process into filename in the JSON format, e.g. for monitoring.
+        """
+        with open(filename, "w") as f:
+            json.dump({"time": time.strftime("%Y-%m-%d-%H:%M:%S"), "counters": cls.get_counters()}, f, indent=4)
+
+    @classmethod
+    def reset(cls):
+        """
+        Drop all Retry_policy instances, together with their counters and circuit states, in this process.
+        """
+        with cls._policy_dict_lock:
+            cls._policy_dict.clear()
+
+    def get_counter_dict(self):
+        with self.lock:
+            counter_dict = dict(self.counter_dict)
+        counter_dict["is_circuit_open"] = self.is_circuit_open()
+        return counter_dict
+
+    def is_circuit_open(self):
+        return time.time() < self.circuit_open_until
+
+    def get_delay(self, retry_no):
+        """
+        Return the random sleeping time before the retry_no-th retry (retry_no = 1, 2, ...)
+        """
+        return random.uniform(0, min([self.max_delay, self.base_delay * 2 ** (retry_no - 1)]))
+
+    def execute(self, func, is_successful=None, max_tries=None, count_failure=True, is_transient=None):
+        """
+        Call func (without any argument) until a try succeeds, and return a tuple of length 2:
+            - first entry: a list of the returns of func, one per try. If func raises an exception in a try, it is None.
+            - second entry: a list of the exceptions raised by func, one per try. If no exception is raised in a try, it is None.
+        A try succeeds if func does not raise any exception and is_successful(the return of func) is True.
+        If the circuit is open, func is not called and ([None], [an Exception saying so]) is returned.
+        input arguments:
+            - func (callable): execute the command once.
+            - is_successful (callable or None): Default: None, i.e. a try succeeds as long as func does not raise any exception.
+            - max_tries (int or None): Default: None, i.e. self.max_tries
+            - count_failure (bool): whether a call which gives up counts towards failure_threshold of the circuit breaker. Default: True
+                    Set it to False for a call whose failure is expected to be handled by the caller, e.g. a bulk job killing command (see kill_error_jobs).
+            - is_transient (callable or None): called as is_transient(the return of func or None, the raised exception or None) after a failed try.
+                    If it returns False, the failure is not transient: the call gives up at once without counting towards failure_threshold.
+                    Default: None, i.e. every failure is regarded as transient.
+        """
+        with self.lock:
+            self.counter_dict["no_of_calls"] += 1
+            if self.is_circuit_open():
+                self.counter_dict["no_of_rejected_calls"] += 1
+                return [None], [Exception("The circuit breaker of the {} commands is open until {}. No more try.".format(self.command_class,
+                                                                                                                         time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime(self.circuit_open_until))))]
+            max_tries = self.max_tries if max_tries == None else max_tries
+            time_budget = self.time_budget
+
+        return_list, error_list = [], []
+        t0 = time.time()
+        for try_ind in range(max_tries):
+            if try_ind > 0:
+                delay = self.get_delay(retry_no=try_ind)
+                if time.time() - t0 + delay > time_budget:
+                    break
+                time.sleep(delay)
+                with self.lock:
+                    self.counter_dict["no_of_retries"] += 1
+                    self.counter_dict["total_backoff_time"] += delay
+            try:
+                return_ = func()
+            except Exception as err:
+                return_list.append(None)
+                error_list.append(err)
+                is_succeeded = False
+            else:
+                return_list.append(return_)
+                error_list.append(None)
+                is_succeeded = True if is_successful == None else is_successful(return_)
+            with self.lock:
+                self.counter_dict["no_of_tries"] += 1
+            if is_succeeded:
+                with self.lock:
+                    self.counter_dict["no_of_successful_calls"] += 1
+                    self.no_of_failures_in_a_row = 0
+                return return_list, error_list
+            if is_transient != None and not is_transient(return_list[-1], error_list[-1]):
+                with self.lock:
+                    self.counter_dict["no_of_failed_calls"] += 1
+                    self.counter_dict["no_of_non_transient_failures"] += 1
+                return return_list, error_list
+
+        with self.lock:
+            self.counter_dict["no_of_failed_calls"] += 1
+            if not count_failure:
+                return return_list, error_list
+            self.no_of_failures_in_a_row += 1
+            if self.failure_threshold > 0 and self.no_of_failures_in_a_row >= self.failure_threshold:
+                self.circuit_open_until = time.time() + self.cooldown
+                self.counter_dict["no_of_circuit_openings"] += 1
+                self.no_of_failures_in_a_row = 0
+        return return_list, error_list
@@ -4,9 +4,13 @@
 # In[2]:
 
 
-import os, time, shutil, re, json, filecmp
+import os, time, shutil, re, filecmp
 import subprocess
 
+from HTC_lib.VASP.Miscellaneous.Cal_status_index import Cal_status_index
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation
+from HTC_lib.VASP.Miscellaneous.Retry_policy import Retry_policy
+
 
 # In[7]:
 
@@ -58,6 +62,7 @@ def decorated_os_rename(loc, old_filename, new_filename, clear_content=False):
             - if old_filename does not exist, directly create a file named new_filename using open()
     After os.rename:
         - if clear_content is True, clear the file.
+        - if a calculation status index is activated (see Cal_status_index.activate), record the transition into it.
     input arguments:
         - loc (str): a directory
         - old_filename (str)
@@ -75,6 +80,8 @@ def decorated_os_rename(loc, old_filename, new_filename, clear_content=False):
         
     if clear_content:
         open(new_file, "w").close()
+        
+    Cal_status_index.record_signal_file_transition(loc=loc, new_filename=new_filename)
 
 
 # In[7]:
@@ -297,20 +304,13 @@ def decorated_os_system(cmd, where_to_execute):
 
 
 def decorated_subprocess_check_output(args, stdin=None, stderr=None, shell=True, no_of_trails=10):
-    trail_no = 0
-    error_list = []
-    while trail_no < no_of_trails:
-        try:
-            output = subprocess.check_output(args, stdin=stdin, stderr=stderr, shell=shell).decode("utf-8")
-        except Exception as err:
-            error_list.append(err)
-        else:
-            break
-        trail_no += 1
+    #Failed trails are retried with short backoff. See Retry_policy
+    output_list, error_list = Retry_policy.get(command_class="shell_cmd").execute(func=lambda: subprocess.check_output(args, stdin=stdin, stderr=stderr, shell=shell).decode("utf-8"), 
+                                                                                 max_tries=no_of_trails)
     if type(args) == list:
         args = " ".join(args)
-    assert trail_no != no_of_trails,     "The command below has been called %d times but all failed. Make sure it is correct\nwhere to call: %s\ncmd:%s" % (no_of_trails, os.getcwd(), args)
-    return output, error_list
+    assert error_list[-1] == None,     "The command below has been called %d times but all failed. Make sure it is correct\nwhere to call: %s\ncmd:%s" % (len(error_list), os.getcwd(), args)
+    return output_list[-1], [error for error in error_list if error != None]
 
 
 # In[1]:
@@ -338,27 +338,10 @@ def write_cal_status0(cal_status, filename):
 
 
 def write_cal_status(cal_status, filename):
-    
-    with open(filename, "w") as f:
-        f.write("#{}\n".format(get_time_str()))
-        json.dump(cal_status, f, indent=4)
-        
-    folder_name = filename.replace(".json", "") + "_folder"
-    if os.path.isdir(folder_name):
-        for file_ in os.listdir(folder_name):
-            try:
-                os.remove(os.path.join(folder_name, file_))
-            except:
-                print("Fail to remove %s. Does it really exist?" % os.path.join(folder_name, file_))
-    else:
-        os.mkdir(folder_name)
-    
-    for status, job_list in cal_status.items():
-        if job_list:
-            with open(os.path.join(folder_name, status), "w") as f:
-                f.write("#{}\n".format(get_time_str()))
-                for job in job_list:
-                    f.write(job + "\n")
+    """
+    Write the full snapshot of the calculation status. It is kept for backward compatibility. See Cal_status_dict_operation.write_cal_status
+    """
+    Cal_status_dict_operation.write_cal_status(cal_status=cal_status, filename=filename)
 
 
 # In[ ]:
@@ -15,7 +15,7 @@ if HTC_package_path not in sys.path:
     sys.path.append(HTC_package_path)
 ##############################################################################################################
 
-from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str
+from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str, decorated_os_rename
 
 
 # In[2]:
@@ -127,18 +127,16 @@ def change_signal_file(cal_status_dict, filename="__change_signal_file__"):
         log_f.write(get_time_str() + " ")
         log_f.write("The status for the below calculations will be changed from {} to {}:\n".format(setup_dict["original_signal_file"], setup_dict["target_signal_file"]))
     for target_cal_folder in target_cal_folder_list:
-        os.rename(os.path.join(target_cal_folder, setup_dict["original_signal_file"]), os.path.join(target_cal_folder, setup_dict["target_signal_file"]))
+        decorated_os_rename(loc=target_cal_folder, old_filename=setup_dict["original_signal_file"], new_filename=setup_dict["target_signal_file"])
         with open(os.path.join(target_cal_folder, "log.txt"), "a") as log_f:
             log_f.write("{}: Signal File Change:\n".format(get_time_str()))
             log_f.write("\tThis calculation is chosen and its status is changed from {} to {}\n".format(setup_dict["original_signal_file"], setup_dict["target_signal_file"]))
         
-        cal_status_dict[target_status_key].append(target_cal_folder)
-        
         with open(log_filename, "a") as log_f:
             log_f.write(get_time_str() + " Done ")
             log_f.write(target_cal_folder + "\n")
     
-    cal_status_dict[target_status_key] = sorted(cal_status_dict[target_status_key])
+    cal_status_dict[target_status_key] = sorted(cal_status_dict[target_status_key] + target_cal_folder_list)
     
     return cal_status_dict
 
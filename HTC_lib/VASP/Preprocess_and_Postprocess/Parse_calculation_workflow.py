@@ -395,7 +395,8 @@ def parse_firework_block(block_str_list, step_no, HTC_lib_loc):
                     "incar_cmd", "kpoints_cmd", "poscar_cmd", "potcar_cmd", "cmd_to_process_finished_jobs",
                     "sub_dir_cal", "sub_dir_cal_cmd", "preview_vasp_inputs",
                     "skip_this_step",
-                    "max_workers",
+                    "max_workers", "cal_status_index", "incremental_scan", "cal_status_journal_interval", "warm_start", "mpi_dynamic_chunk_size", "queue_snapshot_ttl", "max_concurrent_submissions",
+                    "retry_max_tries", "retry_base_delay", "retry_max_delay", "retry_time_budget", "circuit_breaker_threshold", "circuit_breaker_cooldown",
                     "job_submission_script", "job_submission_command", "job_name", "max_running_job", "where_to_parse_queue_id",
                     "re_to_parse_queue_id", "job_query_command", "job_killing_command", "queue_stdout_file_prefix", "queue_stdout_file_suffix",
                     "queue_stderr_file_prefix", "queue_stderr_file_suffix", "vasp.out", 
@@ -707,6 +708,39 @@ def parse_firework_block(block_str_list, step_no, HTC_lib_loc):
             firework["max_workers"] = int(firework["max_workers"])
         else:
             firework["max_workers"] = None
+            
+        #If cal_status_index is on, the calculation status is also saved into an SQLite database ${HTC_CWD}/htc_job_status.sqlite3
+        #The htc main scripts read the calculation status from it at start-up rather than scanning all calculations.
+        firework["cal_status_index"] = True if 'y' in firework.get("cal_status_index", "No").lower() else False
+        
+        #If incremental_scan is on, the htc main scripts scan the status of all calculations in every loop incrementally.
+        #Only those material folders under which any directory's mtime has changed since the previous scan are listed again. See Incremental_cal_status_scanner
+        firework["incremental_scan"] = True if 'y' in firework.get("incremental_scan", "No").lower() else False
+        
+        #If cal_status_journal_interval > 1, the changes in the calculation status are appended to ${HTC_CWD}/htc_job_status_journal.jsonl
+        #and htc_job_status.json & htc_job_status_folder are only regenerated after every cal_status_journal_interval changes. See Cal_status_journal
+        firework["cal_status_journal_interval"] = int(firework.get("cal_status_journal_interval", 0))
+        
+        #If warm_start is on, the htc main scripts resume from the last saved calculation status at start-up and only rescan the changed material folders.
+        firework["warm_start"] = True if 'y' in firework.get("warm_start", "No").lower() else False
+        
+        #If mpi_dynamic_chunk_size > 0, htc_main_mpi.py hands out chunks of mpi_dynamic_chunk_size tasks on demand instead of dividing all tasks evenly among processes.
+        firework["mpi_dynamic_chunk_size"] = int(firework.get("mpi_dynamic_chunk_size", 0))
+        
+        #The output of job_query_command is cached and shared for queue_snapshot_ttl seconds. See HTC_lib/VASP/Job_Management/Queue_snapshot.py
+        firework["queue_snapshot_ttl"] = float(firework.get("queue_snapshot_ttl", 60))
+        
+        #At most max_concurrent_submissions jobs are submitted at the same time. See submit_jobs_in_bulk in HTC_lib/VASP/Job_Management/Submit_and_Kill_job.py
+        firework["max_concurrent_submissions"] = int(firework.get("max_concurrent_submissions", 1))
+        
+        #The job query, submission and killing commands are retried with exponential backoff and jitter, and a circuit breaker stops issuing them
+        #for circuit_breaker_cooldown seconds after circuit_breaker_threshold failed calls in a row. See HTC_lib/VASP/Miscellaneous/Retry_policy.py
+        firework["retry_max_tries"] = int(firework.get("retry_max_tries", 10))
+        firework["retry_base_delay"] = float(firework.get("retry_base_delay", 1))
+        firework["retry_max_delay"] = float(firework.get("retry_max_delay", 60))
+        firework["retry_time_budget"] = float(firework.get("retry_time_budget", 300))
+        firework["circuit_breaker_threshold"] = int(firework.get("circuit_breaker_threshold", 3))
+        firework["circuit_breaker_cooldown"] = float(firework.get("circuit_breaker_cooldown", 300))
                     
         #set the calculation folder, structure folder, max_running_job
         if "cal_folder" not in firework.keys():
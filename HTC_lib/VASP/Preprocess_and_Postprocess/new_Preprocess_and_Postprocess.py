@@ -22,6 +22,7 @@ from HTC_lib.VASP.Miscellaneous.Execute_bash_shell_cmd import Execute_shell_cmd
 from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation
 
 from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import check_calculations_status, are_all_cal_for_a_material_complete
+from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import get_preloaded_workflow
 
 from HTC_lib.VASP.INCAR.modify_vasp_incar import modify_vasp_incar
 
@@ -120,6 +121,14 @@ def pre_and_post_process(cif_filename, cif_folder, cal_folder, workflow):
     return no_of_new_ready_jobs, cal_status_diff
 
 
+def pre_and_post_process_with_preloaded_workflow(cif_filename, cif_folder, cal_folder):
+    """
+    Same as pre_and_post_process, but read the workflow preloaded in the worker process of the pool created by 
+    HTC_lib/VASP/Job_Management/Check_and_update_calculation_status.create_worker_pool
+    """
+    return pre_and_post_process(cif_filename=cif_filename, cif_folder=cif_folder, cal_folder=cal_folder, workflow=get_preloaded_workflow())
+
+
 # In[6]:
 
 
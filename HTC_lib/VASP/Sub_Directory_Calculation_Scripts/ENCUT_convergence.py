@@ -16,6 +16,7 @@ if HTC_package_path not in sys.path:
 ##############################################################################################################
 
 from HTC_lib.VASP.INCAR.modify_vasp_incar import modify_vasp_incar
+from HTC_lib.VASP.Miscellaneous.Query_from_OSZICAR import find_last_ionic_step_from_OSZICAR
 
 
 # In[1]:
@@ -363,11 +364,8 @@ def find_converged_encut(argv_dict):
     for encut in argv_dict["encut_list"]:
         sub_dir_name = "encut_" + str(encut)
         
-        with open(os.path.join(sub_dir_name, "OSZICAR"), "r") as oszicar:
-            for line in oszicar:
-                pass
         try:
-            energy = float(re.search("E0=([\s0-9E\.\-\+]+)d E", line)[1].strip())
+            energy = find_last_ionic_step_from_OSZICAR(cal_loc=sub_dir_name)["E0"]
             energy_list.append(energy)
         except:
             open("__fail_to_parse_energy_E0_from_{}__".format(sub_dir_name + "_OSZICAR"), "w").close()
@@ -16,6 +16,7 @@ if HTC_package_path not in sys.path:
 ##############################################################################################################
 
 from HTC_lib.VASP.INCAR.modify_vasp_incar import modify_vasp_incar
+from HTC_lib.VASP.Miscellaneous.Mapped_output_file import Mapped_output_file
 
 
 # In[1]:
@@ -260,11 +261,11 @@ def find_converged_sigma(argv_dict):
         sub_dir_name = "sigma_" + str(sigma)
 
         is_TS_found = False
-        with open(os.path.join(sub_dir_name, "OUTCAR"), "r") as outcar:
-            for line in outcar:
-                if "entropy T*S    EENTRO =" in line:
-                    last_TS = float(line.split("=")[1].strip())
-                    is_TS_found = True
+        with Mapped_output_file(os.path.join(sub_dir_name, "OUTCAR")) as outcar:
+            offset = outcar.find_last(b"entropy T*S    EENTRO =")
+            if offset != -1:
+                last_TS = float(outcar.get_line(offset).decode().split("=")[1].strip())
+                is_TS_found = True
         if is_TS_found == False:#"Fail to parse T*S from {}".format(os.path.join(sub_dir_name, "OUTCAR"))
             open("__fail_to_parse_TS_from_OUTCAR_under_{}__".format(sub_dir_name), "w").close()
             return -1
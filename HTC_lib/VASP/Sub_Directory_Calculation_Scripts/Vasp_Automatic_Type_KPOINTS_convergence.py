@@ -16,6 +16,7 @@ if HTC_package_path not in sys.path:
 ##############################################################################################################
     
 from HTC_lib.VASP.KPOINTS.VASP_Automatic_K_Mesh import VaspAutomaticKMesh
+from HTC_lib.VASP.Miscellaneous.Query_from_OSZICAR import find_last_ionic_step_from_OSZICAR
 
 
 # In[1]:
@@ -509,11 +510,8 @@ def find_converged_NL(argv_dict):
                 open("__fail_to_parse_the_number_of_k_points_in_IRBZ_from_{}__".format(sub_dir_name + "_IBZKPT"), "w").close()
                 return 0
                 
-        with open(os.path.join(sub_dir_name, "OSZICAR"), "r") as oszicar:
-            for line in oszicar:
-                pass
         try:
-            energy = float(re.search("E0=([\s0-9E\.\-\+]+)d E", line)[1].strip())
+            energy = find_last_ionic_step_from_OSZICAR(cal_loc=sub_dir_name)["E0"]
             Nk_IRBZ_dict[Nk_IRBZ]["energy"] = energy
         except:
             open("__fail_to_parse_energy_E0_from_{}__".format(os.path.join(sub_dir_name, "OSZICAR")), "w").close()
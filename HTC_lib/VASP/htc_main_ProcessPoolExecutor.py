@@ -19,14 +19,19 @@ if HTC_package_path not in sys.path:
 from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str
 from HTC_lib.VASP.Miscellaneous.Backup_HTC_input_files import backup_htc_input_files, backup_a_file
 from HTC_lib.VASP.Miscellaneous.change_signal_file import change_signal_file
-from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation, Cal_status_store, Cal_status_journal
+from HTC_lib.VASP.Miscellaneous.Cal_status_index import Cal_status_index
+from HTC_lib.VASP.Miscellaneous.Retry_policy import Retry_policy, Circuit_open_error
 
 from HTC_lib.VASP.Preprocess_and_Postprocess.Parse_calculation_workflow import parse_calculation_workflow
-from HTC_lib.VASP.Preprocess_and_Postprocess.new_Preprocess_and_Postprocess import pre_and_post_process
+from HTC_lib.VASP.Preprocess_and_Postprocess.new_Preprocess_and_Postprocess import pre_and_post_process_with_preloaded_workflow
 from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import check_calculations_status, update_job_status
+from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import create_worker_pool, check_calculations_status_with_preloaded_workflow, update_job_status_with_preloaded_workflow
+from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import Incremental_cal_status_scanner
+from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import load_cal_status_checkpoint, warm_start_cal_status
 from HTC_lib.VASP.Job_Management.Submit_and_Kill_job import submit_jobs
 
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
 
 
 # In[2]:
@@ -115,18 +120,41 @@ if __name__ == "__main__":
     go_to_sub_signal_file_path = os.path.join(main_dir, "__go_to_submission__")
     scan_all_file_path = os.path.join(main_dir, "__scan_all__")
     forced_sleep_file_path = os.path.join(main_dir, "__forced_sleep__")
+    retry_policy_counter_file_path = os.path.join(main_dir, "htc_retry_policy_counters.json")
     
     signal_file_list = ["__stop__", "__update_now__", "__update_input__", "__change_signal_file__", 
                         "__go_to_submission__", "__scan_all__"]
     
-    open(scan_all_file_path, "w").close() 
-    output_str = "{}: created __scan_all__ to ask the program to scan the status of all calculations.\n".format(get_time_str())
-    output_str += "\tLater scanning only involves those calculations which are automatically updated by the program.\n"
-    output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
-    print(output_str, flush=True)
-    
     print("{}: reading the pre-defined calculation workflow".format(get_time_str()), flush=True)
     workflow = read_workflow()
+    
+    cal_status_index = Cal_status_index.from_workflow(workflow)
+    if workflow[0]["warm_start"] and os.path.isdir(workflow[0]["cal_folder"]):
+        checkpoint_cal_status, checkpoint_time = load_cal_status_checkpoint(workflow)
+    else:
+        checkpoint_cal_status, checkpoint_time = None, None
+    if checkpoint_cal_status != None:
+        print("{}: warm start from the calculation status saved at {}".format(get_time_str(), time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime(checkpoint_time))), flush=True)
+        total_cal_status, rescanned_mat_folder_name_list = warm_start_cal_status(cal_folder=workflow[0]["cal_folder"], workflow=workflow, 
+                                                                                 cal_status_dict=Cal_status_store(checkpoint_cal_status), checkpoint_time=checkpoint_time)
+        if cal_status_index != None:
+            cal_status_index.reconcile(total_cal_status)
+        output_str = "{}: finished the warm start. {} material folders changed since then and were rescanned.\n".format(get_time_str(), len(rescanned_mat_folder_name_list))
+        output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
+        print(output_str, flush=True)
+        del checkpoint_cal_status, rescanned_mat_folder_name_list
+    elif cal_status_index != None and not cal_status_index.is_empty():
+        total_cal_status = Cal_status_store(cal_status_index.load_cal_status_dict())
+        output_str = "{}: read the calculation status from the calculation status index {}.\n".format(get_time_str(), cal_status_index.db_filename)
+        output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
+        print(output_str, flush=True)
+    else:
+        open(scan_all_file_path, "w").close() 
+        output_str = "{}: created __scan_all__ to ask the program to scan the status of all calculations.\n".format(get_time_str())
+        output_str += "\tLater scanning only involves those calculations which are automatically updated by the program.\n"
+        output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
+        print(output_str, flush=True)
+    
     structure_file_folder = workflow[0]["structure_folder"]
     cal_folder = workflow[0]["cal_folder"]
     max_workers = workflow[0]["max_workers"]
@@ -134,6 +162,10 @@ if __name__ == "__main__":
     print("{}: finished reading the pre-defined calculation workflow".format(get_time_str()), flush=True)
     if not os.path.isdir(cal_folder):
         os.mkdir(cal_folder)
+    cal_status_scanner = Incremental_cal_status_scanner(cal_folder=cal_folder) if workflow[0]["incremental_scan"] else None
+    cal_status_journal = Cal_status_journal(filename=htc_job_status_file_path, compaction_interval=workflow[0]["cal_status_journal_interval"])
+    #A long-lived worker pool in which every worker process loads the workflow once. It is re-created only if __update_input__ is detected.
+    worker_pool = create_worker_pool(workflow)
     
     print("{}: starts to backup htc files".format(get_time_str()), flush=True)
     try:
@@ -184,6 +216,15 @@ if __name__ == "__main__":
             
             max_workers = workflow[0]["max_workers"]
             assert isinstance(max_workers, int), "Since you are trying to deploy ProcessPoolExecutor for parallel computing, 'max_workers' should be provided in the first step and should be a positive integer."
+            cal_status_index = Cal_status_index.from_workflow(workflow)
+            worker_pool.shutdown(wait=True)
+            worker_pool = create_worker_pool(workflow)
+            if cal_status_index != None and not os.path.isfile(scan_all_file_path):
+                cal_status_index.reconcile(total_cal_status)
+            cal_status_scanner = Incremental_cal_status_scanner(cal_folder=cal_folder) if workflow[0]["incremental_scan"] else None
+            if cal_status_journal.compaction_interval != workflow[0]["cal_status_journal_interval"]:
+                cal_status_journal.close(total_cal_status)
+                cal_status_journal = Cal_status_journal(filename=htc_job_status_file_path, compaction_interval=workflow[0]["cal_status_journal_interval"])
         #finish the updated pre-defined calculation workflow
         ##############################################################
         
@@ -195,19 +236,39 @@ if __name__ == "__main__":
         ##Start of "Update calculation status"
         if os.path.isfile(scan_all_file_path):
             print("{}: __scan_all__ is detected. Start scanning all folders under {}".format(get_time_str(), main_dir), flush=True)
-            mat_folder_name_list = [[mat_folder_name] for mat_folder_name in os.listdir(cal_folder)] #os.listdir excludes entry '.'
-            length = len(mat_folder_name_list)
-            cal_folder_list, workflow_list = [cal_folder] * length, [workflow] * length
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                cal_status_dict_list = list(executor.map(check_calculations_status, cal_folder_list, workflow_list, mat_folder_name_list))
-            del mat_folder_name_list, cal_folder_list, workflow_list, length
-            total_cal_status = Cal_status_dict_operation.merge_dicts(a_list_of_dicts=cal_status_dict_list)
+            if cal_status_scanner != None:
+                #A new scanner forgets everything and hence scans all folders from scratch.
+                cal_status_scanner = Incremental_cal_status_scanner(cal_folder=cal_folder)
+                total_cal_status = cal_status_scanner.scan(executor=worker_pool)
+            else:
+                mat_folder_name_list = [[mat_folder_name] for mat_folder_name in os.listdir(cal_folder)] #os.listdir excludes entry '.'
+                cal_folder_list = [cal_folder] * len(mat_folder_name_list)
+                cal_status_dict_list = list(worker_pool.map(check_calculations_status_with_preloaded_workflow, cal_folder_list, mat_folder_name_list))
+                del mat_folder_name_list, cal_folder_list
+                total_cal_status = Cal_status_dict_operation.merge_dicts(a_list_of_dicts=cal_status_dict_list)
+            total_cal_status = Cal_status_store(total_cal_status)
             for tag in ["ready_folder_list", "prior_ready_folder_list"]:
                 if tag not in total_cal_status.keys():
                     total_cal_status[tag] = []
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
+            if cal_status_index != None:
+                cal_status_index.reconcile(total_cal_status)
             os.remove(scan_all_file_path)
             print("{}: removed __scan_all__".format(get_time_str()), flush=True)
+        elif cal_status_scanner != None and not os.path.isfile(go_to_sub_signal_file_path) and not os.path.isfile(update_input_file_path):
+            print("{}: Start the incremental scan of all folders under {}".format(get_time_str(), cal_folder), flush=True)
+            new_total_cal_status = cal_status_scanner.scan(executor=worker_pool)
+            for tag in ["ready_folder_list", "prior_ready_folder_list"]:
+                if tag not in new_total_cal_status.keys():
+                    new_total_cal_status[tag] = []
+            total_cal_status_diff = Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=total_cal_status, new_cal_status_dict=new_total_cal_status)
+            total_cal_status = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=total_cal_status, cal_status_dict_diff=total_cal_status_diff)
+            if cal_status_index != None:
+                cal_status_index.apply_cal_status_diff(total_cal_status_diff)
+            del new_total_cal_status
+            output_str = "{}: finished the incremental scan. {} directories were listed. ".format(get_time_str(), cal_status_scanner.no_of_listed_dirs)
+            output_str += "The status of {} calculations was found changed.".format(len(set(total_cal_status_diff["removed"]).union(total_cal_status_diff["updated"].keys())))
+            print(output_str, flush=True)
         
         if os.path.isfile(scan_all_file_path) or os.path.isfile(go_to_sub_signal_file_path) or os.path.isfile(update_input_file_path):
             print("{}: __scan_all__, __go_to_submission__ or __update_input__ is detected under HTC_CWD. Skip job status update.".format(get_time_str()), flush=True)
@@ -217,20 +278,31 @@ if __name__ == "__main__":
                 print("{}: starts updating {}".format(get_time_str(), which_status), flush=True)
                 if which_status not in  total_cal_status.keys():
                     continue
-                if which_status == "running_folder_list":
-                    #In this case, we put the ProcessPoolExecutor based parallization into function update_job_status.
-                    #As such, the defined job_query_command will be just called ONCE to take care of all to-be-updated jobs originally tagged by __running__.
-                    #If the below else clause is adopted, job_query_command will be repeatedly called - One call each job. That's a very intensive request for the job scheduler.
-                    total_cal_status_diff = update_job_status(cal_folder=cal_folder, workflow=workflow, which_status=which_status, job_list=total_cal_status[which_status])
-                else:
-                    job_list = [[job] for job in total_cal_status[which_status]]
-                    length = len(job_list)             
-                    cal_folder_list, workflow_list, which_status_list = [cal_folder] * length, [workflow] * length, [which_status] * length
-                    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                        cal_status_diff_dict_list = list(executor.map(update_job_status, cal_folder_list, workflow_list, which_status_list, job_list))
-                    total_cal_status_diff = Cal_status_dict_operation.merge_cal_status_diff(a_list_of_cal_status_diff=cal_status_diff_dict_list)
-                    del cal_folder_list, workflow_list, which_status_list, length, job_list
+                try:
+                    if which_status == "running_folder_list":
+                        #In this case, we put the ProcessPoolExecutor based parallization into function update_job_status.
+                        #As such, the defined job_query_command will be just called ONCE to take care of all to-be-updated jobs originally tagged by __running__.
+                        #If the below else clause is adopted, job_query_command will be repeatedly called - One call each job. That's a very intensive request for the job scheduler.
+                        total_cal_status_diff = update_job_status(cal_folder=cal_folder, workflow=workflow, which_status=which_status, 
+                                                                  job_list=total_cal_status[which_status], executor=worker_pool)
+                    elif which_status == "error_folder_list":
+                        #All error jobs are sent in one call so that kill_error_jobs can kill them in bulk, i.e. a few calls of the job killing command.
+                        total_cal_status_diff = update_job_status(cal_folder=cal_folder, workflow=workflow, which_status=which_status, 
+                                                                  job_list=total_cal_status[which_status])
+                    else:
+                        job_list = [[job] for job in total_cal_status[which_status]]
+                        length = len(job_list)             
+                        cal_folder_list, which_status_list = [cal_folder] * length, [which_status] * length
+                        cal_status_diff_dict_list = list(worker_pool.map(update_job_status_with_preloaded_workflow, cal_folder_list, which_status_list, job_list))
+                        total_cal_status_diff = Cal_status_dict_operation.merge_cal_status_diff(a_list_of_cal_status_diff=cal_status_diff_dict_list)
+                        del cal_folder_list, which_status_list, length, job_list
+                except Circuit_open_error as err:
+                    #The job scheduler keeps failing. Skip the rest of the update in this cycle and try again after the sleep at the end of the cycle.
+                    print("{}: {}\n\tSkip the update of {} and the remaining statuses in this cycle.".format(get_time_str(), err, which_status), flush=True)
+                    break
                 total_cal_status = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=total_cal_status, cal_status_dict_diff=total_cal_status_diff)
+                if cal_status_index != None:
+                    cal_status_index.apply_cal_status_diff(total_cal_status_diff)
                 
                 is_signal_file_found = False
                 for file in os.listdir(main_dir):
@@ -242,7 +314,7 @@ if __name__ == "__main__":
                     break
                         
                 print("{}: finished update of {}".format(get_time_str(), which_status), flush=True)
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
         ##END of "Update calculation status"
         #########################################################################
           
@@ -251,7 +323,7 @@ if __name__ == "__main__":
         handle_stop_update_now_n_change_signal_file(signal_file_path=update_now_file_path)
         if not os.path.isfile(scan_all_file_path):
             total_cal_status = handle_stop_update_now_n_change_signal_file(signal_file_path=change_signal_file_path, total_cal_status=total_cal_status)
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
             
         #########################################################################
         ##Start of "Prepare VASP input files"   
@@ -259,37 +331,48 @@ if __name__ == "__main__":
             print("{}: __scan_all__, __go_to_submission__ or __update_input__ is detected under HTC_CWD. Skip vasp input file preparation.".format(get_time_str()), flush=True)
         else:
             structure_file_list = os.listdir(structure_file_folder)
-            group_size = max_workers * 2
-            max_group_ind = int(len(structure_file_list) / group_size) + 1
-            max_no_of_ready_jobs = workflow[0]["max_no_of_ready_jobs"] - len(total_cal_status["ready_folder_list"]) - len(total_cal_status["prior_ready_folder_list"])
-            for group_ind in range(max_group_ind+1):
-                structure_file_sublist = structure_file_list[group_ind*group_size:(group_ind+1)*group_size]
-                length = len(structure_file_sublist)
-                structure_file_folder_list, cal_folder_list, workflow_list = [structure_file_folder]*length, [cal_folder]*length, [workflow]*length
-                with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                    output = executor.map(pre_and_post_process, structure_file_sublist, structure_file_folder_list, cal_folder_list, workflow_list)
-                    cal_status_dict_diff_list = []
-                    for no_of_new_ready_jobs, cal_status_dict_diff in output:
-                        max_no_of_ready_jobs -= no_of_new_ready_jobs
-                        cal_status_dict_diff_list.append(cal_status_dict_diff)
-                del length, structure_file_folder_list, cal_folder_list, workflow_list
-                total_cal_status_diff = Cal_status_dict_operation.merge_cal_status_diff(a_list_of_cal_status_diff=cal_status_dict_diff_list)
-                total_cal_status = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=total_cal_status, cal_status_dict_diff=total_cal_status_diff)
-                print("{}: finished input preparation for {}".format(get_time_str(), ", ".join(structure_file_sublist)), flush=True)
+            #At most in_flight_window structures are under preparation or queued in the worker pool at any time.
+            #Whenever one finishes, its cal_status_diff is applied and the next structure is submitted, so that a slow structure does not idle the other workers.
+            in_flight_window = max_workers * 2
+            max_no_of_ready_jobs = workflow[0]["max_no_of_ready_jobs"] - total_cal_status.count("ready_folder_list") - total_cal_status.count("prior_ready_folder_list")
+            structure_file_iter = iter(structure_file_list)
+            future_structure_file_dict, is_submission_stopped = {}, max_no_of_ready_jobs <= 0
+            while True:
+                while not is_submission_stopped and len(future_structure_file_dict) < in_flight_window:
+                    structure_file = next(structure_file_iter, None)
+                    if structure_file == None:
+                        is_submission_stopped = True
+                    else:
+                        future = worker_pool.submit(pre_and_post_process_with_preloaded_workflow, structure_file, structure_file_folder, cal_folder)
+                        future_structure_file_dict[future] = structure_file
+                if not future_structure_file_dict:
+                    break
+                
+                future = next(as_completed(future_structure_file_dict.keys()))
+                structure_file = future_structure_file_dict.pop(future)
+                no_of_new_ready_jobs, cal_status_dict_diff = future.result()
+                max_no_of_ready_jobs -= no_of_new_ready_jobs
+                total_cal_status = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=total_cal_status, cal_status_dict_diff=cal_status_dict_diff)
+                if cal_status_index != None:
+                    cal_status_index.apply_cal_status_diff(cal_status_dict_diff)
+                print("{}: finished input preparation for {}".format(get_time_str(), structure_file), flush=True)
                 
+                if is_submission_stopped:
+                    continue
                 if max_no_of_ready_jobs <= 0:
-                    break
-                is_signal_file_found = False
-                for file in os.listdir(main_dir):
-                    if file in signal_file_list:
-                        print("{}: {} is detected under HTC_CWD. Stop preparation of VASP input files".format(get_time_str(), file), flush=True)
-                        is_signal_file_found = True
-                        break
-                if is_signal_file_found:
-                    break
-                del is_signal_file_found
-                        
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+                    is_submission_stopped = True
+                else:
+                    for file in os.listdir(main_dir):
+                        if file in signal_file_list:
+                            print("{}: {} is detected under HTC_CWD. Stop preparation of VASP input files".format(get_time_str(), file), flush=True)
+                            is_submission_stopped = True
+                            break
+                if is_submission_stopped:
+                    #Withdraw the submitted structures which have not been started by any worker. The started ones are waited for.
+                    for future in [future for future in future_structure_file_dict.keys() if future.cancel()]:
+                        future_structure_file_dict.pop(future)
+            del structure_file_iter, future_structure_file_dict, is_submission_stopped
+            cal_status_journal.write(total_cal_status)
             print("{}: finished input file preparation".format(get_time_str()), flush=True)
             # END of "Prepare VASP input files"
         ###############################################################################
@@ -299,7 +382,7 @@ if __name__ == "__main__":
         handle_stop_update_now_n_change_signal_file(signal_file_path=update_now_file_path)
         if os.path.isfile(scan_all_file_path):
             total_cal_status = handle_stop_update_now_n_change_signal_file(signal_file_path=change_signal_file_path, total_cal_status=total_cal_status)
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
             
         ###############################################################################
         ##Start of "Job submission"
@@ -312,22 +395,29 @@ if __name__ == "__main__":
             print("{}: starts submitting ready jobs".format(get_time_str()), flush=True)
             
             #submit jobs.
-            submitted_job_list = submit_jobs(cal_jobs_status=total_cal_status, workflow=workflow, max_jobs_in_queue=workflow[0]["max_running_job"])
+            try:
+                submitted_job_list = submit_jobs(cal_jobs_status=total_cal_status, workflow=workflow, max_jobs_in_queue=workflow[0]["max_running_job"])
+            except Circuit_open_error as err:
+                print("{}: {}\n\tSkip the job submission in this cycle.".format(get_time_str(), err), flush=True)
+                submitted_job_list = []
             
             #update the status of the submitted jobs
             length = len(submitted_job_list)
-            cal_folder_list, workflow_list, mat_folder_name_list = [cal_folder] * length, [workflow] * length, [None] * length
+            cal_folder_list, mat_folder_name_list = [cal_folder] * length, [None] * length
             submitted_job_list = [[job] for job in submitted_job_list]
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                cal_status_list = list(executor.map(check_calculations_status, cal_folder_list, workflow_list, mat_folder_name_list, submitted_job_list))
-            del submitted_job_list, length, cal_folder_list, workflow_list, mat_folder_name_list
+            cal_status_list = list(worker_pool.map(check_calculations_status_with_preloaded_workflow, cal_folder_list, mat_folder_name_list, submitted_job_list))
+            del submitted_job_list, length, cal_folder_list, mat_folder_name_list
             new_cal_status = Cal_status_dict_operation.merge_dicts(cal_status_list)
             pseudo_old_cal_status = check_calculations_status(cal_folder=cal_folder, workflow=workflow, cal_loc_list=[])
             cal_status_diff = Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=pseudo_old_cal_status, new_cal_status_dict=new_cal_status)
             total_cal_status = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=total_cal_status, cal_status_dict_diff=cal_status_diff)
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            if cal_status_index != None:
+                cal_status_index.apply_cal_status_diff(cal_status_diff)
+            cal_status_journal.write(total_cal_status)
     
             print("{}: completed job submission.".format(get_time_str()), flush=True)
+        #The counters of the retried job query/submission/killing commands, e.g. for monitoring how busy the job scheduler is.
+        Retry_policy.write_counters(retry_policy_counter_file_path)
         ##END of "Job submission"
         ###############################################################################
             
@@ -336,14 +426,15 @@ if __name__ == "__main__":
         handle_stop_update_now_n_change_signal_file(signal_file_path=update_now_file_path)
         if not os.path.isfile(scan_all_file_path):
             total_cal_status = handle_stop_update_now_n_change_signal_file(signal_file_path=change_signal_file_path, total_cal_status=total_cal_status)
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
             
         ################################################################################
         #check if all calculations are complete. If this is the case, stop. At the end, all calculations should be labeled by signal file __done__, __skipped__, and __done_cleaned_analyzed__
-        no_of_ongoing_jobs = sum([len(job_list) for job_status, job_list in total_cal_status.items() if job_status not in ["done_folder_list", "skipped_folder_list", "done_cleaned_analyzed_folder_list"]])
+        no_of_ongoing_jobs = sum([total_cal_status.count(job_status) for job_status in total_cal_status.keys() if job_status not in ["done_folder_list", "skipped_folder_list", "done_cleaned_analyzed_folder_list"]])
         if no_of_ongoing_jobs == 0:
             output_str = "{}: all calculations have finished, i.e. all calculations are labelled by __done__, __skipped__, and __done_cleaned_analyzed__ only --> Stop this program.".format(get_time_str())
             print(output_str, flush=True)
+            cal_status_journal.close(total_cal_status)
             with open(htc_job_status_file_path, "a") as f:
                 f.write("\n***" + output_str + "***")
             break
@@ -352,10 +443,11 @@ if __name__ == "__main__":
         if total_cal_status == total_cal_status_0:
             no_of_same_cal_status += 1
         else:
-            total_cal_status_0 = total_cal_status
+            total_cal_status_0 = total_cal_status.copy() #total_cal_status is updated in place. See Cal_status_store
             no_of_same_cal_status = 0
         if no_of_same_cal_status == 200:
             output_str = "{}: All jobs' statuses remain unchanged for a long time. Stop this program.".format(get_time_str())
+            cal_status_journal.close(total_cal_status)
             with open(htc_job_status_file_path, "a") as f:
                 f.write("\n***{}***".format(output_str))
             print(output_str, flush=True)
@@ -383,7 +475,11 @@ if __name__ == "__main__":
         handle_stop_update_now_n_change_signal_file(signal_file_path=update_now_file_path)
         if not os.path.isfile(scan_all_file_path):
             total_cal_status = handle_stop_update_now_n_change_signal_file(signal_file_path=change_signal_file_path, total_cal_status=total_cal_status)
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
             
         print("\n{}: ***Arrives at the end of the while loop. Will enter the next round of iteration.***\n".format(get_time_str()), flush=True)
-
+    
+    #Regenerate htc_job_status.json and htc_job_status_folder if there is any pending record in the status journal.
+    if cal_status_journal.no_of_records > 0:
+        cal_status_journal.close(total_cal_status)
+    worker_pool.shutdown(wait=True)
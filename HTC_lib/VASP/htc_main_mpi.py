@@ -19,11 +19,16 @@ from pathlib import Path
 from HTC_lib.VASP.Miscellaneous.Utilities import get_time_str
 from HTC_lib.VASP.Miscellaneous.Backup_HTC_input_files import backup_htc_input_files, backup_a_file
 from HTC_lib.VASP.Miscellaneous.change_signal_file import change_signal_file
-from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation, divide_a_list_evenly
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation, Cal_status_store, Cal_status_journal, divide_a_list_evenly
+from HTC_lib.VASP.Miscellaneous.Cal_status_table import Cal_status_table
+from HTC_lib.VASP.Miscellaneous.Cal_status_index import Cal_status_index
+from HTC_lib.VASP.Miscellaneous.Retry_policy import Retry_policy, Circuit_open_error
 
 from HTC_lib.VASP.Preprocess_and_Postprocess.Parse_calculation_workflow import parse_calculation_workflow
 from HTC_lib.VASP.Preprocess_and_Postprocess.new_Preprocess_and_Postprocess import pre_and_post_process
 from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import check_calculations_status, update_job_status
+from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import Incremental_cal_status_scanner
+from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import load_cal_status_checkpoint, warm_start_cal_status
 from HTC_lib.VASP.Job_Management.Submit_and_Kill_job import submit_jobs, kill_error_jobs
 
 try:
@@ -44,6 +49,10 @@ except:
             return data[0]
         def bcast(self, data, root=0):
             return data
+        def allgather(self, data):
+            return [data]
+        def Barrier(self):
+            pass
     comm = Comm_World()
     comm.is_comm_pseudo = True
     
@@ -93,17 +102,100 @@ def backup_htc_files(workflow):
 def synchron(comm, rank, size):
     if comm.is_comm_pseudo == True:
         return 0
-    buf = None
-    if rank == 0:
-        for ip in range(1,size):
-            comm.send(buf,dest=ip)
-            buf=comm.recv(source=ip)
-        for ip in range(1,size):
-            comm.send(buf,dest=ip)
-    else:
-        buf=comm.recv(source=0)
-        comm.send(buf,dest=0)
-        buf = comm.recv(source=0)
+    comm.Barrier()
+    
+#The token ring below costs 3*(size-1) point-to-point messages passed one after another through process 0. It is replaced by comm.Barrier above.
+#     buf = None
+#     if rank == 0:
+#         for ip in range(1,size):
+#             comm.send(buf,dest=ip)
+#             buf=comm.recv(source=ip)
+#         for ip in range(1,size):
+#             comm.send(buf,dest=ip)
+#     else:
+#         buf=comm.recv(source=0)
+#         comm.send(buf,dest=0)
+#         buf = comm.recv(source=0)
+
+
+# In[4]:
+
+
+def dynamically_schedule_in_parallel(comm, rank, size, task_list, chunk_func, chunk_size, is_to_stop=None):
+    """
+    Process tasks in the dynamic master-worker mode. Process 0 divides task_list into chunks of chunk_size tasks and hands them out on demand:
+    a process is sent the next chunk as soon as it reports the result of the previous one. If size > 1, process 0 only hands out chunks and collects results,
+    so that a worker which finishes a chunk never waits for process 0 to finish a chunk of its own. If size == 1, process 0 processes all chunks by itself.
+    Hence no worker idles as long as there are unprocessed chunks, and the time to process all tasks approaches the total work divided by size - 1
+    rather than being set by the slowest process.
+    This function must be called by all processes.
+    input arguments:
+        - task_list (list): a list of tasks. Only used in process 0.
+        - chunk_func (function): chunk_func(chunk) processes a chunk, i.e. a sublist of task_list, and returns a picklable result.
+        - chunk_size (int): the number of tasks in a chunk.
+        - is_to_stop (function): if provided, process 0 calls is_to_stop(result) whenever the result of a chunk is obtained.
+                Once it returns True, no more chunks are handed out. Default: None
+    Return the list of the results of all processed chunks in process 0, or an empty list in the other processes. Note that the results are not in the order of task_list.
+    If chunk_func raises an exception in any process, no more chunks are handed out and the exception is re-raised in that process after every process
+    finishes its current chunk.
+    """
+    task_tag, result_tag = 11, 12
+    error = None
+    
+    if rank != 0:
+        while True:
+            chunk = comm.recv(source=0, tag=task_tag)
+            if chunk == None:
+                break
+            try:
+                result = chunk_func(chunk)
+            except Exception as e:
+                error, result = e, None
+            comm.send((error == None, result), dest=0, tag=result_tag)
+        if error != None:
+            raise error
+        return []
+    
+    chunk_list = [task_list[ind:ind+chunk_size] for ind in range(0, len(task_list), chunk_size)][::-1]
+    result_list, is_stopped, no_of_busy_processes, request_list = [], False, 0, []
+    if size == 1:
+        while not is_stopped and chunk_list:
+            result = chunk_func(chunk_list.pop())
+            result_list.append(result)
+            is_stopped = is_to_stop != None and is_to_stop(result)
+        return result_list
+    
+    for dest in range(1, size):
+        chunk = None if is_stopped or chunk_list == [] else chunk_list.pop()
+        request_list.append(comm.isend(chunk, dest=dest, tag=task_tag))
+        no_of_busy_processes += (chunk != None)
+    status = MPI.Status()
+    while no_of_busy_processes > 0:
+        is_successful, result = comm.recv(source=MPI.ANY_SOURCE, tag=result_tag, status=status)
+        no_of_busy_processes -= 1
+        if is_successful:
+            result_list.append(result)
+            is_stopped = is_stopped or (is_to_stop != None and is_to_stop(result))
+        else:
+            is_stopped = True
+        chunk = None if is_stopped or chunk_list == [] else chunk_list.pop()
+        request_list.append(comm.isend(chunk, dest=status.Get_source(), tag=task_tag))
+        no_of_busy_processes += (chunk != None)
+    MPI.Request.Waitall(request_list)
+    return result_list
+
+
+def make_input_preparation_stop_condition(max_no_of_ready_jobs, signal_file_path_list):
+    """
+    Return a function which tells whether to stop the input preparation in the dynamic master-worker mode (see dynamically_schedule_in_parallel),
+    i.e. the number of new ready jobs reaches max_no_of_ready_jobs or any file in signal_file_path_list exists.
+    The returned function takes the result of a chunk, which is a list of the returns of function pre_and_post_process.
+    """
+    def is_to_stop(chunk_result):
+        nonlocal max_no_of_ready_jobs
+        max_no_of_ready_jobs -= sum([no_of_new_ready_jobs for no_of_new_ready_jobs, cal_status_diff in chunk_result])
+        return max_no_of_ready_jobs <= 0 or any([os.path.isfile(signal_file_path) for signal_file_path in signal_file_path_list])
+    return is_to_stop
 
 
 # def merge_dicts(a_list_of_dicts):
@@ -142,6 +234,19 @@ def synchron(comm, rank, size):
 def check_calculations_status_in_parallel(comm, rank, size, cal_folder, workflow):
     debugging = (rank == 0)
     
+    if workflow[0]["mpi_dynamic_chunk_size"] > 0:
+        if debugging: print("{}: process 0 hands out material folders on demand to check the calculation status in parallel".format(get_time_str()), flush=True)
+        cal_status_dict_list = dynamically_schedule_in_parallel(comm=comm, rank=rank, size=size, task_list=os.listdir(cal_folder) if rank == 0 else [], 
+                                                                chunk_func=lambda mat_folder_name_list: check_calculations_status(cal_folder, workflow, mat_folder_name_list=mat_folder_name_list), 
+                                                                chunk_size=workflow[0]["mpi_dynamic_chunk_size"])
+        if rank == 0:
+            #check_calculations_status with an empty cal_loc_list ensures that all status keys are present even if cal_folder is empty.
+            cal_status_dict_list.append(check_calculations_status(cal_folder, workflow, cal_loc_list=[]))
+            total_cal_status_dict = Cal_status_dict_operation.merge_dicts(a_list_of_dicts=cal_status_dict_list)
+        else:
+            total_cal_status_dict = None
+        return distribute_total_cal_status_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status_dict)
+    
     if rank == 0:
         mat_folder_name_sublist_list = divide_a_list_evenly(a_list=os.listdir(cal_folder), no_of_sublists=size)
     else:
@@ -157,17 +262,35 @@ def check_calculations_status_in_parallel(comm, rank, size, cal_folder, workflow
     if rank == 0:
         if debugging: print("{}: Process 0 is merging gathered calculation status dicts".format(get_time_str()), flush=True)
         total_cal_status_dict = Cal_status_dict_operation.merge_dicts(a_list_of_dicts=cal_status_dict_list)
-        
-        if debugging: print("{}: Process 0 is dividing the gathered calculation status dict into {} sub dicts and then scatter them among all processes".format(get_time_str(), size), flush=True)
-        scattered_cal_status_dict_list = Cal_status_dict_operation.evenly_divide_a_dict(a_dict=total_cal_status_dict, no_of_subdicts=size)
     else:
         total_cal_status_dict = None
-        scattered_cal_status_dict_list = None
+    
+    return distribute_total_cal_status_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status_dict)
+
+
+# In[1]:
+
+
+def distribute_total_cal_status_in_parallel(comm, rank, size, total_cal_status_dict):
+    """
+    Process 0 broadcasts total_cal_status_dict in the form of a Cal_status_table, so that every process holds a replica which is later kept up to date
+    by calculation status diffs (see update_cal_status_in_parallel). Every process then takes its own part of the total calculation status locally
+    via Cal_status_table.get_partition, i.e. the calculations whose IDs modulo size equal its rank. No sub dict is scattered.
+    input arguments:
+        - total_cal_status_dict: the total calculation status dict in process 0. It is ignored in the other processes.
+    return (scattered_cal_status_dict, total_cal_status_table)
+    """
+    debugging = (rank == 0)
+    
+    if rank == 0:
+        if not isinstance(total_cal_status_dict, Cal_status_table):
+            total_cal_status_dict = Cal_status_table(total_cal_status_dict)
+    else:
+        total_cal_status_dict = None
         
-    scattered_cal_status_dict = comm.scatter(scattered_cal_status_dict_list, root=0)
-    if debugging: print("{}: Process {} received the scattered sub calculation dict.".format(get_time_str(), rank), flush=True)
     total_cal_status_dict = comm.bcast(total_cal_status_dict, root=0)
     if debugging: print("{}: Process {} received the broadcasted calculation status dict from process 0".format(get_time_str(), rank), flush=True)
+    scattered_cal_status_dict = total_cal_status_dict.get_partition(part_ind=rank, no_of_parts=size)
     
     return scattered_cal_status_dict, total_cal_status_dict
 
@@ -175,36 +298,78 @@ def check_calculations_status_in_parallel(comm, rank, size, cal_folder, workflow
 # In[2]:
 
 
-def update_cal_status_in_parallel(comm, rank, size, scattered_cal_status, scattered_cal_status_diff, cal_folder, workflow):
+def update_cal_status_in_parallel(comm, rank, size, total_cal_status, scattered_cal_status_diff, cal_folder, workflow, cal_status_index=None):
+    """
+    Merge the calculation status diffs of all processes and update the total calculation status accordingly in all processes.
+    Only the compact diffs are exchanged: the diffs of all processes are allgathered, and every process merges them in the rank order and applies the merged diff
+    to its own replica of total_cal_status in place. Since all replicas are identical and apply the same diff, they remain identical (including the calculation IDs).
+    The new part of every process is then taken locally via Cal_status_table.get_partition.
+    input arguments:
+        - total_cal_status (Cal_status_table): the replica of the total calculation status in this process (see distribute_total_cal_status_in_parallel)
+        - scattered_cal_status_diff: the calculation status diff of the calculations handled by this process.
+    return (scattered_cal_status, total_cal_status), where scattered_cal_status is the new sub dict of the total calculation status assigned to this process.
+    """
     debugging = (rank == 0)
     
-    scattered_cal_status = copy.deepcopy(scattered_cal_status)
-    
     #print("{}: Process {} is checking these calculations which were just updated.".format(get_time_str(), rank), flush=True)
     #updated_cal_status = check_calculations_status(cal_folder=cal_folder, workflow=workflow, cal_loc_list=cal_loc_list)
     #print("{}: Process {} has obtained the new statuses of these calculations which were just updated.".format(get_time_str(), rank), flush=True)
     #updated_job_status_list = comm.gather(updated_cal_status, root=0)
     #print("{}: The new statues obtained in process {} have been gathered by process 0".format(get_time_str(), rank), flush=True)
-    scattered_cal_status_diff_list = comm.gather(scattered_cal_status_diff, root=0)
-    if debugging: print("{}: The scattered cal status diff dict in process {} has been gathered by process 0".format(get_time_str(), rank), flush=True)
-    old_cal_status_list = comm.gather(scattered_cal_status, root=0)
-    if debugging: print("{}: The old scattered cal status dict in process {} has been gathered by process 0".format(get_time_str(), rank), flush=True)
+    scattered_cal_status_diff_list = comm.allgather(scattered_cal_status_diff)
+    if debugging: print("{}: The scattered cal status diffs of all processes have been allgathered by process {}".format(get_time_str(), rank), flush=True)
+    total_scattered_cal_status_diff = Cal_status_dict_operation.merge_cal_status_diff(scattered_cal_status_diff_list)
+    total_cal_status.apply_diff(total_scattered_cal_status_diff)
+    if rank == 0 and cal_status_index != None:
+        cal_status_index.apply_cal_status_diff(total_scattered_cal_status_diff)
+    if debugging: print("{}: Process {} applied the merged cal status diff".format(get_time_str(), rank), flush=True)
+    
+    scattered_cal_status = total_cal_status.get_partition(part_ind=rank, no_of_parts=size)
+    return scattered_cal_status, total_cal_status
+
+
+# In[2]:
+
+
+def broadcast_cal_status_diff_in_parallel(comm, rank, size, total_cal_status, total_cal_status_diff):
+    """
+    Apply the calculation status diff found by process 0 (e.g. by the incremental scan) to the replicas of the total calculation status in all processes.
+    Like update_cal_status_in_parallel, only the diff is exchanged: process 0 encodes it against its Cal_status_table via method encode_diff and 
+        broadcasts the encoded diff, which every other process applies to its identical replica via method apply_encoded_diff.
+    input arguments:
+        - total_cal_status (Cal_status_table): the replica of the total calculation status in this process (see distribute_total_cal_status_in_parallel)
+        - total_cal_status_diff: the calculation status diff in process 0. It is ignored in the other processes.
+    return (scattered_cal_status, total_cal_status), where scattered_cal_status is the new sub dict of the total calculation status assigned to this process.
+    """
+    debugging = (rank == 0)
+    
     if rank == 0:
-        total_old_cal_status = Cal_status_dict_operation.merge_dicts(old_cal_status_list)
-        total_scattered_cal_status_diff = Cal_status_dict_operation.merge_cal_status_diff(scattered_cal_status_diff_list)
-        #total_updated_job_status = Cal_status_dict_operation.merge_dicts(updated_job_status_list)
-        #cal_status_diff = Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=total_old_cal_status, new_cal_status_dict=total_updated_job_status)
-        new_total_cal_status = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=total_old_cal_status, cal_status_dict_diff=total_scattered_cal_status_diff)
-        new_scattered_cal_status_list = Cal_status_dict_operation.evenly_divide_a_dict(a_dict=new_total_cal_status, no_of_subdicts=size)
+        encoded_cal_status_diff = total_cal_status.encode_diff(total_cal_status_diff)
+        total_cal_status.apply_encoded_diff(encoded_cal_status_diff)
     else:
-        new_total_cal_status = None
-        new_scattered_cal_status_list = None
-            
-    scattered_cal_status = comm.scatter(new_scattered_cal_status_list, root=0)
-    if debugging: print("{}: Process {} received the scattered sub calculation dict.".format(get_time_str(), rank), flush=True)
-    new_total_cal_status = comm.bcast(new_total_cal_status, root=0)
-    if debugging: print("{}: Process {} received the broadcasted calculation status dict from process 0".format(get_time_str(), rank), flush=True)
-    return scattered_cal_status, new_total_cal_status
+        encoded_cal_status_diff = None
+    encoded_cal_status_diff = comm.bcast(encoded_cal_status_diff, root=0)
+    if rank != 0:
+        total_cal_status.apply_encoded_diff(encoded_cal_status_diff)
+    if debugging: print("{}: Process {} applied the broadcasted encoded cal status diff of {} calculations".format(get_time_str(), rank, len(encoded_cal_status_diff["id_array"])), flush=True)
+    
+    scattered_cal_status = total_cal_status.get_partition(part_ind=rank, no_of_parts=size)
+    return scattered_cal_status, total_cal_status
+
+
+# In[2]:
+
+
+def update_job_status_unless_circuit_open(cal_folder, workflow, which_status, job_list, rank):
+    """
+    Call update_job_status. If the circuit breaker of the job scheduler commands is open (Circuit_open_error), skip the update of job_list in this cycle
+        and return a void calculation status diff, so that this process still takes part in the following collective communications.
+    """
+    try:
+        return update_job_status(cal_folder=cal_folder, workflow=workflow, which_status=which_status, job_list=job_list, rank=rank)
+    except Circuit_open_error as err:
+        print("{}: {}\n\tProcess {} skips the update of {} jobs of {} in this cycle.".format(get_time_str(), err, rank, len(job_list), which_status), flush=True)
+        return Cal_status_dict_operation.void_cal_status_diff
 
 
 # In[17]:
@@ -213,7 +378,7 @@ def update_cal_status_in_parallel(comm, rank, size, scattered_cal_status, scatte
 def handle_update_now_and_change_signal_file_in_parallel(comm, rank, size, total_cal_status_dict, scattered_cal_status_dict, workflow):
     debugging = (rank == 0)
     
-    total_cal_status_dict = copy.deepcopy(total_cal_status_dict)
+    #total_cal_status_dict is only changed in process 0 and then broadcasted. So no deep copy is needed.
     scattered_cal_status_dict = copy.deepcopy(scattered_cal_status_dict)
     update_now_file_path = os.path.join(workflow[0]["htc_cwd"], "__update_now__")
     change_signal_file_path = os.path.join(workflow[0]["htc_cwd"], "__change_signal_file__")
@@ -226,16 +391,13 @@ def handle_update_now_and_change_signal_file_in_parallel(comm, rank, size, total
     if os.path.isfile(change_signal_file_path):
         if rank == 0:
             new_total_cal_status_dict = change_signal_file(total_cal_status_dict, change_signal_file_path)
-            scattered_cal_status_dict_list = Cal_status_dict_operation.evenly_divide_a_dict(new_total_cal_status_dict, no_of_subdicts=size)
         else:
             new_total_cal_status_dict = None
-            scattered_cal_status_dict_list = None
+        #The whole Cal_status_table is broadcasted here rather than a diff, since change_signal_file updates it in place in process 0 only. This rarely happens.
         if debugging: print("{}: Process {} is receiving new total cal status dict broadcasted by process 0".format(get_time_str(), rank), flush=True)
         new_total_cal_status_dict = comm.bcast(new_total_cal_status_dict, root=0)
         if debugging: print("{}: Process {} received new total cal status dict broadcasted by process 0".format(get_time_str(), rank), flush=True)
-        if debugging: print("{}: Process {} is receiving new scattered cal status dict scattered by process 0".format(get_time_str(), rank), flush=True)
-        scattered_cal_status_dict = comm.scatter(scattered_cal_status_dict_list, root=0)
-        if debugging: print("{}: Process {} received new scattered cal status dict scattered by process 0".format(get_time_str(), rank), flush=True)
+        scattered_cal_status_dict = new_total_cal_status_dict.get_partition(part_ind=rank, no_of_parts=size)
 
         if rank == 0:
             os.remove(change_signal_file_path)
@@ -279,20 +441,53 @@ if __name__ == "__main__":
     stop_file_path = os.path.join(main_dir, "__stop__")
     htc_job_status_file_path = os.path.join(main_dir, "htc_job_status.json")
     scattered_htc_job_status_file_path = os.path.join(main_dir, "scattered_htc_job_status_process_{}.json".format(rank))
+    retry_policy_counter_file_path = os.path.join(main_dir, "htc_retry_policy_counters_process_{}.json".format(rank))
     update_now_file_path = os.path.join(main_dir, "__update_now__")
     change_signal_file_path = os.path.join(main_dir, "__change_signal_file__")
     update_input_file_path = os.path.join(main_dir, "__update_input__")
     go_to_sub_signal_file_path = os.path.join(main_dir, "__go_to_submission__")
     scan_all_file_path = os.path.join(main_dir, "__scan_all__")
     
+    cal_status_index = Cal_status_index.from_workflow(workflow)
+    #The incremental scan is only carried out in process 0.
+    cal_status_scanner = Incremental_cal_status_scanner(cal_folder=cal_folder) if rank == 0 and workflow[0]["incremental_scan"] else None
+    #htc_job_status.json is only written by process 0.
+    cal_status_journal = Cal_status_journal(filename=htc_job_status_file_path, compaction_interval=workflow[0]["cal_status_journal_interval"]) if rank == 0 else None
     if rank == 0: # calculation status is checked and updated only in process 0 (master process)
         no_of_same_cal_status, total_cal_status_0 = 0, {}
-        open(scan_all_file_path, "w").close()
-        if debugging: 
-            output_str = "{}: Process 0 created __scan_all__ to ask the program to scan the status of all calculations.\n".format(get_time_str())
-            output_str += "\tLater scanning only involves those calculations which are automatically updated by the program.\n"
-            output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
-            print(output_str, flush=True)
+        if workflow[0]["warm_start"]:
+            checkpoint_cal_status, checkpoint_time = load_cal_status_checkpoint(workflow)
+        else:
+            checkpoint_cal_status, checkpoint_time = None, None
+        if checkpoint_cal_status != None:
+            if debugging: print("{}: Process 0 warm starts from the calculation status saved at {}".format(get_time_str(), time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime(checkpoint_time))), flush=True)
+            total_cal_status, rescanned_mat_folder_name_list = warm_start_cal_status(cal_folder=cal_folder, workflow=workflow, 
+                                                                                     cal_status_dict=Cal_status_store(checkpoint_cal_status), checkpoint_time=checkpoint_time)
+            if cal_status_index != None:
+                cal_status_index.reconcile(total_cal_status)
+            if debugging:
+                output_str = "{}: Process 0 finished the warm start. {} material folders changed since then and were rescanned.\n".format(get_time_str(), len(rescanned_mat_folder_name_list))
+                output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
+                print(output_str, flush=True)
+            del checkpoint_cal_status, rescanned_mat_folder_name_list
+        elif cal_status_index != None and not cal_status_index.is_empty():
+            total_cal_status = cal_status_index.load_cal_status_dict()
+            if debugging:
+                output_str = "{}: Process 0 read the calculation status from the calculation status index {}.\n".format(get_time_str(), cal_status_index.db_filename)
+                output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
+                print(output_str, flush=True)
+        else:
+            total_cal_status = None
+            open(scan_all_file_path, "w").close()
+            if debugging: 
+                output_str = "{}: Process 0 created __scan_all__ to ask the program to scan the status of all calculations.\n".format(get_time_str())
+                output_str += "\tLater scanning only involves those calculations which are automatically updated by the program.\n"
+                output_str += "\tIf you manually changed some calculations' status, you need to create __scan_all__ to obtain all of these manually updated calculations' status"
+                print(output_str, flush=True)
+    else:
+        total_cal_status = None
+    if comm.bcast(total_cal_status != None, root=0):
+        scattered_cal_status, total_cal_status = distribute_total_cal_status_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status)
     
     if debugging: print("{}: process {} is entering the while loop.".format(get_time_str(), rank), flush=True)
     continue_running = True
@@ -308,15 +503,41 @@ if __name__ == "__main__":
         ##Start of "Update calculation status"
         synchron(comm=comm, rank=rank, size=size)
         if os.path.isfile(scan_all_file_path):
-            scattered_cal_status, total_cal_status = check_calculations_status_in_parallel(comm=comm, rank=rank, size=size, cal_folder=cal_folder, workflow=workflow)
+            if workflow[0]["incremental_scan"]:
+                if rank == 0:
+                    #A new scanner forgets everything and hence scans all folders from scratch.
+                    cal_status_scanner = Incremental_cal_status_scanner(cal_folder=cal_folder)
+                    total_cal_status = cal_status_scanner.scan()
+                scattered_cal_status, total_cal_status = distribute_total_cal_status_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status)
+            else:
+                scattered_cal_status, total_cal_status = check_calculations_status_in_parallel(comm=comm, rank=rank, size=size, cal_folder=cal_folder, workflow=workflow)
             if rank == 0:
+                if cal_status_index != None:
+                    cal_status_index.reconcile(total_cal_status)
                 os.remove(scan_all_file_path)
                 if debugging: print("{}: Process 0 removed __scan_all__".format(get_time_str()), flush=True)
+        elif workflow[0]["incremental_scan"]:
+            if rank == 0:
+                if debugging: print("{}: Process 0 starts the incremental scan of all folders under {}".format(get_time_str(), cal_folder), flush=True)
+                new_total_cal_status = cal_status_scanner.scan()
+                total_cal_status_diff = Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=total_cal_status, new_cal_status_dict=new_total_cal_status)
+                if cal_status_index != None:
+                    cal_status_index.apply_cal_status_diff(total_cal_status_diff)
+                if debugging: 
+                    output_str = "{}: Process 0 finished the incremental scan. {} directories were listed. ".format(get_time_str(), cal_status_scanner.no_of_listed_dirs)
+                    output_str += "The status of {} calculations was found changed.".format(len(set(total_cal_status_diff["removed"]).union(total_cal_status_diff["updated"].keys())))
+                    print(output_str, flush=True)
+                del new_total_cal_status
+            else:
+                total_cal_status_diff = None
+            scattered_cal_status, total_cal_status = broadcast_cal_status_diff_in_parallel(comm=comm, rank=rank, size=size, total_cal_status=total_cal_status, 
+                                                                                           total_cal_status_diff=total_cal_status_diff)
+            del total_cal_status_diff
         scattered_cal_status, total_cal_status = handle_update_now_and_change_signal_file_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status, 
                                                                                                       scattered_cal_status_dict=scattered_cal_status, workflow=workflow)
             
         if rank == 0: 
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
             to_be_updated_status_list = Cal_status_dict_operation.get_to_be_updated_status_list(total_cal_status)
         else:
             to_be_updated_status_list = None
@@ -328,14 +549,27 @@ if __name__ == "__main__":
             if os.path.isfile(go_to_sub_signal_file_path):
                 print("{}: process {} finds __go_to_submission__ under HTC_CWD. Skip update of {}".format(get_time_str(), rank, which_status), flush=True)
                 continue
+            #In the dynamic master-worker mode, the running jobs are still divided evenly so that the job queue is queried only once per process.
+            is_dynamically_scheduled = workflow[0]["mpi_dynamic_chunk_size"] > 0 and which_status != "running_folder_list"
+            if is_dynamically_scheduled:
+                sub_job_list = total_cal_status[which_status] if rank == 0 else []
             if which_status in ["sub_dir_cal_folder_list", "done_folder_list"]:
                 #Updating them may involve very slow external commands. So we don't process all of them at once
-                max_no_of_ready_jobs = int(workflow[0]["max_no_of_ready_jobs"]/size) - len(scattered_cal_status["ready_folder_list"]) - len(scattered_cal_status["prior_ready_folder_list"])
+                if is_dynamically_scheduled:
+                    max_no_of_ready_jobs = workflow[0]["max_no_of_ready_jobs"] - Cal_status_dict_operation.get_no_of_jobs(total_cal_status, "ready_folder_list") - Cal_status_dict_operation.get_no_of_jobs(total_cal_status, "prior_ready_folder_list")
+                else:
+                    max_no_of_ready_jobs = int(workflow[0]["max_no_of_ready_jobs"]/size) - len(scattered_cal_status["ready_folder_list"]) - len(scattered_cal_status["prior_ready_folder_list"])
                 max_no_of_ready_jobs = min([len(sub_job_list), max_no_of_ready_jobs])
                 sub_job_list = sub_job_list[:max_no_of_ready_jobs]
             try:
                 if debugging: print("{}: process {} starts updating {}".format(get_time_str(), rank, which_status), flush=True)
-                scattered_cal_status_diff = update_job_status(cal_folder=cal_folder, workflow=workflow, which_status=which_status, job_list=sub_job_list, rank=rank)
+                if is_dynamically_scheduled:
+                    cal_status_diff_list = dynamically_schedule_in_parallel(comm=comm, rank=rank, size=size, task_list=sub_job_list, chunk_size=workflow[0]["mpi_dynamic_chunk_size"], 
+                                                                            chunk_func=lambda job_list: update_job_status_unless_circuit_open(cal_folder=cal_folder, workflow=workflow, which_status=which_status, job_list=job_list, rank=rank))
+                    #All diffs are gathered in process 0. The other processes contribute void diffs to update_cal_status_in_parallel.
+                    scattered_cal_status_diff = Cal_status_dict_operation.merge_cal_status_diff(cal_status_diff_list)
+                else:
+                    scattered_cal_status_diff = update_job_status_unless_circuit_open(cal_folder=cal_folder, workflow=workflow, which_status=which_status, job_list=sub_job_list, rank=rank)
                 if debugging: print("{}: process {} finished update of {}".format(get_time_str(), rank, which_status), flush=True)
             except:
                 continue_running = False
@@ -354,11 +588,11 @@ if __name__ == "__main__":
             if continue_running == False: break
             if os.path.isfile(stop_file_path): break
             scattered_cal_status, total_cal_status = update_cal_status_in_parallel(comm=comm, rank=rank, size=size, cal_folder=cal_folder, scattered_cal_status_diff=scattered_cal_status_diff,
-                                                                                   scattered_cal_status=scattered_cal_status, workflow=workflow)
+                                                                                   total_cal_status=total_cal_status, workflow=workflow, cal_status_index=cal_status_index)
             scattered_cal_status, total_cal_status = handle_update_now_and_change_signal_file_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status, 
                                                                                                       scattered_cal_status_dict=scattered_cal_status, workflow=workflow)
             if rank == 0:
-                Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+                cal_status_journal.write(total_cal_status)
             if scattered: Cal_status_dict_operation.write_cal_status(cal_status=scattered_cal_status, filename=scattered_htc_job_status_file_path)
             if debugging: print("{}: process {} finished updating {}".format(get_time_str(), rank, which_status), flush=True)
                 
@@ -371,12 +605,14 @@ if __name__ == "__main__":
         ##Start of "Prepare VASP input files"
         if rank == 0:  
             if debugging: print("{}: Process 0 is dividing the structure list".format(get_time_str()), flush=True)
-            structure_file_sublist_list = divide_a_list_evenly(a_list=os.listdir(structure_file_folder), no_of_sublists=size)            
-            max_no_of_ready_jobs = workflow[0]["max_no_of_ready_jobs"] - len(total_cal_status["ready_folder_list"]) - len(total_cal_status["prior_ready_folder_list"])
-            max_no_of_ready_jobs = int(max_no_of_ready_jobs / size)
+            structure_file_list = os.listdir(structure_file_folder)
+            structure_file_sublist_list = divide_a_list_evenly(a_list=structure_file_list, no_of_sublists=size)            
+            max_no_of_ready_jobs = workflow[0]["max_no_of_ready_jobs"] - Cal_status_dict_operation.get_no_of_jobs(total_cal_status, "ready_folder_list") - Cal_status_dict_operation.get_no_of_jobs(total_cal_status, "prior_ready_folder_list")
+            if workflow[0]["mpi_dynamic_chunk_size"] == 0:
+                max_no_of_ready_jobs = int(max_no_of_ready_jobs / size)
         else:
             max_no_of_ready_jobs = 0
-            structure_file_sublist_list = None
+            structure_file_list, structure_file_sublist_list = [], None
         if rank == 0 and debugging: print("{}: Process 0 is broadcasting max_no_of_ready_jobs".format(get_time_str()), flush=True)
         max_no_of_ready_jobs = comm.bcast(max_no_of_ready_jobs, root=0)
         if debugging: print("{}: Process {} received max_no_of_ready_jobs broadcasted from process 0".format(get_time_str(), rank), flush=True)
@@ -389,6 +625,9 @@ if __name__ == "__main__":
         elif max_no_of_ready_jobs <= 0:
             if debugging: print("{}: Process {} finds that the number of ready jobs already reaches the pre-defined max. Skip input file preparation".format(get_time_str(), rank), flush=True)
             structure_file_sublist = []
+        elif workflow[0]["mpi_dynamic_chunk_size"] > 0:
+            #In the dynamic master-worker mode, process 0 hands out the structure files on demand. See dynamically_schedule_in_parallel
+            structure_file_sublist = structure_file_list
         else:
             if rank == 0 and debugging: print("{}: Process 0 is broadcasting divided structure list".format(get_time_str()), flush=True)
             structure_file_sublist = comm.scatter(structure_file_sublist_list, root=0)
@@ -397,6 +636,16 @@ if __name__ == "__main__":
         
         scattered_cal_status_diff_list = []
         try:
+            if workflow[0]["mpi_dynamic_chunk_size"] > 0:
+                is_to_stop = make_input_preparation_stop_condition(max_no_of_ready_jobs=max_no_of_ready_jobs, 
+                                                                   signal_file_path_list=[stop_file_path, update_now_file_path, change_signal_file_path, go_to_sub_signal_file_path])
+                chunk_result_list = dynamically_schedule_in_parallel(comm=comm, rank=rank, size=size, task_list=structure_file_sublist, 
+                                                                     chunk_func=lambda structure_file_list: [pre_and_post_process(structure_file, structure_file_folder, cal_folder=cal_folder, workflow=workflow) 
+                                                                                                             for structure_file in structure_file_list], 
+                                                                     chunk_size=workflow[0]["mpi_dynamic_chunk_size"], is_to_stop=is_to_stop)
+                scattered_cal_status_diff_list = [cal_status_diff for chunk_result in chunk_result_list for no_of_new_ready_jobs, cal_status_diff in chunk_result]
+                if debugging: print("{}: process 0 finished input preparation for {} structures".format(get_time_str(), len(scattered_cal_status_diff_list)), flush=True)
+                structure_file_sublist = [] #already processed above
             for structure_file in structure_file_sublist:
                 no_of_new_ready_jobs, scattered_cal_status_diff = pre_and_post_process(structure_file, structure_file_folder, cal_folder=cal_folder, workflow=workflow)
                 max_no_of_ready_jobs -= no_of_new_ready_jobs
@@ -426,11 +675,11 @@ if __name__ == "__main__":
         scattered_cal_status_diff = Cal_status_dict_operation.merge_cal_status_diff(scattered_cal_status_diff_list)
         synchron(comm, rank, size)
         scattered_cal_status, total_cal_status = update_cal_status_in_parallel(comm=comm, rank=rank, size=size, cal_folder=cal_folder, scattered_cal_status_diff=scattered_cal_status_diff,
-                                                                               scattered_cal_status=scattered_cal_status, workflow=workflow)
+                                                                               total_cal_status=total_cal_status, workflow=workflow, cal_status_index=cal_status_index)
         scattered_cal_status, total_cal_status = handle_update_now_and_change_signal_file_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status, 
                                                                                                       scattered_cal_status_dict=scattered_cal_status, workflow=workflow)
         if rank == 0:
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
         if scattered: Cal_status_dict_operation.write_cal_status(cal_status=scattered_cal_status, filename=scattered_htc_job_status_file_path)
         ## END of "Prepare VASP input files"
         ###############################################################################
@@ -444,7 +693,11 @@ if __name__ == "__main__":
                 if debugging: print("{}: All processes reach the job submission section. Process 0 removed __go_to_submission__".format(get_time_str()), flush=True)
             if debugging: print("{}: process 0 starts submitting ready jobs".format(get_time_str()), flush=True)
             #cal_status = check_calculations_status(cal_folder=cal_folder, workflow=workflow)
-            submitted_job_list = submit_jobs(cal_jobs_status=total_cal_status, workflow=workflow, max_jobs_in_queue=workflow[0]["max_running_job"])
+            try:
+                submitted_job_list = submit_jobs(cal_jobs_status=total_cal_status, workflow=workflow, max_jobs_in_queue=workflow[0]["max_running_job"])
+            except Circuit_open_error as err:
+                print("{}: {}\n\tProcess 0 skips the job submission in this cycle.".format(get_time_str(), err), flush=True)
+                submitted_job_list = []
             scattered_submitted_job_list = divide_a_list_evenly(a_list=submitted_job_list, no_of_sublists=size)
         else:
             if debugging: print("{}: process {} is waiting for process 0 to finish job submission".format(get_time_str(), rank), flush=True)
@@ -453,23 +706,27 @@ if __name__ == "__main__":
         old_scattered_cal_status = check_calculations_status(cal_folder=cal_folder, workflow=workflow, cal_loc_list=[])
         new_scattered_cal_status = check_calculations_status(cal_folder=cal_folder, workflow=workflow, cal_loc_list=scattered_submitted_jobs)
         scattered_cal_status_diff = Cal_status_dict_operation.diff_status_dict(old_cal_status_dict=old_scattered_cal_status, new_cal_status_dict=new_scattered_cal_status)
-        scattered_cal_status, total_cal_status = update_cal_status_in_parallel(comm=comm, rank=rank, size=size, cal_folder=cal_folder, scattered_cal_status=scattered_cal_status, 
-                                                                               scattered_cal_status_diff=scattered_cal_status_diff, workflow=workflow,)
+        scattered_cal_status, total_cal_status = update_cal_status_in_parallel(comm=comm, rank=rank, size=size, cal_folder=cal_folder, total_cal_status=total_cal_status, 
+                                                                               scattered_cal_status_diff=scattered_cal_status_diff, workflow=workflow, cal_status_index=cal_status_index)
         scattered_cal_status, total_cal_status = handle_update_now_and_change_signal_file_in_parallel(comm=comm, rank=rank, size=size, total_cal_status_dict=total_cal_status, 
                                                                                                       scattered_cal_status_dict=scattered_cal_status, workflow=workflow)
         if rank == 0: 
-            Cal_status_dict_operation.write_cal_status(cal_status=total_cal_status, filename=htc_job_status_file_path)
+            cal_status_journal.write(total_cal_status)
         if scattered: Cal_status_dict_operation.write_cal_status(cal_status=scattered_cal_status, filename=scattered_htc_job_status_file_path)
         synchron(comm=comm, rank=rank, size=size)
         if debugging: print("{}: Process {} found that process 0 completed job submission.".format(get_time_str(), rank), flush=True)
+        #The counters of the retried job query/submission/killing commands in each process, e.g. for monitoring how busy the job scheduler is.
+        Retry_policy.write_counters(retry_policy_counter_file_path)
         ##END of "Job submission"
         
         
         #check if all calculations are complete. If this is the case, stop. At the end, all calculations should be labeled by signal file __done__, __skipped__, __done_cleaned_analyzed__ and __done_failed_to_clean_analyze__
-        no_of_ongoing_jobs = sum([len(job_list) for job_status, job_list in total_cal_status.items() if job_status not in ["done_folder_list", "skipped_folder_list", "done_cleaned_analyzed_folder_list", "done_failed_to_clean_analyze_folder_list"]])
+        no_of_ongoing_jobs = sum([Cal_status_dict_operation.get_no_of_jobs(total_cal_status, job_status) for job_status in total_cal_status.keys() if job_status not in ["done_folder_list", "skipped_folder_list", "done_cleaned_analyzed_folder_list", "done_failed_to_clean_analyze_folder_list"]])
         if no_of_ongoing_jobs == 0:
             output_str = "{}: Process {} finds that all calculations have finished --> Stop this program in process {}.".format(get_time_str(), rank, rank)
             print(output_str, flush=True)
+            if rank == 0:
+                cal_status_journal.close(total_cal_status)
             with open(htc_job_status_file_path, "a") as f:
                 f.write("\n***" + output_str + "***")
             break
@@ -482,9 +739,10 @@ if __name__ == "__main__":
             if total_cal_status == total_cal_status_0:
                 no_of_same_cal_status += 1
             else:
-                total_cal_status_0 = total_cal_status
+                total_cal_status_0 = total_cal_status.copy() #total_cal_status is updated in place. See update_cal_status_in_parallel
                 no_of_same_cal_status = 0
             if no_of_same_cal_status == 1000:
+                cal_status_journal.close(total_cal_status)
                 with open(htc_job_status_file_path, "a") as f:
                     f.write("\n***" + output_str + "***")
                 continue_running = False
@@ -519,11 +777,22 @@ if __name__ == "__main__":
             if debugging: print("{}: __update_input__ is found found in HTC_CWD. Process {} reads the updated pre-defined calculation workflow".format(get_time_str(), rank), flush=True)
             workflow = read_workflow()
             assert workflow[0]["max_workers"] == None, "Since you are trying to deploy mpi4py for parallel computing, 'max_workers' associated with ProcessPoolExecutor-based parallelization should not be set in the first step."
+            cal_status_index = Cal_status_index.from_workflow(workflow)
+            if rank == 0 and workflow[0]["incremental_scan"] and cal_status_scanner == None:
+                cal_status_scanner = Incremental_cal_status_scanner(cal_folder=cal_folder)
+            if rank == 0 and cal_status_journal.compaction_interval != workflow[0]["cal_status_journal_interval"]:
+                cal_status_journal.close(total_cal_status)
+                cal_status_journal = Cal_status_journal(filename=htc_job_status_file_path, compaction_interval=workflow[0]["cal_status_journal_interval"])
             if rank == 0:
+                if cal_status_index != None:
+                    cal_status_index.reconcile(total_cal_status)
                 os.remove(update_input_file_path)
                 if debugging: print("{}: process 0 removes __update_input__".format(get_time_str()), flush=True)
                 
         synchron(comm, rank, size)
         if debugging: print("\n{}: ***process {} arrives at the end of the while loop. Will enter the next round of iteration.***\n".format(get_time_str(), rank), flush=True)
         synchron(comm, rank, size)
-
+    
+    #Regenerate htc_job_status.json and htc_job_status_folder if there is any pending record in the status journal.
+    if rank == 0 and cal_status_journal.no_of_records > 0:
+        cal_status_journal.close(total_cal_status)
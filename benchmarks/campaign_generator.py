@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[1]:
+
+
+import os, random, shutil
+
+
+# In[2]:
+
+
+class Campaign_generator():
+    """
+    Fabricate a synthetic cal_folder of no_of_materials materials x the steps of a parsed HTC setup (workflow) for benchmarking.
+    Every material is at a random step: all previous steps are labelled by __done__, and the current step is labelled by a signal file drawn
+    from state_fraction_dict. The later steps are not created yet. Every step folder contains INCAR, POSCAR, KPOINTS, POTCAR and log.txt,
+    so that it is regarded as a calculation by function check_calculations_status.
+        - __running__ and __error__: job_id is written (see HTC tags where_to_parse_queue_id and re_to_parse_queue_id). If a Mock_scheduler is given,
+            the running jobs and the error jobs are put into its queue, so that the job query/killing commands see them.
+        - __error__: the error type __unfinished_OUTCAR__ is written into __error__.
+        - __killed__: the queue stdout and stderr files are written, as if the job was killed by the job scheduler.
+    input arguments:
+        - workflow: the return of function parse_calculation_workflow
+        - cal_folder (str): where to create the material folders. Default: None, i.e. workflow[0]["cal_folder"]
+        - state_fraction_dict (dict): signal file --> the fraction of the materials whose current step is labelled by it.
+                The fractions are normalised. Default: Campaign_generator.default_state_fraction_dict
+        - seed (int): the seed of the random number generator. Default: 0
+        - mock_scheduler (Mock_scheduler or None): Default: None
+    """
+    default_state_fraction_dict = {"__ready__": 0.2, "__running__": 0.2, "__done__": 0.4, "__error__": 0.05, "__killed__": 0.05, "__sub_dir_cal__": 0.1}
+    vasp_input_str_dict = {"INCAR": "SYSTEM = synthetic\nENCUT = 520\nISMEAR = 0\nSIGMA = 0.05\nEDIFF = 1.0E-5\n",
+                           "POSCAR": "synthetic\n1.0\n3.0 0.0 0.0\n0.0 3.0 0.0\n0.0 0.0 3.0\nSi\n1\nDirect\n0.0 0.0 0.0\n",
+                           "KPOINTS": "Automatic mesh\n0\nGamma\n4 4 4\n0 0 0\n",
+                           "POTCAR": "  PAW_PBE Si 05Jan2001\n"}
+
+    def __init__(self, workflow, cal_folder=None, state_fraction_dict=None, seed=0, mock_scheduler=None):
+        self.workflow = workflow
+        self.cal_folder = workflow[0]["cal_folder"] if cal_folder == None else cal_folder
+        state_fraction_dict = self.default_state_fraction_dict if state_fraction_dict == None else state_fraction_dict
+        total_fraction = float(sum(state_fraction_dict.values()))
+        self.state_list = list(state_fraction_dict.keys())
+        self.weight_list = [state_fraction_dict[state] / total_fraction for state in self.state_list]
+        self.random = random.Random(seed)
+        self.mock_scheduler = mock_scheduler
+        self.firework_folder_name_list = [firework["firework_folder_name"] for firework in workflow]
+
+    @classmethod
+    def get_mat_folder_name(cls, mat_ind):
+        return "synthetic_mat_{:07d}".format(mat_ind)
+
+    def generate(self, no_of_materials, structure_folder=None, structure_template_file=None):
+        """
+        Create no_of_materials material folders under cal_folder.
+        If both structure_folder and structure_template_file are given, structure_template_file is also copied into structure_folder once per material
+        under the name of the material folder, so that function pre_and_post_process can be called on the synthetic campaign.
+        return a dict: signal file --> a list of the absolute paths of the calculations labelled by it.
+        """
+        if not os.path.isdir(self.cal_folder):
+            os.makedirs(self.cal_folder)
+        if structure_folder != None and not os.path.isdir(structure_folder):
+            os.makedirs(structure_folder)
+        cal_loc_dict = {state: [] for state in self.state_list}
+        cal_loc_dict["__done__"] = cal_loc_dict.get("__done__", [])
+        for mat_ind in range(no_of_materials):
+            mat_folder_name = self.get_mat_folder_name(mat_ind)
+            mat_folder = os.path.join(self.cal_folder, mat_folder_name)
+            state = self.random.choices(self.state_list, weights=self.weight_list)[0]
+            current_step_ind = self.random.randrange(len(self.firework_folder_name_list))
+            for step_ind in range(current_step_ind + 1):
+                cal_loc = os.path.join(mat_folder, self.firework_folder_name_list[step_ind])
+                signal_file = state if step_ind == current_step_ind else "__done__"
+                self.write_calculation(cal_loc=cal_loc, signal_file=signal_file)
+                cal_loc_dict[signal_file].append(cal_loc)
+            if structure_folder != None and structure_template_file != None:
+                shutil.copyfile(structure_template_file, os.path.join(structure_folder, mat_folder_name + os.path.splitext(structure_template_file)[1]))
+
+        if self.mock_scheduler != None:
+            queued_cal_loc_list = cal_loc_dict.get("__running__", []) + cal_loc_dict.get("__error__", [])
+            job_id_list = self.mock_scheduler.add_jobs(cwd_list=queued_cal_loc_list, job_name=self.workflow[0]["job_name"])
+            for cal_loc, job_id in zip(queued_cal_loc_list, job_id_list):
+                self.write_queue_id(cal_loc=cal_loc, queue_id=job_id)
+        return cal_loc_dict
+
+    def write_queue_id(self, cal_loc, queue_id):
+        with open(os.path.join(cal_loc, self.workflow[0]["where_to_parse_queue_id"]), "w") as f:
+            f.write("{}.mock\n".format(queue_id))
+
+    def write_queue_std_files(self, cal_loc):
+        for prefix_tag, suffix_tag in [("queue_stdout_file_prefix", "queue_stdout_file_suffix"), ("queue_stderr_file_prefix", "queue_stderr_file_suffix")]:
+            prefix, suffix = self.workflow[0][prefix_tag], self.workflow[0][suffix_tag]
+            if prefix or suffix:
+                open(os.path.join(cal_loc, "{}synthetic{}".format(prefix if prefix else "", suffix if suffix else "")), "w").close()
+
+    def write_calculation(self, cal_loc, signal_file):
+        if not os.path.isdir(cal_loc):
+            os.makedirs(cal_loc)
+        for filename, str_ in self.vasp_input_str_dict.items():
+            with open(os.path.join(cal_loc, filename), "w") as f:
+                f.write(str_)
+        with open(os.path.join(cal_loc, "log.txt"), "w") as f:
+            f.write("synthetic calculation created for benchmarking\n")
+        if signal_file == "__error__":
+            with open(os.path.join(cal_loc, "__error__"), "w") as f:
+                f.write("__unfinished_OUTCAR__\n")
+        else:
+            open(os.path.join(cal_loc, signal_file), "w").close()
+
+        if signal_file in ["__running__", "__error__"]:
+            self.write_queue_id(cal_loc=cal_loc, queue_id=self.random.randrange(10**6, 10**7))
+        elif signal_file == "__killed__":
+            self.write_queue_id(cal_loc=cal_loc, queue_id=self.random.randrange(10**6, 10**7))
+            self.write_queue_std_files(cal_loc=cal_loc)
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[1]:
+
+
+import os, sys, time, json, random, re, sqlite3
+import argparse
+from contextlib import closing, contextmanager
+
+
+# In[2]:
+
+
+__doc__ = """
+
+* What it does
+
+  * A local fake job scheduler for offline end-to-end benchmarking of htc_main_ProcessPoolExecutor.py and htc_main_mpi.py
+
+  * It provides the executables qsub/qstat/qdel (PBS flavour) and sbatch/squeue/scancel (SLURM flavour), all of which are backed by
+    an SQLite database under a state directory. No daemon is needed: every call first advances the fake queue to the current time.
+
+  * A submitted job "runs" for --run-time (+/- --run-time-jitter) seconds. Once finished, canned OUTCAR, OSZICAR and vasp.out files are written
+    into the folder where the job was submitted, followed by the queue stdout & stderr files. A fraction (--job-error-rate) of the jobs finish
+    with a truncated OUTCAR, which the HTC framework detects as __unfinished_OUTCAR__. A killed job leaves the queue stdout & stderr files only.
+
+  * Every call sleeps for --latency seconds and fails (exit status 1) with probability --failure-rate, to mimic a loaded job scheduler.
+
+* How to use
+
+  * Install the executables and save the setting:
+        python mock_scheduler.py --state-dir /tmp/mock_state install --bin-dir /tmp/mock_bin --latency 0.05 --failure-rate 0.01 --run-time 60
+
+  * Put the bin dir in front of PATH and set the HTC tags in the first firework of HTC_calculation_setup_file, e.g. for the PBS flavour:
+        export PATH=/tmp/mock_bin:$PATH
+        job_submission_command = qsub@vasp.pbs@>@job_id         #here '@' represents a whitespace
+        job_query_command = qstat
+        job_killing_command = qdel
+        where_to_parse_queue_id = job_id
+        re_to_parse_queue_id = ([0-9]+)
+        job_name = htc_job                      (set by '#PBS -N htc_job' in vasp.pbs)
+        queue_stdout_file_prefix = htc_job.o    (The queue stdout file is {job_name}.o{job_id}. See --stdout-template)
+        queue_stderr_file_prefix = htc_job.e
+    Mock_scheduler.get_htc_tag_dict gives these tags for both flavours.
+
+  * The counters (calls, failures, submitted/finished/killed jobs) are kept in the database. See 'python mock_scheduler.py --state-dir xxx stats'
+"""
+
+
+# In[3]:
+
+
+class Mock_scheduler():
+    """
+    A fake job scheduler whose setting and queue are saved under state_dir.
+        - mock_scheduler_setting.json: the setting, see Mock_scheduler.default_setting_dict
+        - mock_scheduler_state.sqlite3: an SQLite database with two tables:
+            - job: one row per job in the queue (job_id, cwd, job_name, flavour, submission_time, end_time). job_id is assigned by SQLite.
+            - counter: one row per counter (name, value). See Mock_scheduler.get_empty_counter_dict
+    Every call runs in one write transaction (BEGIN IMMEDIATE), so that the concurrent calls (e.g. from the thread pool of submit_jobs_in_bulk) are safe.
+    A call only touches the rows it needs, e.g. a submission inserts one row and a killing deletes a few, rather than loading and rewriting the whole queue.
+    input arguments:
+        - state_dir (str): the state directory.
+    """
+    default_setting_dict = {"latency": 0., "failure_rate": 0., "run_time": 60., "run_time_jitter": 0., "job_error_rate": 0.,
+                            "pbs_stdout_template": "{job_name}.o{job_id}", "pbs_stderr_template": "{job_name}.e{job_id}",
+                            "slurm_stdout_template": "slurm-{job_id}.out", "slurm_stderr_template": "slurm-{job_id}.err",
+                            "vasp_out": "vasp.out", "seed": None}
+    command_flavour_dict = {"qsub": "pbs", "qstat": "pbs", "qdel": "pbs", "sbatch": "slurm", "squeue": "slurm", "scancel": "slurm"}
+
+    def __init__(self, state_dir):
+        self.state_dir = os.path.abspath(state_dir)
+        self.setting_file = os.path.join(self.state_dir, "mock_scheduler_setting.json")
+        self.db_file = os.path.join(self.state_dir, "mock_scheduler_state.sqlite3")
+        self.timeout = 600 #seconds a call waits for the transaction of another call
+
+    def install(self, bin_dir, **setting):
+        """
+        Save the setting (see Mock_scheduler.default_setting_dict), reset the state and write the executables qsub, qstat, qdel, sbatch, squeue, scancel under bin_dir.
+        """
+        for dir_ in [self.state_dir, bin_dir]:
+            if not os.path.isdir(dir_):
+                os.makedirs(dir_)
+        setting_dict = dict(self.default_setting_dict)
+        for key, value in setting.items():
+            assert key in setting_dict.keys(), "Unknown setting {} of the mock scheduler".format(key)
+            setting_dict[key] = value
+        with open(self.setting_file, "w") as f:
+            json.dump(setting_dict, f, indent=4)
+        for filename in [self.db_file, self.db_file + "-wal", self.db_file + "-shm"]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE job (job_id INTEGER PRIMARY KEY AUTOINCREMENT, cwd TEXT, job_name TEXT, flavour TEXT, submission_time REAL, end_time REAL)")
+            conn.execute("CREATE INDEX job_end_time_index ON job (end_time)")
+            conn.execute("CREATE TABLE counter (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.executemany("INSERT INTO counter VALUES (?, 0)", [(name,) for name in self.get_empty_counter_dict().keys()])
+
+        for cmd in self.command_flavour_dict.keys():
+            exe = os.path.join(bin_dir, cmd)
+            with open(exe, "w") as f:
+                f.write("#!/bin/sh\n")
+                f.write('exec "{}" "{}" --state-dir "{}" {} "$@"\n'.format(sys.executable, os.path.abspath(__file__), self.state_dir, cmd))
+            os.chmod(exe, 0o755)
+
+    @classmethod
+    def get_empty_counter_dict(cls):
+        """Return the counter name --> 0. The number of calls of cmd is counted by no_of_calls:cmd"""
+        counter_dict = {"no_of_calls:{}".format(cmd): 0 for cmd in cls.command_flavour_dict.keys()}
+        counter_dict.update({"no_of_failed_calls": 0, "no_of_submitted_jobs": 0, "no_of_finished_jobs": 0, "no_of_failed_jobs": 0, "no_of_killed_jobs": 0})
+        return counter_dict
+
+    @classmethod
+    def get_htc_tag_dict(cls, flavour="pbs", job_submission_script="vasp.pbs", job_name="htc_job"):
+        """
+        Return the HTC tags of the first firework with which the HTC framework works with the mock scheduler of the given flavour (pbs or slurm)
+        under the default setting. job_name should be the one set in job_submission_script. See Mock_scheduler.parse_job_name
+        """
+        if flavour == "pbs":
+            return {"job_submission_command": "qsub {} > job_id".format(job_submission_script), "job_query_command": "qstat", "job_killing_command": "qdel",
+                    "where_to_parse_queue_id": "job_id", "re_to_parse_queue_id": "([0-9]+)", "job_name": job_name,
+                    "queue_stdout_file_prefix": job_name + ".o", "queue_stderr_file_prefix": job_name + ".e"}
+        elif flavour == "slurm":
+            return {"job_submission_command": "sbatch {} > job_id".format(job_submission_script), "job_query_command": "squeue", "job_killing_command": "scancel",
+                    "where_to_parse_queue_id": "job_id", "re_to_parse_queue_id": "([0-9]+)", "job_name": job_name,
+                    "queue_stdout_file_prefix": "slurm-", "queue_stdout_file_suffix": ".out", "queue_stderr_file_prefix": "slurm-", "queue_stderr_file_suffix": ".err"}
+        raise Exception("Unknown flavour {} of the mock scheduler. It should be either 'pbs' or 'slurm'".format(flavour))
+
+    def read_setting(self):
+        with open(self.setting_file, "r") as f:
+            return json.load(f)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_file, timeout=self.timeout, isolation_level=None)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Yield a connection to the database in a write transaction, which is committed on exit or rolled back if an exception is raised.
+        BEGIN IMMEDIATE takes the write lock at once, so that two calls never read the same state and then both write it.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @classmethod
+    def increase_counter(cls, conn, name, increment=1):
+        conn.execute("UPDATE counter SET value = value + ? WHERE name = ?", (increment, name))
+
+    def read_counters(self):
+        """
+        Return the counters as a dict: no_of_calls --> {cmd: the number of calls}, and every other counter name --> its value.
+        """
+        counter_dict = {"no_of_calls": {}}
+        with closing(self._connect()) as conn:
+            for name, value in conn.execute("SELECT name, value FROM counter"):
+                if name.startswith("no_of_calls:"):
+                    counter_dict["no_of_calls"][name.split(":", 1)[1]] = value
+                else:
+                    counter_dict[name] = value
+        return counter_dict
+
+    @classmethod
+    def get_job_list(cls, conn, where_clause="", parameter_list=[]):
+        """Return the jobs in the queue as a list of dicts with keys job_id (str), cwd, job_name, flavour, submission_time and end_time, in the order of job_id."""
+        job_list = []
+        for row in conn.execute("SELECT job_id, cwd, job_name, flavour, submission_time, end_time FROM job {} ORDER BY job_id".format(where_clause), parameter_list):
+            job_list.append({"job_id": str(row[0]), "cwd": row[1], "job_name": row[2], "flavour": row[3], "submission_time": row[4], "end_time": row[5]})
+        return job_list
+
+    def run(self, cmd, arg_list, cwd=None):
+        """
+        Execute cmd (qsub, qstat, qdel, sbatch, squeue or scancel) with the command line arguments arg_list, as if it were called under cwd.
+        return a tuple of length 3: (exit status, stdout string, stderr string)
+        """
+        assert cmd in self.command_flavour_dict.keys(), "Unknown command {} of the mock scheduler".format(cmd)
+        cwd = os.getcwd() if cwd == None else cwd
+        setting_dict = self.read_setting()
+        time.sleep(setting_dict["latency"])
+
+        with self.transaction() as conn:
+            self.increase_counter(conn, "no_of_calls:{}".format(cmd))
+            if setting_dict["seed"] == None:
+                random_ = random
+            else:
+                #A seeded generator is re-seeded by the total number of calls so that successive calls draw different numbers reproducibly.
+                no_of_calls = conn.execute("SELECT SUM(value) FROM counter WHERE name LIKE 'no_of_calls:%'").fetchone()[0]
+                random_ = random.Random(setting_dict["seed"] + no_of_calls)
+            self.advance(conn=conn, setting_dict=setting_dict, random_=random_)
+            if random_.random() < setting_dict["failure_rate"]:
+                self.increase_counter(conn, "no_of_failed_calls")
+                output = (1, "", "{}: mock scheduler is too busy to respond. Please try again later.\n".format(cmd))
+            else:
+                output = getattr(self, cmd)(conn=conn, arg_list=arg_list, cwd=cwd, setting_dict=setting_dict, random_=random_)
+        return output
+
+    def advance(self, conn, setting_dict, random_):
+        """
+        Finish the jobs whose run time is over: write the canned VASP outputs and the queue stdout & stderr files, and remove them from the queue.
+        """
+        no_of_failed_jobs = 0
+        finished_job_list = self.get_job_list(conn, where_clause="WHERE end_time <= ?", parameter_list=[time.time()])
+        for job in finished_job_list:
+            is_failed = random_.random() < setting_dict["job_error_rate"]
+            self.write_vasp_outputs(job=job, setting_dict=setting_dict, is_failed=is_failed)
+            self.write_queue_std_files(job=job, job_id=job["job_id"], setting_dict=setting_dict,
+                                       stderr_str="" if not is_failed else "mock scheduler: the job is terminated abnormally\n")
+            no_of_failed_jobs += 1 if is_failed else 0
+        if finished_job_list:
+            conn.executemany("DELETE FROM job WHERE job_id = ?", [(int(job["job_id"]),) for job in finished_job_list])
+            self.increase_counter(conn, "no_of_finished_jobs", len(finished_job_list))
+            self.increase_counter(conn, "no_of_failed_jobs", no_of_failed_jobs)
+
+    @classmethod
+    def write_vasp_outputs(cls, job, setting_dict, is_failed=False):
+        cwd = job["cwd"]
+        with open(os.path.join(cwd, "OSZICAR"), "w") as f:
+            f.write("       N       E                     dE             d eps       ncg     rms          rms(c)\n")
+            for step_no in range(1, 6):
+                f.write("DAV:   {}    -0.{}0000000E+02   -0.10000E+01   -0.10000E+01  1000   0.100E+01\n".format(step_no, step_no))
+            f.write("   1 F= -.10000000E+02 E0= -.10000000E+02  d E =-.100000E+02\n")
+        with open(os.path.join(cwd, setting_dict["vasp_out"]), "w") as f:
+            f.write(" running on    1 total cores\n distrk:  each k-point on    1 cores,    1 groups\n")
+            f.write(" entering main loop\n")
+            f.write("       N       E                     dE             d eps       ncg     rms          rms(c)\n")
+            f.write("   1 F= -.10000000E+02 E0= -.10000000E+02  d E =-.100000E+02\n")
+            f.write(" writing wavefunctions\n")
+        with open(os.path.join(cwd, "OUTCAR"), "w") as f:
+            f.write(" vasp.mock (build {})\n".format(time.strftime("%Y-%m-%d")))
+            f.write(" POSCAR =  mock\n")
+            f.write("  free  energy   TOTEN  =       -10.00000000 eV\n")
+            if not is_failed:
+                f.write("\n General timing and accounting informations for this job:\n")
+                f.write(" ========================================================\n")
+                f.write("                  Total CPU time used (sec):        {:.3f}\n".format(time.time() - job["submission_time"]))
+
+    @classmethod
+    def write_queue_std_files(cls, job, job_id, setting_dict, stdout_str="", stderr_str=""):
+        name_dict = {"job_name": job["job_name"], "job_id": job_id}
+        for template, str_ in [(setting_dict["{}_stdout_template".format(job["flavour"])], stdout_str),
+                               (setting_dict["{}_stderr_template".format(job["flavour"])], stderr_str)]:
+            with open(os.path.join(job["cwd"], template.format(**name_dict)), "w") as f:
+                f.write(str_)
+
+    @classmethod
+    def parse_job_name(cls, script_path):
+        """
+        Parse the job name from '#PBS -N name', '#SBATCH -J name' or '#SBATCH --job-name=name' in the job submission script.
+        Return the script filename if not found.
+        """
+        if os.path.isfile(script_path):
+            with open(script_path, "r") as f:
+                for line in f:
+                    m = re.match(r"\s*#(?:PBS\s+-N|SBATCH\s+-J|SBATCH\s+--job-name[=\s])\s*(\S+)", line)
+                    if m:
+                        return m.group(1)
+        return os.path.split(script_path)[1] if script_path else "STDIN"
+
+    def submit(self, conn, arg_list, cwd, setting_dict, random_, flavour):
+        script = [arg for arg in arg_list if not arg.startswith("-")]
+        script_path = os.path.join(cwd, script[-1]) if script else ""
+        submission_time = time.time()
+        run_time = max([0., setting_dict["run_time"] + random_.uniform(-1, 1) * setting_dict["run_time_jitter"]])
+        cursor = conn.execute("INSERT INTO job (cwd, job_name, flavour, submission_time, end_time) VALUES (?, ?, ?, ?, ?)",
+                              (cwd, self.parse_job_name(script_path), flavour, submission_time, submission_time + run_time))
+        self.increase_counter(conn, "no_of_submitted_jobs")
+        return str(cursor.lastrowid)
+
+    def add_jobs(self, cwd_list, job_name="htc_job", flavour="pbs"):
+        """
+        Put jobs into the queue directly, as if a job had been submitted under each folder in cwd_list, e.g. for a synthetic campaign in which
+        some calculations are already running. No latency or failure is simulated.
+        return a list of job IDs, one per folder in cwd_list.
+        """
+        setting_dict = self.read_setting()
+        job_id_list = []
+        with self.transaction() as conn:
+            for cwd in cwd_list:
+                submission_time = time.time()
+                cursor = conn.execute("INSERT INTO job (cwd, job_name, flavour, submission_time, end_time) VALUES (?, ?, ?, ?, ?)",
+                                      (cwd, job_name, flavour, submission_time, submission_time + setting_dict["run_time"]))
+                job_id_list.append(str(cursor.lastrowid))
+            self.increase_counter(conn, "no_of_submitted_jobs", len(cwd_list))
+        return job_id_list
+
+    def qsub(self, conn, arg_list, cwd, setting_dict, random_):
+        job_id = self.submit(conn=conn, arg_list=arg_list, cwd=cwd, setting_dict=setting_dict, random_=random_, flavour="pbs")
+        return (0, "{}.mock\n".format(job_id), "")
+
+    def sbatch(self, conn, arg_list, cwd, setting_dict, random_):
+        job_id = self.submit(conn=conn, arg_list=arg_list, cwd=cwd, setting_dict=setting_dict, random_=random_, flavour="slurm")
+        return (0, "Submitted batch job {}\n".format(job_id), "")
+
+    def get_elapsed_time_str(self, job):
+        elapsed_time = int(time.time() - job["submission_time"])
+        return "{:02d}:{:02d}:{:02d}".format(elapsed_time // 3600, elapsed_time % 3600 // 60, elapsed_time % 60)
+
+    def qstat(self, conn, arg_list, cwd, setting_dict, random_):
+        user = os.environ.get("USER", "mock")
+        line_list = ["{:<18}{:<17}{:<18}{:<9}{} {}".format("Job id", "Name", "User", "Time Use", "S", "Queue"),
+                     "{} {} {} {} {} {}".format("-" * 17, "-" * 16, "-" * 17, "-" * 8, "-", "-----")]
+        job_list = self.get_job_list(conn)
+        for job in job_list:
+            line_list.append("{:<18}{:<17}{:<18}{:<9}{} {}".format(job["job_id"] + ".mock", job["job_name"], user, self.get_elapsed_time_str(job), "R", "batch"))
+        return (0, "\n".join(line_list) + "\n" if job_list else "", "")
+
+    def squeue(self, conn, arg_list, cwd, setting_dict, random_):
+        user = os.environ.get("USER", "mock")
+        line_list = ["{:>8} {:>9} {:>8} {:>8} {:>2} {:>10} {:>6} {}".format("JOBID", "PARTITION", "NAME", "USER", "ST", "TIME", "NODES", "NODELIST(REASON)")]
+        for job in self.get_job_list(conn):
+            line_list.append("{:>8} {:>9} {:>8} {:>8} {:>2} {:>10} {:>6} {}".format(job["job_id"], "batch", job["job_name"], user, "R", self.get_elapsed_time_str(job), 1, "node001"))
+        return (0, "\n".join(line_list) + "\n", "")
+
+    def kill(self, conn, arg_list, setting_dict):
+        exit_status, stderr_str = 0, ""
+        for queue_id in [arg for arg in arg_list if not arg.startswith("-")]:
+            job_id = re.split(r"[._\[]", queue_id)[0]
+            job_list = self.get_job_list(conn, where_clause="WHERE job_id = ?", parameter_list=[int(job_id)]) if job_id.isdigit() else []
+            if job_list == []:
+                exit_status = 1
+                stderr_str += "Unknown Job Id {}\n".format(queue_id)
+            else:
+                conn.execute("DELETE FROM job WHERE job_id = ?", (int(job_id),))
+                self.write_queue_std_files(job=job_list[0], job_id=job_id, setting_dict=setting_dict, stderr_str="mock scheduler: job killed by the user\n")
+                self.increase_counter(conn, "no_of_killed_jobs")
+        return (exit_status, "", stderr_str)
+
+    def qdel(self, conn, arg_list, cwd, setting_dict, random_):
+        return self.kill(conn=conn, arg_list=arg_list, setting_dict=setting_dict)
+
+    def scancel(self, conn, arg_list, cwd, setting_dict, random_):
+        return self.kill(conn=conn, arg_list=arg_list, setting_dict=setting_dict)
+
+
+# In[4]:
+
+
+def get_cmd_args():
+    """Use argparse to get parameters from the command line"""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--state-dir", required=True, help="the directory of the setting file and the state database of the mock scheduler")
+    subparsers = parser.add_subparsers(dest="cmd")
+
+    install_parser = subparsers.add_parser("install", help="save the setting, reset the state and write the executables")
+    install_parser.add_argument("--bin-dir", required=True, help="where to write qsub, qstat, qdel, sbatch, squeue and scancel")
+    install_parser.add_argument("--latency", type=float, default=0., help="the response time of every call in seconds. Default: 0")
+    install_parser.add_argument("--failure-rate", type=float, default=0., help="the probability of a call failing with exit status 1. Default: 0")
+    install_parser.add_argument("--run-time", type=float, default=60., help="how long a job runs in seconds. Default: 60")
+    install_parser.add_argument("--run-time-jitter", type=float, default=0., help="the run time is uniformly distributed in run-time +/- run-time-jitter. Default: 0")
+    install_parser.add_argument("--job-error-rate", type=float, default=0., help="the probability of a job finishing with a truncated OUTCAR. Default: 0")
+    install_parser.add_argument("--stdout-template", default=None, help="the queue stdout filename, e.g. '{job_name}.o{job_id}' (PBS) or 'slurm-{job_id}.out' (SLURM)")
+    install_parser.add_argument("--stderr-template", default=None, help="the queue stderr filename, e.g. '{job_name}.e{job_id}' (PBS) or 'slurm-{job_id}.err' (SLURM)")
+    install_parser.add_argument("--vasp-out", default="vasp.out", help="the filename of the canned VASP screen output. Default: vasp.out")
+    install_parser.add_argument("--seed", type=int, default=None, help="the seed of the random number generator. Default: None")
+
+    subparsers.add_parser("stats", help="print the counters")
+    for cmd in Mock_scheduler.command_flavour_dict.keys():
+        cmd_parser = subparsers.add_parser(cmd, help="the mock {}".format(cmd))
+        cmd_parser.add_argument("arg_list", nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+# In[5]:
+
+
+if __name__ == "__main__":
+    args = get_cmd_args()
+    mock_scheduler = Mock_scheduler(state_dir=args.state_dir)
+    if args.cmd == "install":
+        setting = {"latency": args.latency, "failure_rate": args.failure_rate, "run_time": args.run_time, "run_time_jitter": args.run_time_jitter,
+                   "job_error_rate": args.job_error_rate, "vasp_out": args.vasp_out, "seed": args.seed}
+        for flavour in ["pbs", "slurm"]:
+            if args.stdout_template != None:
+                setting["{}_stdout_template".format(flavour)] = args.stdout_template
+            if args.stderr_template != None:
+                setting["{}_stderr_template".format(flavour)] = args.stderr_template
+        mock_scheduler.install(bin_dir=args.bin_dir, **setting)
+    elif args.cmd == "stats":
+        print(json.dumps(mock_scheduler.read_counters(), indent=4))
+    elif args.cmd in Mock_scheduler.command_flavour_dict.keys():
+        exit_status, stdout_str, stderr_str = mock_scheduler.run(cmd=args.cmd, arg_list=args.arg_list)
+        sys.stdout.write(stdout_str)
+        sys.stderr.write(stderr_str)
+        sys.exit(exit_status)
+    else:
+        print("Run 'python {} -h' to see how to use it.".format(os.path.split(__file__)[1]))
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[1]:
+
+
+import os, sys, time, json, platform, resource, builtins, tempfile
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_dict_operation
+from HTC_lib.VASP.Preprocess_and_Postprocess.Parse_calculation_workflow import parse_calculation_workflow
+from HTC_lib.VASP.Preprocess_and_Postprocess.new_Preprocess_and_Postprocess import pre_and_post_process
+from HTC_lib.VASP.Job_Management.Check_and_update_calculation_status import check_calculations_status, update_job_status
+from HTC_lib.VASP.Job_Management.Submit_and_Kill_job import submit_jobs
+
+from benchmarks.campaign_generator import Campaign_generator
+from benchmarks.mock_scheduler import Mock_scheduler
+
+
+# In[2]:
+
+
+__doc__ = """
+
+* What it does
+
+  * Fabricate a synthetic campaign (see campaign_generator.py) and time the phases of the scheduler loop of the htc main scripts on it:
+        generate_campaign, check_calculations_status, update_job_status:<branch> (running, error, killed, sub_dir_cal and done),
+        pre_and_post_process, submit_jobs and write_cal_status
+    All phases run serially in this process. The job scheduler is expected to be the mock one (see mock_scheduler.py).
+
+  * For every phase, the result (in JSON) contains
+        - wall_time: in seconds
+        - syscalls: the numbers of read-like and write-like system calls (syscr & syscw of /proc/self/io), if available
+        - fs_calls: the numbers of python-level file system calls (open, os.listdir, os.scandir, os.stat, os.path.isfile, os.path.isdir,
+                    os.path.exists, os.rename, os.remove), counted by wrapping these functions during the phase.
+                    Note that os.path.isfile, os.path.isdir and os.path.exists call os.stat, so they are also counted as os.stat.
+        - peak_rss_kb: the peak resident set size in kB during the phase. On Linux, the peak is reset before every phase via /proc/self/clear_refs;
+                    otherwise, it is the peak of the whole process so far (resource.getrusage).
+
+* How to use
+
+  * Prepare a work directory containing HTC_calculation_setup_file or HTC_calculation_setup_folder, in which the job-scheduler-related tags of the
+    first firework are those given by Mock_scheduler.get_htc_tag_dict, and cal_folder/structure_folder point into the work directory.
+
+  * Run, e.g. 100000 materials:
+        python run_benchmarks.py --work-dir /tmp/htc_bench --no-of-materials 100000 --output result_100k.json
+    and compare it with a baseline:
+        python run_benchmarks.py --work-dir /tmp/htc_bench --no-of-materials 100000 --output new_100k.json --baseline result_100k.json
+
+  * The work directory is modified: the material folders and structure files are (re)generated and the mock scheduler is (re)installed under it.
+"""
+
+
+# In[3]:
+
+
+class Phase_recorder():
+    """
+    Measure the wall time, system calls, python-level file system calls and peak RSS of a phase. Use it as a context manager:
+        with phase_recorder.record("check_calculations_status"):
+            check_calculations_status(...)
+    The results are accumulated in phase_recorder.result_dict: phase name --> measurements.
+    """
+    fs_call_list = [(builtins, "open"), (os, "listdir"), (os, "scandir"), (os, "stat"), (os.path, "isfile"), (os.path, "isdir"),
+                    (os.path, "exists"), (os, "rename"), (os, "remove")]
+
+    def __init__(self):
+        self.result_dict = {}
+
+    @classmethod
+    def read_proc_io(cls):
+        try:
+            with open("/proc/self/io", "r") as f:
+                io_dict = {line.split(":")[0]: int(line.split(":")[1]) for line in f if ":" in line}
+            return {"read": io_dict["syscr"], "write": io_dict["syscw"]}
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    @classmethod
+    def reset_peak_rss(cls):
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            return True
+        except (IOError, OSError):
+            return False
+
+    @classmethod
+    def read_peak_rss(cls):
+        try:
+            with open("/proc/self/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1])
+        except (IOError, OSError):
+            pass
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss // 1024 if sys.platform == "darwin" else peak_rss #bytes on macOS, kB on Linux
+
+    def record(self, phase):
+        return _Phase(phase_recorder=self, phase=phase)
+
+    def wrap_fs_calls(self, fs_call_count_dict):
+        original_func_list = []
+        for module, func_name in self.fs_call_list:
+            original_func = getattr(module, func_name)
+            original_func_list.append((module, func_name, original_func))
+            call_name = "open" if module is builtins else ("os.path." if module is os.path else "os.") + func_name
+            fs_call_count_dict[call_name] = 0
+            def counted_func(*args, _original_func=original_func, _call_name=call_name, **kwargs):
+                fs_call_count_dict[_call_name] += 1
+                return _original_func(*args, **kwargs)
+            setattr(module, func_name, counted_func)
+        return original_func_list
+
+    @classmethod
+    def unwrap_fs_calls(cls, original_func_list):
+        for module, func_name, original_func in original_func_list:
+            setattr(module, func_name, original_func)
+
+
+class _Phase():
+    def __init__(self, phase_recorder, phase):
+        self.phase_recorder, self.phase = phase_recorder, phase
+
+    def __enter__(self):
+        self.is_peak_rss_reset = Phase_recorder.reset_peak_rss()
+        self.io_0 = Phase_recorder.read_proc_io()
+        self.fs_call_count_dict = {}
+        self.original_func_list = self.phase_recorder.wrap_fs_calls(self.fs_call_count_dict)
+        self.t0 = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.time() - self.t0
+        Phase_recorder.unwrap_fs_calls(self.original_func_list)
+        io_1 = Phase_recorder.read_proc_io()
+        result = {"wall_time": wall_time, "fs_calls": self.fs_call_count_dict, "peak_rss_kb": Phase_recorder.read_peak_rss(),
+                  "is_peak_rss_per_phase": self.is_peak_rss_reset}
+        result["syscalls"] = None if self.io_0 == None or io_1 == None else {key: io_1[key] - self.io_0[key] for key in io_1.keys()}
+        if exc_type != None:
+            result["error"] = "{}: {}".format(exc_type.__name__, exc_value)
+        self.phase_recorder.result_dict[self.phase] = result
+        print("{}: {:.3f} s".format(self.phase, wall_time), flush=True)
+        return False
+
+
+# In[4]:
+
+
+def read_workflow(work_dir):
+    workflow = None
+    if os.path.isfile(os.path.join(work_dir, "HTC_calculation_setup_file")):
+        workflow = parse_calculation_workflow(os.path.join(work_dir, "HTC_calculation_setup_file"), HTC_lib_loc=ROOT)
+    elif os.path.isdir(os.path.join(work_dir, "HTC_calculation_setup_folder")):
+        workflow = parse_calculation_workflow(os.path.join(work_dir, "HTC_calculation_setup_folder"), HTC_lib_loc=ROOT)
+    assert workflow != None, "Error: No HTC_calculation_setup_file or HTC_calculation_setup_folder under {}".format(work_dir)
+    return workflow
+
+
+def run_benchmarks(work_dir, no_of_materials, structure_template_file=None, no_of_structures=1000, seed=0, mock_scheduler_setting=None):
+    """
+    Generate a synthetic campaign of no_of_materials materials under work_dir and time every phase of the scheduler loop on it.
+    input arguments:
+        - work_dir (str): the work directory. See __doc__
+        - no_of_materials (int)
+        - structure_template_file (str or None): a structure file copied once per material into the structure folder, on which pre_and_post_process is timed.
+                If None, pre_and_post_process is skipped.
+        - no_of_structures (int): pre_and_post_process is timed on the first no_of_structures structures. Default: 1000
+        - seed (int): the seed of the campaign generator. Default: 0
+        - mock_scheduler_setting (dict or None): the setting of the mock scheduler. See Mock_scheduler.default_setting_dict
+    return a dict having keys meta and phases.
+    """
+    work_dir = os.path.abspath(work_dir)
+    current_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        workflow = read_workflow(work_dir)
+        cal_folder, structure_folder = workflow[0]["cal_folder"], workflow[0]["structure_folder"]
+        mock_scheduler = Mock_scheduler(state_dir=os.path.join(work_dir, "mock_scheduler_state"))
+        mock_scheduler.install(bin_dir=os.path.join(work_dir, "mock_scheduler_bin"), **({} if mock_scheduler_setting == None else mock_scheduler_setting))
+        os.environ["PATH"] = os.path.join(work_dir, "mock_scheduler_bin") + os.pathsep + os.environ["PATH"]
+
+        phase_recorder = Phase_recorder()
+        with phase_recorder.record("generate_campaign"):
+            cal_loc_dict = Campaign_generator(workflow=workflow, cal_folder=cal_folder, seed=seed, mock_scheduler=mock_scheduler).generate(
+                no_of_materials=no_of_materials, structure_folder=structure_folder if structure_template_file != None else None,
+                structure_template_file=structure_template_file)
+
+        with phase_recorder.record("check_calculations_status"):
+            cal_status = check_calculations_status(cal_folder=cal_folder, workflow=workflow)
+
+        for which_status in ["running_folder_list", "error_folder_list", "killed_folder_list", "sub_dir_cal_folder_list", "done_folder_list"]:
+            with phase_recorder.record("update_job_status:{}".format(which_status)):
+                cal_status_diff = update_job_status(cal_folder=cal_folder, workflow=workflow, which_status=which_status, job_list=cal_status[which_status])
+            cal_status = Cal_status_dict_operation.update_old_cal_status_dict(old_cal_status_dict=cal_status, cal_status_dict_diff=cal_status_diff)
+
+        if structure_template_file != None:
+            structure_file_list = sorted(os.listdir(structure_folder))[:no_of_structures]
+            with phase_recorder.record("pre_and_post_process"):
+                for structure_file in structure_file_list:
+                    pre_and_post_process(structure_file, structure_folder, cal_folder=cal_folder, workflow=workflow)
+
+        with phase_recorder.record("submit_jobs"):
+            submit_jobs(cal_jobs_status=cal_status, workflow=workflow, max_jobs_in_queue=workflow[0]["max_running_job"])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with phase_recorder.record("write_cal_status"):
+                Cal_status_dict_operation.write_cal_status(cal_status=cal_status, filename=os.path.join(tmp_dir, "htc_job_status.json"))
+    finally:
+        os.chdir(current_dir)
+
+    meta = {"time": time.strftime("%Y-%m-%d-%H:%M:%S"), "no_of_materials": no_of_materials,
+            "no_of_jobs": sum([len(cal_loc_list) for cal_loc_list in cal_loc_dict.values()]),
+            "no_of_jobs_per_state": {state: len(cal_loc_list) for state, cal_loc_list in cal_loc_dict.items()},
+            "seed": seed, "python": platform.python_version(), "platform": platform.platform(), "mock_scheduler": mock_scheduler.read_counters()}
+    return {"meta": meta, "phases": phase_recorder.result_dict}
+
+
+def compare_with_baseline(result, baseline, tolerance=0.2):
+    """
+    Compare the wall time and peak RSS of every phase with those in baseline (the return of run_benchmarks).
+    return a dict: phase --> {"wall_time_ratio": new/old, "peak_rss_ratio": new/old, "is_regression": True if either ratio > 1 + tolerance}
+    """
+    comparison = {}
+    for phase, measurement in result["phases"].items():
+        if phase not in baseline["phases"].keys():
+            continue
+        old_measurement = baseline["phases"][phase]
+        wall_time_ratio = measurement["wall_time"] / old_measurement["wall_time"] if old_measurement["wall_time"] > 0 else None
+        peak_rss_ratio = measurement["peak_rss_kb"] / old_measurement["peak_rss_kb"] if old_measurement["peak_rss_kb"] else None
+        comparison[phase] = {"wall_time_ratio": wall_time_ratio, "peak_rss_ratio": peak_rss_ratio,
+                             "is_regression": any([ratio != None and ratio > 1 + tolerance for ratio in [wall_time_ratio, peak_rss_ratio]])}
+    return comparison
+
+
+# In[5]:
+
+
+def get_cmd_args():
+    """Use argparse to get parameters from the command line"""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--work-dir", required=True, help="the work directory containing HTC_calculation_setup_file or HTC_calculation_setup_folder")
+    parser.add_argument("--no-of-materials", type=int, required=True, help="the number of synthetic materials, e.g. 10000, 100000 or 1000000")
+    parser.add_argument("--structure-template-file", default=None, help="a structure file copied once per material, on which pre_and_post_process is timed")
+    parser.add_argument("--no-of-structures", type=int, default=1000, help="the number of structures on which pre_and_post_process is timed. Default: 1000")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the campaign generator. Default: 0")
+    parser.add_argument("--latency", type=float, default=0., help="the response time of the mock scheduler in seconds. Default: 0")
+    parser.add_argument("--failure-rate", type=float, default=0., help="the failure rate of the mock scheduler. Default: 0")
+    parser.add_argument("--output", default="benchmark_result.json", help="where to write the result. Default: benchmark_result.json")
+    parser.add_argument("--baseline", default=None, help="a previous result to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="a phase is a regression if it is slower or larger than the baseline by this fraction. Default: 0.2")
+    return parser.parse_args()
+
+
+# In[6]:
+
+
+if __name__ == "__main__":
+    args = get_cmd_args()
+    result = run_benchmarks(work_dir=args.work_dir, no_of_materials=args.no_of_materials, structure_template_file=args.structure_template_file,
+                            no_of_structures=args.no_of_structures, seed=args.seed, mock_scheduler_setting={"latency": args.latency, "failure_rate": args.failure_rate})
+    if args.baseline != None:
+        with open(args.baseline, "r") as f:
+            result["comparison"] = compare_with_baseline(result=result, baseline=json.load(f), tolerance=args.tolerance)
+        for phase, comparison in result["comparison"].items():
+            print("{}: wall time x{}, peak RSS x{}{}".format(phase, comparison["wall_time_ratio"], comparison["peak_rss_ratio"],
+                                                             " <-- REGRESSION" if comparison["is_regression"] else ""))
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=4)
+    if args.baseline != None and any([comparison["is_regression"] for comparison in result["comparison"].values()]):
+        sys.exit(1)
@@ -0,0 +1,2 @@
+#test_parse.py is a Python 2 script run by hand (python test_parse.py), not a pytest module.
+collect_ignore = ["test_parse.py"]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from HTC_lib.VASP.Miscellaneous.Cal_status_dictionary_operation import Cal_status_journal, Cal_status_store
+
+
+def get_cal_status(running_list, done_list):
+    return Cal_status_store({"ready_folder_list": [], "running_folder_list": running_list, "done_folder_list": done_list})
+
+
+def test_recover_replays_the_journal(tmp_path):
+    filename = str(tmp_path / "htc_job_status.json")
+    journal = Cal_status_journal(filename=filename, compaction_interval=10)
+    journal.write(get_cal_status(["/cal/a", "/cal/b"], []))
+    journal.write(get_cal_status(["/cal/b"], ["/cal/a"]))
+    journal.write(get_cal_status([], ["/cal/a", "/cal/b"]))
+    assert os.path.isfile(Cal_status_journal.get_journal_filename(filename))
+    
+    cal_status = Cal_status_journal.recover(filename)
+    assert cal_status["running_folder_list"] == []
+    assert sorted(cal_status["done_folder_list"]) == ["/cal/a", "/cal/b"]
+
+
+def test_recover_ignores_a_truncated_last_line(tmp_path):
+    filename = str(tmp_path / "htc_job_status.json")
+    journal = Cal_status_journal(filename=filename, compaction_interval=10)
+    journal.write(get_cal_status(["/cal/a", "/cal/b"], []))
+    journal.write(get_cal_status(["/cal/b"], ["/cal/a"]))
+    journal_filename = Cal_status_journal.get_journal_filename(filename)
+    #The htc main script is killed while appending the next record.
+    with open(journal_filename, "a") as f:
+        f.write('{"time": "2026-10-18-10:00:00", "updated": {"/cal/b": "done_fol')
+    
+    cal_status = Cal_status_journal.recover(filename)
+    assert cal_status["running_folder_list"] == ["/cal/b"]
+    assert cal_status["done_folder_list"] == ["/cal/a"]
+
+
+def test_recover_without_a_snapshot(tmp_path):
+    assert Cal_status_journal.recover(str(tmp_path / "htc_job_status.json")) == None
+
+
+def test_compaction_removes_the_journal(tmp_path):
+    filename = str(tmp_path / "htc_job_status.json")
+    journal = Cal_status_journal(filename=filename, compaction_interval=2)
+    journal.write(get_cal_status(["/cal/a", "/cal/b"], []))
+    journal.write(get_cal_status(["/cal/b"], ["/cal/a"]))
+    assert os.path.isfile(Cal_status_journal.get_journal_filename(filename))
+    journal.write(get_cal_status([], ["/cal/a", "/cal/b"]))
+    assert not os.path.isfile(Cal_status_journal.get_journal_filename(filename))
+    assert sorted(Cal_status_journal.recover(filename)["done_folder_list"]) == ["/cal/a", "/cal/b"]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from HTC_lib.VASP.Job_Management.Queue_snapshot import Queue_snapshot
+
+
+QSTAT_OUTPUT = """Job id                    Name             User              Time Use S Queue
+------------------------- ---------------- ----------------- -------- - -----
+1234.pbs01                 vasp_run         tyang             01:02:03 R batch
+12345.pbs01                vasp_run         tyang             00:00:00 Q batch
+2000[1].pbs01              array            tyang             00:01:00 R batch
+"""
+
+SQUEUE_OUTPUT = """             JOBID PARTITION     NAME     USER ST       TIME  NODES NODELIST(REASON)
+              1234     batch vasp_run    tyang  R    1:02:03      1 node001
+             12345     batch vasp_run    tyang PD       0:00      1 (Priority)
+            3000_7     batch    array    tyang  R       1:00      1 node002
+"""
+
+BJOBS_OUTPUT = """JOBID   USER    STAT  QUEUE      FROM_HOST   EXEC_HOST   JOB_NAME   SUBMIT_TIME
+1234    tyang   RUN   normal     login01     node001     vasp_run   Oct 18 10:00
+12345   tyang   PEND  normal     login01                 vasp_run   Oct 18 10:05
+4000[2] tyang   RUN   normal     login01     node002     array      Oct 18 10:10
+"""
+
+
+def test_pbs_parser():
+    snapshot = Queue_snapshot(job_query_cmd="qstat -u tyang", output_str=QSTAT_OUTPUT)
+    assert snapshot.scheduler == "pbs"
+    assert snapshot.get_state("1234.pbs01") == "R"
+    assert snapshot.get_state("1234") == "R"
+    assert snapshot.get_state("12345") == "Q"
+    assert snapshot.is_in_queue("2000")
+    assert not snapshot.is_in_queue("Job")
+
+
+def test_slurm_parser():
+    snapshot = Queue_snapshot(job_query_cmd="squeue -u tyang", output_str=SQUEUE_OUTPUT)
+    assert snapshot.scheduler == "slurm"
+    assert snapshot.get_state("1234") == "R"
+    assert snapshot.get_state("12345") == "PD"
+    assert snapshot.get_state("3000_7") == "R"
+    assert snapshot.is_in_queue("3000")
+    assert not snapshot.is_in_queue("JOBID")
+
+
+def test_slurm_parser_with_a_custom_output_format():
+    snapshot = Queue_snapshot(job_query_cmd="squeue -h -o '%i %t'", output_str="1234 R\n12345 PD\n")
+    assert snapshot.get_state("1234") == "R"
+    assert snapshot.get_state("12345") == "PD"
+
+
+def test_lsf_parser():
+    snapshot = Queue_snapshot(job_query_cmd="bjobs -w", output_str=BJOBS_OUTPUT)
+    assert snapshot.scheduler == "lsf"
+    assert snapshot.get_state("1234") == "RUN"
+    assert snapshot.get_state("12345") == "PEND"
+    assert snapshot.is_in_queue("4000[2]")
+    assert snapshot.is_in_queue("4000")
+
+
+def test_generic_parser():
+    snapshot = Queue_snapshot(job_query_cmd="/opt/bin/my_query --all", output_str="job 1234 running\njob 12345 waiting\n")
+    assert snapshot.scheduler == "generic"
+    assert snapshot.is_in_queue("1234")
+    assert snapshot.get_state("1234") == None
+    assert snapshot.count_lines_containing("1234") == 2
+
+
+def test_no_prefix_false_positive():
+    #Job 123 is not in the queue although 1234 and 12345 start with it, and 1234 is not in the queue although it is a prefix of 12345.
+    for job_query_cmd, output_str in [("qstat", QSTAT_OUTPUT), ("squeue", SQUEUE_OUTPUT), ("bjobs -w", BJOBS_OUTPUT)]:
+        snapshot = Queue_snapshot(job_query_cmd=job_query_cmd, output_str=output_str)
+        assert not snapshot.is_in_queue("123"), job_query_cmd
+        assert not snapshot.is_in_queue("1"), job_query_cmd
+    snapshot = Queue_snapshot(job_query_cmd="qstat", output_str="12345.pbs01  vasp_run  tyang  00:00:00 Q batch\n")
+    assert not snapshot.is_in_queue("1234")
+    assert not snapshot.is_in_queue("1234.pbs01")
+
+
+def test_cached_snapshot_is_reused_within_ttl():
+    workflow = [{"job_query_command": "qstat -u nobody_in_this_test", "queue_snapshot_ttl": 60}]
+    Queue_snapshot.invalidate()
+    snapshot = Queue_snapshot(job_query_cmd=workflow[0]["job_query_command"], output_str=QSTAT_OUTPUT)
+    Queue_snapshot._snapshot_dict[workflow[0]["job_query_command"]] = snapshot
+    try:
+        assert Queue_snapshot.get(workflow=workflow) is snapshot
+    finally:
+        Queue_snapshot.invalidate(workflow=workflow)
+    assert workflow[0]["job_query_command"] not in Queue_snapshot._snapshot_dict
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from HTC_lib.VASP.Miscellaneous.Retry_policy import Retry_policy
+
+
+@pytest.fixture
+def sleep_list(monkeypatch):
+    """Record the backoff sleeps instead of sleeping."""
+    sleep_list = []
+    monkeypatch.setattr(time, "sleep", sleep_list.append)
+    Retry_policy.reset()
+    yield sleep_list
+    Retry_policy.reset()
+
+
+def make_func(outcome_list):
+    """Return a function which raises or returns the entries of outcome_list one per call."""
+    outcome_list = list(outcome_list)
+    def func():
+        outcome = outcome_list.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return func
+
+
+def test_backoff_delay_is_capped_full_jitter():
+    policy = Retry_policy(command_class="job_query", base_delay=1., max_delay=8.)
+    for retry_no in range(1, 10):
+        upper_limit = min(8., 2. ** (retry_no - 1))
+        delay_list = [policy.get_delay(retry_no=retry_no) for i in range(200)]
+        assert all(0 <= delay <= upper_limit for delay in delay_list)
+    assert max(policy.get_delay(retry_no=10) for i in range(200)) > 4.
+
+
+def test_retry_until_success(sleep_list):
+    policy = Retry_policy(command_class="job_query", max_tries=5, base_delay=1., max_delay=60., time_budget=300.)
+    return_list, error_list = policy.execute(func=make_func([ValueError("busy"), 1, 0]), is_successful=lambda status: status == 0)
+    assert return_list == [None, 1, 0]
+    assert isinstance(error_list[0], ValueError) and error_list[1:] == [None, None]
+    assert len(sleep_list) == 2
+    assert sleep_list[0] <= 1. and sleep_list[1] <= 2.
+    counter_dict = policy.get_counter_dict()
+    assert counter_dict["no_of_tries"] == 3 and counter_dict["no_of_retries"] == 2 and counter_dict["no_of_successful_calls"] == 1
+
+
+def test_give_up_after_max_tries(sleep_list):
+    policy = Retry_policy(command_class="job_query", max_tries=3, failure_threshold=0)
+    return_list, error_list = policy.execute(func=lambda: 1, is_successful=lambda status: status == 0)
+    assert return_list == [1, 1, 1]
+    assert len(sleep_list) == 2
+    assert policy.get_counter_dict()["no_of_failed_calls"] == 1
+    assert not policy.is_circuit_open()
+
+
+def test_give_up_once_the_time_budget_is_used_up(sleep_list):
+    policy = Retry_policy(command_class="job_query", max_tries=100, base_delay=10., max_delay=10., time_budget=0.)
+    return_list, error_list = policy.execute(func=lambda: 1, is_successful=lambda status: status == 0)
+    assert return_list == [1]
+    assert sleep_list == []
+
+
+def test_circuit_breaker_transitions(sleep_list):
+    policy = Retry_policy(command_class="job_query", max_tries=2, failure_threshold=2, cooldown=100.)
+    fail = lambda: policy.execute(func=lambda: 1, is_successful=lambda status: status == 0)
+    
+    #closed: a success in between resets the number of failures in a row
+    fail()
+    policy.execute(func=lambda: 0, is_successful=lambda status: status == 0)
+    fail()
+    assert not policy.is_circuit_open()
+    
+    #closed --> open after failure_threshold calls in a row give up
+    fail()
+    assert policy.is_circuit_open()
+    assert policy.get_counter_dict()["no_of_circuit_openings"] == 1
+    
+    #open: a call is rejected without calling func
+    called_list = []
+    return_list, error_list = policy.execute(func=lambda: called_list.append(1))
+    assert called_list == [] and return_list == [None] and "circuit breaker" in str(error_list[0])
+    assert policy.get_counter_dict()["no_of_rejected_calls"] == 1
+    
+    #open --> closed after the cooldown
+    policy.circuit_open_until = time.time() - 1
+    assert not policy.is_circuit_open()
+    return_list, error_list = policy.execute(func=lambda: 0, is_successful=lambda status: status == 0)
+    assert return_list == [0]
+    fail()
+    assert not policy.is_circuit_open()
+
+
+def test_uncounted_and_non_transient_failures_do_not_open_the_circuit(sleep_list):
+    policy = Retry_policy(command_class="job_submission", max_tries=5, failure_threshold=1, cooldown=100.)
+    return_list, error_list = policy.execute(func=lambda: 1, is_successful=lambda status: status == 0, max_tries=1, count_failure=False)
+    assert return_list == [1] and not policy.is_circuit_open()
+    
+    return_list, error_list = policy.execute(func=lambda: 1, is_successful=lambda status: status == 0, is_transient=lambda return_, err: False)
+    assert return_list == [1] and sleep_list == []
+    assert not policy.is_circuit_open()
+    assert policy.get_counter_dict()["no_of_non_transient_failures"] == 1
+    
+    policy.execute(func=lambda: 1, is_successful=lambda status: status == 0, is_transient=lambda return_, err: True)
+    assert len(sleep_list) == 4
+    assert policy.is_circuit_open()
+
+
+def test_transient_error_message():
+    assert Retry_policy.is_transient_error_message("qsub: cannot connect to server pbs01 (errno=111) Connection refused")
+    assert Retry_policy.is_transient_error_message("sbatch: error: Socket timed out on send/recv operation")
+    assert Retry_policy.is_transient_error_message("LSF is down. Please wait ...")
+    assert Retry_policy.is_transient_error_message("")
+    assert not Retry_policy.is_transient_error_message("sbatch: error: Batch job submission failed: Invalid account or account/partition combination specified")
+    assert not Retry_policy.is_transient_error_message("qsub: script is written in DOS/Windows text format")
+
+
+def test_policy_is_shared_and_configured_by_htc_tags(sleep_list):
+    workflow = [{"retry_max_tries": 4, "retry_base_delay": None, "retry_max_delay": None, "retry_time_budget": None, 
+                 "circuit_breaker_threshold": 0, "circuit_breaker_cooldown": None}]
+    policy = Retry_policy.get(command_class="job_killing", workflow=workflow)
+    assert Retry_policy.get(command_class="job_killing") is policy
+    assert Retry_policy.get(command_class="job_submission") is not policy
+    assert policy.max_tries == 4 and policy.failure_threshold == 0 and policy.base_delay == 1.
+    with pytest.raises(AssertionError):
+        Retry_policy.get(command_class="job_control")
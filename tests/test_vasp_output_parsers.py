@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from HTC_lib.VASP.Miscellaneous.Query_from_OSZICAR import parse_oszicar_lines, find_ionic_steps_from_OSZICAR, find_last_ionic_step_from_OSZICAR
+from HTC_lib.VASP.Miscellaneous.Query_from_vasprun import read_vasprun, find_CBM_VBM
+
+
+OSZICAR_ISPIN_1 = """       N       E                     dE             d eps       ncg     rms          rms(c)
+DAV:   1    -0.240000000000E+02   -0.24000E+02   -0.31000E+03   160   0.123E+02
+DAV:   2    -0.250000000000E+02   -0.10000E+01   -0.20000E+01   160   0.456E+01    0.789E+00
+RMM:   3    -0.251000000000E+02   -0.10000E-01   -0.30000E-02   160   0.123E+00    0.456E-01
+   1 F= -.25100000E+02 E0= -.25090000E+02  d E =-.251000E+02
+DAV:   1    -0.252000000000E+02   -0.10000E+00   -0.40000E+00   160   0.123E+01
+   2 F= -.25200000E+02 E0= -.25190000E+02  d E =-.100000E+00
+"""
+
+OSZICAR_ISPIN_2 = """       N       E                     dE             d eps       ncg     rms          rms(c)
+DAV:   1    -0.240000000000E+02   -0.24000E+02   -0.31000E+03   160   0.123E+02
+   1 F= -.24000000E+02 E0= -.23990000E+02  d E =-.240000E+02  mag=     2.0001
+"""
+
+OSZICAR_NON_COLLINEAR = """       N       E                     dE             d eps       ncg     rms          rms(c)
+DAV:   1    -0.240000000000E+02   -0.24000E+02   -0.31000E+03   160   0.123E+02
+DAV:   2    -0.241000000000E+02   -0.10000E+00   -0.20000E+00   160   0.456E+01    0.789E+00
+   1 F= -.24100000E+02 E0= -.24090000E+02  d E =-.241000E+02  mag=     0.0012    -0.0034     1.9987
+"""
+
+OSZICAR_INCOMPLETE = OSZICAR_ISPIN_1 + """DAV:   1    -0.253000000000E+02   -0.10000E+00   -0.40000E+00   160   0.123E+01
+DAV:   2    -0.253100000000E+02   -0.10000E-01   -0.40000E-01   160   0.123E+00
+"""
+
+
+def test_oszicar_ispin_1_has_no_mag():
+    ionic_step_list = list(parse_oszicar_lines(OSZICAR_ISPIN_1.splitlines(True)))
+    assert len(ionic_step_list) == 2
+    assert ionic_step_list[0] == {"no_of_electronic_steps": 3, "dE": -0.01, "deps": -0.003, "F": -25.1, "E0": -25.09, "mag": None}
+    assert ionic_step_list[1]["no_of_electronic_steps"] == 1
+    assert ionic_step_list[1]["mag"] == None
+
+
+def test_oszicar_collinear_mag():
+    ionic_step, = parse_oszicar_lines(OSZICAR_ISPIN_2.splitlines(True))
+    assert ionic_step["mag"] == pytest.approx(2.0001)
+    assert ionic_step["F"] == pytest.approx(-24.)
+
+
+def test_oszicar_non_collinear_mag():
+    ionic_step, = parse_oszicar_lines(OSZICAR_NON_COLLINEAR.splitlines(True))
+    assert ionic_step["mag"] == pytest.approx([0.0012, -0.0034, 1.9987])
+    assert ionic_step["no_of_electronic_steps"] == 2
+    assert ionic_step["dE"] == pytest.approx(-0.1)
+
+
+def test_oszicar_incomplete_trailing_ionic_step_is_not_yielded(tmp_path):
+    (tmp_path / "OSZICAR").write_text(OSZICAR_INCOMPLETE)
+    ionic_step_list = find_ionic_steps_from_OSZICAR(cal_loc=str(tmp_path))
+    assert [ionic_step["F"] for ionic_step in ionic_step_list] == pytest.approx([-25.1, -25.2])
+    assert find_last_ionic_step_from_OSZICAR(cal_loc=str(tmp_path))["E0"] == pytest.approx(-25.19)
+    #bytes lines, e.g. from a file opened in binary mode, are decoded.
+    assert len(list(parse_oszicar_lines(OSZICAR_INCOMPLETE.encode().splitlines(True)))) == 2
+
+
+def get_eigenvalue_set(spin_kpoint_rows_dict):
+    set_str = ""
+    for spin, kpoint_rows_list in spin_kpoint_rows_dict.items():
+        set_str += '     <set comment="spin {}">\n'.format(spin)
+        for kpoint, rows in enumerate(kpoint_rows_list, start=1):
+            set_str += '      <set comment="kpoint {}">\n'.format(kpoint)
+            set_str += "".join("       <r>{:12.4f}{:10.4f} </r>\n".format(*row) for row in rows)
+            set_str += "      </set>\n"
+        set_str += "     </set>\n"
+    return set_str
+
+
+def get_calculation(e_fr_energy, spin_kpoint_rows_dict, projected_spin_kpoint_rows_dict=None):
+    calculation = """ <calculation>
+  <scstep>
+   <energy>
+    <i name="e_fr_energy">   {0:.8f} </i>
+    <i name="e_wo_entrp">   {0:.8f} </i>
+    <i name="e_0_energy">   {0:.8f} </i>
+   </energy>
+  </scstep>
+  <energy>
+   <i name="e_fr_energy">   {0:.8f} </i>
+   <i name="e_wo_entrp">   {1:.8f} </i>
+   <i name="e_0_energy">   {2:.8f} </i>
+  </energy>
+""".format(e_fr_energy, e_fr_energy + 0.001, e_fr_energy + 0.002)
+    calculation += """  <eigenvalues>
+   <array>
+    <dimension dim="1">band</dimension>
+    <dimension dim="2">kpoint</dimension>
+    <dimension dim="3">spin</dimension>
+    <field>eigene</field>
+    <field>occ</field>
+    <set>
+""" + get_eigenvalue_set(spin_kpoint_rows_dict) + """    </set>
+   </array>
+  </eigenvalues>
+"""
+    if projected_spin_kpoint_rows_dict != None:
+        #The eigenvalues of the projected block (LORBIT) must be skipped.
+        calculation += """  <projected>
+   <eigenvalues>
+    <array>
+     <dimension dim="1">band</dimension>
+     <dimension dim="2">kpoint</dimension>
+     <dimension dim="3">spin</dimension>
+     <field>eigene</field>
+     <field>occ</field>
+     <set>
+""" + get_eigenvalue_set(projected_spin_kpoint_rows_dict) + """     </set>
+    </array>
+   </eigenvalues>
+   <array>
+    <dimension dim="1">ion</dimension>
+    <dimension dim="2">band</dimension>
+    <dimension dim="3">kpoint</dimension>
+    <dimension dim="4">spin</dimension>
+    <field>s</field>
+    <field>p</field>
+    <set>
+     <set comment="spin1">
+      <set comment="kpoint 1">
+       <set comment="band 1">
+        <r>    0.1000  0.2000 </r>
+       </set>
+      </set>
+     </set>
+    </set>
+   </array>
+  </projected>
+"""
+    calculation += """  <dos>
+   <i name="efermi">      5.00000000 </i>
+  </dos>
+ </calculation>
+"""
+    return calculation
+
+
+def test_read_vasprun_ispin_2_skips_the_projected_block(tmp_path):
+    first_step = {1: [[(1.0, 1.0), (7.0, 0.0)]], 2: [[(1.5, 1.0), (7.5, 0.0)]]}
+    last_step = {1: [[(-2.0, 1.0), (4.5, 1.0), (6.0, 0.0)], [(-1.5, 1.0), (4.0, 1.0), (5.8, 0.0)]], 
+                 2: [[(-1.9, 1.0), (4.2, 1.0), (5.5, 0.0)], [(-1.4, 1.0), (4.8, 0.9), (6.5, 0.0)]]}
+    projected = {1: [[(-99.0, 1.0), (4.99, 1.0), (5.01, 0.0)], [(-99.0, 1.0), (4.99, 1.0), (5.01, 0.0)]], 
+                 2: [[(-99.0, 1.0), (4.99, 1.0), (5.01, 0.0)], [(-99.0, 1.0), (4.99, 1.0), (5.01, 0.0)]]}
+    vasprun = '<?xml version="1.0" encoding="ISO-8859-1"?>\n<modeling>\n <parameters>\n  <i name="ISPIN">      2</i>\n </parameters>\n'
+    vasprun += get_calculation(-10.0, first_step) + get_calculation(-12.0, last_step, projected) + "</modeling>\n"
+    (tmp_path / "vasprun.xml").write_text(vasprun)
+    
+    result_dict = read_vasprun(cal_loc=str(tmp_path))
+    assert result_dict["efermi"] == pytest.approx(5.)
+    assert result_dict["energies"] == pytest.approx({"e_fr_energy": -12., "e_wo_entrp": -11.999, "e_0_energy": -11.998})
+    assert result_dict["eigenvalues"].shape == (2, 2, 3)
+    assert result_dict["occupations"].shape == (2, 2, 3)
+    assert result_dict["eigenvalues"][1, 1, 1] == pytest.approx(4.8)
+    assert result_dict["occupations"][1, 1, 1] == pytest.approx(0.9)
+    assert result_dict["eigenvalues"].min() == pytest.approx(-2.)
+    
+    VBM, CBM, VBM_occ, CBM_occ = find_CBM_VBM(result_dict["eigenvalues"], result_dict["occupations"], result_dict["efermi"])
+    assert [VBM, CBM, VBM_occ, CBM_occ] == pytest.approx([4.8, 5.5, 0.9, 0.])
+
+
+def test_read_vasprun_only_the_requested_sections(tmp_path):
+    vasprun = "<modeling>\n" + get_calculation(-10.0, {1: [[(1.0, 1.0), (7.0, 0.0)]]}) + "</modeling>\n"
+    (tmp_path / "vasprun.xml").write_text(vasprun)
+    result_dict = read_vasprun(cal_loc=str(tmp_path), section_list=["efermi"])
+    assert result_dict == {"efermi": 5., "energies": None, "eigenvalues": None, "occupations": None}
+    result_dict = read_vasprun(cal_loc=str(tmp_path), section_list=["eigenvalues"])
+    assert result_dict["eigenvalues"].shape == (1, 1, 2)